@@ -0,0 +1,194 @@
+"""
+RentAssured Authentication
+Token lookup, cached JWT verification and route decorators
+"""
+
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from flask import g, jsonify, redirect, request, url_for
+from flask_jwt_extended import decode_token
+from sqlalchemy.orm import joinedload
+
+from metrics import auth_failures
+from models_advanced import User
+
+
+class TokenCache:
+    """Bounded LRU of verified token digests mapped to (user_id, expires_at)
+
+    Only SHA-256 digests are kept, never the tokens themselves. Entries are
+    trusted until the token's own expiry or `ttl` seconds, whichever comes
+    first, so a verified token is not re-decoded on every request.
+    """
+
+    def __init__(self, max_size=4096, ttl=300):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, digest):
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is None:
+                return None
+            user_id, expires_at = entry
+            if expires_at <= now:
+                del self._entries[digest]
+                return None
+            self._entries.move_to_end(digest)
+            return user_id
+
+    def put(self, digest, user_id, token_expires_at):
+        expires_at = min(token_expires_at, time.time() + self.ttl)
+        with self._lock:
+            self._entries[digest] = (user_id, expires_at)
+            self._entries.move_to_end(digest)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+token_cache = TokenCache()
+
+
+def init_auth(app):
+    """Configure the token cache from app config"""
+    token_cache.max_size = app.config.get('AUTH_TOKEN_CACHE_SIZE', token_cache.max_size)
+    token_cache.ttl = app.config.get('AUTH_TOKEN_CACHE_TTL', token_cache.ttl)
+
+
+def get_request_token():
+    """Find the access token in the Authorization header, query string or cookie"""
+    auth_header = request.headers.get('Authorization', '')
+    if auth_header.startswith('Bearer '):
+        return auth_header.split(' ', 1)[1].strip() or None
+    return request.args.get('token') or request.cookies.get('access_token') or None
+
+
+def verify_token(token):
+    """Return the user id for a valid access token, or None"""
+    digest = hashlib.sha256(token.encode('utf-8')).hexdigest()
+    user_id = token_cache.get(digest)
+    if user_id is not None:
+        return user_id
+
+    try:
+        decoded_token = decode_token(token)
+        user_id = int(decoded_token['sub'])
+    except Exception as e:
+        print(f"Token validation error: {e}")
+        return None
+
+    token_cache.put(digest, user_id, decoded_token.get('exp', time.time() + token_cache.ttl))
+    return user_id
+
+
+def current_user_id():
+    """User id of the authenticated caller, verified at most once per request"""
+    if 'auth_user_id' not in g:
+        token = get_request_token()
+        g.auth_user_id = verify_token(token) if token else None
+    return g.auth_user_id
+
+
+def load_user_with_role(**filters):
+    """Load a user and their role in a single joined query"""
+    return User.query.options(joinedload(User.role)).filter_by(**filters).first()
+
+
+# Parsed permission sets, keyed by role id and invalidated when the role changes
+_role_permissions = {}
+_role_permissions_lock = threading.Lock()
+
+
+def parse_permissions(raw):
+    """Turn a Role.permissions JSON value into a frozenset of granted names"""
+    if isinstance(raw, str):
+        try:
+            raw = json.loads(raw)
+        except ValueError:
+            return frozenset()
+    if isinstance(raw, dict):
+        return frozenset(name for name, granted in raw.items() if granted)
+    if isinstance(raw, (list, tuple)):
+        return frozenset(str(name) for name in raw)
+    return frozenset()
+
+
+def role_permissions(role):
+    """Permission set for a role, parsed once per role version"""
+    if role is None:
+        return frozenset()
+    version = role.updated_at
+    with _role_permissions_lock:
+        cached = _role_permissions.get(role.id)
+        if cached and cached[0] == version:
+            return cached[1]
+    permissions = parse_permissions(role.permissions)
+    with _role_permissions_lock:
+        _role_permissions[role.id] = (version, permissions)
+    return permissions
+
+
+def current_user():
+    """Authenticated User with its role, loaded lazily and at most once per request"""
+    if 'auth_user' not in g:
+        user_id = current_user_id()
+        g.auth_user = load_user_with_role(id=user_id) if user_id else None
+    return g.auth_user
+
+
+def current_role_name():
+    """Role name of the authenticated user ('renter' when the user has no role)"""
+    user = current_user()
+    return user.role.role_name if user and user.role else 'renter'
+
+
+def current_permissions():
+    """Permission names granted to the authenticated user's role"""
+    user = current_user()
+    return role_permissions(user.role) if user else frozenset()
+
+
+def has_permission(name):
+    """Check a permission without touching the database after the user is loaded"""
+    return name in current_permissions()
+
+
+def auth_required(redirect_to=None):
+    """Reject unauthenticated requests with a 401, or redirect to `redirect_to`"""
+    def decorator(view):
+        @wraps(view)
+        def wrapped(*args, **kwargs):
+            if current_user_id() is None:
+                auth_failures.inc(reason='invalid_token' if get_request_token() else 'missing_token')
+                if redirect_to:
+                    return redirect(url_for(redirect_to))
+                return jsonify({'error': 'Authentication required'}), 401
+            return view(*args, **kwargs)
+        return wrapped
+    return decorator
+
+
+def permission_required(name):
+    """Allow only authenticated users whose role grants `name`"""
+    def decorator(view):
+        @wraps(view)
+        @auth_required()
+        def wrapped(*args, **kwargs):
+            if not has_permission(name):
+                auth_failures.inc(reason='forbidden')
+                return jsonify({'error': 'You do not have permission to access this resource'}), 403
+            return view(*args, **kwargs)
+        return wrapped
+    return decorator
@@ -0,0 +1,178 @@
+"""
+RentAssured Availability Engine
+Per-listing interval index of blocking bookings with atomic reservations
+"""
+
+import threading
+import time
+from bisect import bisect_right, insort
+from collections import OrderedDict
+
+from models_advanced import db, Booking, Listing
+
+# Booking statuses that occupy a listing's calendar
+BLOCKING_STATUSES = ('pending', 'confirmed')
+
+# Locks that serialise reservations in this process; listings share them by id
+AVAILABILITY_LOCK_STRIPES = 64
+
+
+class ListingIntervals:
+    """Sorted date ranges booked on a single listing
+
+    Ranges are inclusive on both ends, matching the overlap rule used by
+    book_listing. A running maximum of end dates keeps lookups correct even
+    when legacy data already contains overlapping bookings.
+    """
+
+    def __init__(self, rows=()):
+        self.entries = sorted((start, end, booking_id) for booking_id, start, end in rows)
+        self.booking_ids = {booking_id for _, _, booking_id in self.entries}
+        self.max_booking_id = max(self.booking_ids, default=0)
+        self.loaded_at = time.monotonic()
+        self._lock = threading.Lock()
+        self._reindex()
+
+    def _reindex(self):
+        starts = [start for start, _, _ in self.entries]
+        max_ends = []
+        running_max = None
+        for _, end, _ in self.entries:
+            running_max = end if running_max is None or end > running_max else running_max
+            max_ends.append(running_max)
+        # Swap both lists in one assignment so readers never see a half-built index
+        self._lookup = (starts, max_ends)
+
+    def overlaps(self, start_date, end_date):
+        """Return True if any stored range intersects [start_date, end_date]"""
+        starts, max_ends = self._lookup
+        i = bisect_right(starts, end_date) - 1
+        return i >= 0 and max_ends[i] >= start_date
+
+    def add(self, booking_id, start_date, end_date):
+        with self._lock:
+            if booking_id in self.booking_ids:
+                return
+            insort(self.entries, (start_date, end_date, booking_id))
+            self.booking_ids.add(booking_id)
+            self.max_booking_id = max(self.max_booking_id, booking_id)
+            self._reindex()
+
+    def remove(self, booking_id):
+        with self._lock:
+            if booking_id not in self.booking_ids:
+                return
+            self.entries = [entry for entry in self.entries if entry[2] != booking_id]
+            self.booking_ids.discard(booking_id)
+            self._reindex()
+
+
+class AvailabilityEngine:
+    """Caches ListingIntervals per listing and serialises reservations"""
+
+    def __init__(self, max_listings=1024, index_ttl=60, lock_stripes=AVAILABILITY_LOCK_STRIPES):
+        self.max_listings = max_listings
+        self.index_ttl = index_ttl
+        self._indexes = OrderedDict()
+        self._indexes_lock = threading.Lock()
+        self._listing_locks = [threading.Lock() for _ in range(lock_stripes)]
+
+    def init_app(self, app):
+        self.max_listings = app.config.get('AVAILABILITY_MAX_LISTINGS', self.max_listings)
+        self.index_ttl = app.config.get('AVAILABILITY_INDEX_TTL', self.index_ttl)
+        stripes = app.config.get('AVAILABILITY_LOCK_STRIPES', len(self._listing_locks))
+        if stripes != len(self._listing_locks):
+            self._listing_locks = [threading.Lock() for _ in range(stripes)]
+        app.extensions['availability'] = self
+
+    def _listing_lock(self, listing_id):
+        # A fixed array, so memory does not grow with the number of listings ever booked;
+        # listings that share a stripe only queue behind each other in this process
+        return self._listing_locks[listing_id % len(self._listing_locks)]
+
+    def _blocking_bookings(self, listing_id, after_id=0, locking=False):
+        query = db.session.query(Booking.id, Booking.start_date, Booking.end_date).filter(
+            Booking.listing_id == listing_id,
+            Booking.status.in_(BLOCKING_STATUSES),
+            Booking.id > after_id
+        )
+        if locking:
+            # Locking reads see the latest committed rows, not the transaction snapshot
+            query = query.with_for_update(read=True)
+        return query.all()
+
+    def _get_index(self, listing_id, locking=False):
+        """Return an up-to-date index, pulling in bookings created since the last load"""
+        with self._indexes_lock:
+            index = self._indexes.get(listing_id)
+            if index is not None:
+                self._indexes.move_to_end(listing_id)
+
+        if index is None or time.monotonic() - index.loaded_at > self.index_ttl:
+            index = ListingIntervals(self._blocking_bookings(listing_id, locking=locking))
+        else:
+            for booking_id, start_date, end_date in self._blocking_bookings(
+                    listing_id, after_id=index.max_booking_id, locking=locking):
+                index.add(booking_id, start_date, end_date)
+
+        self._store(listing_id, index)
+        return index
+
+    def is_range_free(self, listing_id, start_date, end_date):
+        """Check a single date range against the listing's bookings"""
+        return self.check_ranges(listing_id, [(start_date, end_date)])[0]
+
+    def check_ranges(self, listing_id, ranges):
+        """Check several (start_date, end_date) ranges with one index lookup"""
+        index = self._get_index(listing_id)
+        return [not index.overlaps(start_date, end_date) for start_date, end_date in ranges]
+
+    def reserve(self, listing_id, start_date, end_date, build_booking):
+        """Atomically insert a booking if the range is free
+
+        build_booking is called with no arguments and must return an unsaved
+        Booking. The listing row is locked for the duration of the check and
+        insert, so concurrent workers cannot double-book the same dates.
+        Returns the committed booking, or None if the range is taken.
+        """
+        with self._listing_lock(listing_id):
+            try:
+                Listing.query.filter_by(id=listing_id).with_for_update().first()
+                index = self._get_index(listing_id, locking=True)
+
+                if index.overlaps(start_date, end_date):
+                    # The index may still hold a booking another worker cancelled
+                    index = ListingIntervals(self._blocking_bookings(listing_id, locking=True))
+                    self._store(listing_id, index)
+                    if index.overlaps(start_date, end_date):
+                        db.session.rollback()
+                        return None
+
+                booking = build_booking()
+                db.session.add(booking)
+                db.session.flush()
+                booking_id = booking.id
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                raise
+
+            index.add(booking_id, start_date, end_date)
+            return booking
+
+    def release(self, booking):
+        """Drop a booking from its listing's index after it stops blocking dates"""
+        with self._indexes_lock:
+            index = self._indexes.get(booking.listing_id)
+        if index is not None:
+            index.remove(booking.id)
+
+    def _store(self, listing_id, index):
+        with self._indexes_lock:
+            self._indexes[listing_id] = index
+            self._indexes.move_to_end(listing_id)
+            while len(self._indexes) > self.max_listings:
+                self._indexes.popitem(last=False)
+
+
+availability = AvailabilityEngine()
@@ -0,0 +1,185 @@
+"""
+RentAssured Booking Events
+Booking status changes for the renter and owner, kept in a replay buffer and pushed over pubsub
+"""
+
+import itertools
+import json
+import threading
+import time
+from collections import deque
+from datetime import datetime, timedelta
+
+from flask import current_app
+
+from models_advanced import db, Booking, Listing
+from model_signals import on_commit
+from pubsub import pubsub
+
+# Columns whose changes are pushed to clients
+EVENT_FIELDS = ('status', 'payment_status')
+
+BOOKING_EVENT_BUFFER = 1000
+BOOKING_STREAM_KEEPALIVE = 15  # seconds between comment lines that keep proxies from closing the stream
+BOOKING_STREAM_RECHECK = 15  # seconds between database checks for changes made by other workers
+BOOKING_STREAM_MAX_SECONDS = 300  # streams end after this and browsers reconnect with Last-Event-ID
+BOOKING_STREAM_RETRY_MS = 3000  # how long browsers wait before reconnecting
+
+# Worker classes that wait on a stream without holding an OS thread; under any other
+# class an open stream pins a worker thread, so streams are refused there
+ASYNC_WORKER_CLASSES = ('gevent', 'eventlet')
+
+
+def channel(user_id):
+    return f'bookings:user:{user_id}'
+
+
+def event_payload(booking_id, listing_id, status, payment_status):
+    return {'booking_id': booking_id, 'listing_id': listing_id, 'status': status, 'payment_status': payment_status}
+
+
+class BookingEventLog:
+    """Recent events, for resuming streams from a Last-Event-ID
+
+    Event ids are "<unix ms>-<sequence>". The sequence only means something
+    inside this process; the timestamp lets a stream that reconnects to
+    another worker, or that fell out of the buffer, resync from the bookings
+    table instead.
+    """
+
+    def __init__(self, max_events=BOOKING_EVENT_BUFFER):
+        self._events = deque(maxlen=max_events)
+        self._lock = threading.Lock()
+        self._seq = itertools.count(1)
+        self.streaming = False
+
+    def init_app(self, app):
+        with self._lock:
+            self._events = deque(self._events, maxlen=app.config.get('BOOKING_EVENT_BUFFER', BOOKING_EVENT_BUFFER))
+        self.streaming = app.config.get('WORKER_CLASS') in ASYNC_WORKER_CLASSES
+        app.extensions['booking_events'] = self
+
+    def append(self, user_ids, payload):
+        with self._lock:
+            event_id = f'{int(time.time() * 1000)}-{next(self._seq)}'
+            self._events.append((event_id, frozenset(user_ids), payload))
+        for user_id in user_ids:
+            pubsub.publish(channel(user_id), (event_id, payload))
+        return event_id
+
+    def since(self, event_id, user_id):
+        """[(event_id, payload)] for user_id after event_id, or None if the buffer no longer covers it"""
+        with self._lock:
+            events = list(self._events)
+        for index, (buffered_id, _, _) in enumerate(events):
+            if buffered_id == event_id:
+                return [(later_id, payload) for later_id, users, payload in events[index + 1:] if user_id in users]
+        return None
+
+
+booking_events = BookingEventLog()
+
+
+def event_time(event_id):
+    """UTC datetime an event id was issued at, or None for ids that are not ours"""
+    try:
+        return datetime.utcfromtimestamp(int(str(event_id).split('-', 1)[0]) / 1000)
+    except (TypeError, ValueError, OverflowError):
+        return None
+
+
+def _snapshot(booking):
+    attrs = db.inspect(booking).attrs
+    changed = any(attrs[field].history.has_changes() for field in EVENT_FIELDS)
+    listing = db.session.get(Listing, booking.listing_id)  # new bookings cannot lazy-load it during the flush
+    owner_id = listing.owner_id if listing else None
+    return (changed, (booking.renter_id, owner_id),
+            event_payload(booking.id, booking.listing_id, booking.status or 'pending', booking.payment_status or 'pending'))
+
+
+@on_commit(Booking, snapshot=_snapshot)
+def _booking_changed(changes):
+    for operation, (changed, user_ids, payload) in changes:
+        if operation == 'insert' or (operation == 'update' and changed):
+            booking_events.append([user_id for user_id in user_ids if user_id], payload)
+
+
+def bookings_changed_since(user_id, since):
+    """(booking payloads, newest updated_at) for bookings of user_id, as renter or owner, changed at or after `since`"""
+    rows = db.session.query(
+        Booking.id, Booking.listing_id, Booking.status, Booking.payment_status, Booking.updated_at
+    ).join(Listing, Booking.listing_id == Listing.id).filter(
+        db.or_(Booking.renter_id == user_id, Listing.owner_id == user_id),
+        Booking.updated_at >= since
+    ).order_by(Booking.updated_at, Booking.id).all()
+    newest = max((row.updated_at for row in rows), default=since)
+    return [event_payload(row.id, row.listing_id, row.status, row.payment_status) for row in rows], newest
+
+
+def _sse(event_id, payload):
+    return f"id: {event_id}\nevent: booking\ndata: {json.dumps(payload)}\n\n"
+
+
+def stream_booking_events(user_id, last_event_id=None):
+    """Generate a text/event-stream of booking changes for user_id
+
+    Replays from the buffer after `last_event_id` when it can, otherwise
+    from the bookings table. The stream holds no database connection while
+    it waits. After BOOKING_STREAM_MAX_SECONDS it catches up from the table
+    and moves the client's Last-Event-ID to the present, so the reconnect
+    only re-reads the few seconds it was away. Only serve it from an async
+    worker class (see `streaming`); each open stream is one waiting request.
+    """
+    config = current_app.config
+    keepalive = config.get('BOOKING_STREAM_KEEPALIVE', BOOKING_STREAM_KEEPALIVE)
+    recheck = config.get('BOOKING_STREAM_RECHECK', BOOKING_STREAM_RECHECK)
+    deadline = time.monotonic() + config.get('BOOKING_STREAM_MAX_SECONDS', BOOKING_STREAM_MAX_SECONDS)
+    retry_ms = config.get('BOOKING_STREAM_RETRY_MS', BOOKING_STREAM_RETRY_MS)
+    sent = {}  # booking_id -> (status, payment_status) last sent, so database rechecks skip repeats
+
+    def emit(event_id, payload):
+        sent[payload['booking_id']] = (payload['status'], payload['payment_status'])
+        return _sse(event_id, payload)
+
+    def resync(since):
+        # Changes found in the table get fresh time-based ids that only resync on reconnect
+        payloads, newest = bookings_changed_since(user_id, since)
+        db.session.remove()
+        events = [emit(f'{int(time.time() * 1000)}-0', payload) for payload in payloads
+                  if sent.get(payload['booking_id']) != (payload['status'], payload['payment_status'])]
+        return events, newest
+
+    with pubsub.subscribe(channel(user_id)) as subscription:
+        yield f"retry: {retry_ms}\n\n"
+        # MySQL stores whole seconds; the overlap is filtered out by `sent`
+        watermark = datetime.utcnow() - timedelta(seconds=1)
+        if last_event_id:
+            replay = booking_events.since(last_event_id, user_id)
+            if replay is not None:
+                for event_id, payload in replay:
+                    yield emit(event_id, payload)
+            elif event_time(last_event_id):
+                events, watermark = resync(event_time(last_event_id) - timedelta(seconds=1))
+                if events:
+                    yield ''.join(events)
+        db.session.remove()
+
+        next_check = time.monotonic() + recheck
+        while True:
+            now = time.monotonic()
+            if now >= deadline:
+                # An id line with no data moves the browser's Last-Event-ID without firing an event
+                events, watermark = resync(watermark)
+                yield ''.join(events) + f"id: {int(time.time() * 1000)}-0\n\n"
+                return
+            item = subscription.get(timeout=max(min(keepalive, next_check - now, deadline - now), 0))
+            if item is not None:
+                event_id, payload = item[1]
+                yield emit(event_id, payload)
+            elif subscription.missed or time.monotonic() >= next_check:
+                subscription.missed = False
+                events, watermark = resync(watermark)
+                next_check = time.monotonic() + recheck
+                yield ''.join(events) or ': keepalive\n\n'
+            else:
+                yield ': keepalive\n\n'
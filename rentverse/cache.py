@@ -0,0 +1,192 @@
+"""
+RentAssured Cache
+Pluggable key/value cache with an in-process backend and an optional Redis backend
+"""
+
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from flask import jsonify, make_response, request
+
+try:
+    import redis
+except ImportError:  # Redis is optional; the local backend needs nothing extra
+    redis = None
+
+
+class LocalCacheBackend:
+    """In-process LRU cache with per-key expiry
+
+    Each worker process has its own copy, which is fine for data that is
+    invalidated by the same process that writes it or that tolerates a short
+    TTL. Use the Redis backend when workers must share entries.
+    """
+
+    def __init__(self, max_entries=10000):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.monotonic() + ttl if ttl else None
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def add(self, key, value, ttl=None):
+        """Set key only if it is missing; returns True if it was set"""
+        expires_at = time.monotonic() + ttl if ttl else None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and (entry[1] is None or entry[1] > time.monotonic()):
+                return False
+            self._entries[key] = (value, expires_at)
+            return True
+
+    def delete(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def incr(self, key, amount=1):
+        with self._lock:
+            value, expires_at = self._entries.get(key, (0, None))
+            value = int(value) + amount
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class RedisCacheBackend:
+    """Shared cache backed by Redis; values are stored as JSON"""
+
+    def __init__(self, url, prefix='rentassured:'):
+        if redis is None:
+            raise RuntimeError('The redis package is required for CACHE_BACKEND = "redis"')
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+
+    def get(self, key):
+        raw = self.client.get(self.prefix + key)
+        return json.loads(raw) if raw is not None else None
+
+    def set(self, key, value, ttl=None):
+        self.client.set(self.prefix + key, json.dumps(value, default=str), ex=ttl or None)
+
+    def add(self, key, value, ttl=None):
+        return bool(self.client.set(self.prefix + key, json.dumps(value, default=str), ex=ttl or None, nx=True))
+
+    def delete(self, *keys):
+        if keys:
+            self.client.delete(*[self.prefix + key for key in keys])
+
+    def incr(self, key, amount=1):
+        return self.client.incrby(self.prefix + key, amount)
+
+    def clear(self):
+        for key in self.client.scan_iter(self.prefix + '*'):
+            self.client.delete(key)
+
+
+CACHE_LOCAL_MAX_TTL = 5
+
+
+class Cache:
+    """Facade over the configured backend
+
+    Values stored with set() are dropped by the process that changes their
+    data. Other worker processes cannot drop their copies in a per-process
+    backend, so with several workers and the local backend every value
+    expires after `max_ttl` seconds, whatever TTL its caller asked for.
+    Counters and locks (add, incr) keep their TTLs.
+    """
+
+    def __init__(self):
+        self.backend = LocalCacheBackend()
+        self.default_ttl = 300
+        self.max_ttl = None
+
+    def init_app(self, app):
+        self.default_ttl = app.config.get('CACHE_DEFAULT_TTL', self.default_ttl)
+        if app.config.get('CACHE_BACKEND', 'local') == 'redis':
+            self.backend = RedisCacheBackend(app.config['CACHE_REDIS_URL'])
+        else:
+            self.backend = LocalCacheBackend(app.config.get('CACHE_MAX_ENTRIES', 10000))
+        workers = app.config.get('WORKER_PROCESSES', 1)
+        self.max_ttl = None
+        if isinstance(self.backend, LocalCacheBackend) and workers > 1:
+            self.max_ttl = app.config.get('CACHE_LOCAL_MAX_TTL', CACHE_LOCAL_MAX_TTL)
+            print(f"⚠️  {workers} workers share no cache; cached values expire after {self.max_ttl}s. "
+                  f"Set CACHE_BACKEND=redis to keep them longer")
+        app.extensions['cache'] = self
+
+    def get(self, key):
+        return self.backend.get(key)
+
+    def set(self, key, value, ttl=None):
+        ttl = ttl or self.default_ttl
+        if self.max_ttl:
+            ttl = min(ttl, self.max_ttl)
+        self.backend.set(key, value, ttl)
+
+    def add(self, key, value, ttl=None):
+        return self.backend.add(key, value, ttl or self.default_ttl)
+
+    def delete(self, *keys):
+        self.backend.delete(*keys)
+
+    def incr(self, key, amount=1):
+        return self.backend.incr(key, amount)
+
+    def get_or_set(self, key, loader, ttl=None):
+        """Return the cached value for key, calling loader() on a miss"""
+        value = self.get(key)
+        if value is None:
+            value = loader()
+            self.set(key, value, ttl)
+        return value
+
+
+cache = Cache()
+
+
+def make_etag(payload):
+    """Strong ETag for a JSON-serialisable payload"""
+    raw = json.dumps(payload, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+
+def json_with_etag(payload, etag=None, max_age=0):
+    """JSON response that answers If-None-Match with 304 Not Modified"""
+    etag = etag or make_etag(payload)
+    if request.if_none_match.contains(etag):
+        response = make_response('', 304)
+    else:
+        response = jsonify(payload)
+    response.set_etag(etag)
+    response.cache_control.public = True
+    response.cache_control.max_age = max_age
+    if not max_age:
+        response.cache_control.no_cache = True
+    return response
@@ -0,0 +1,208 @@
+"""
+RentAssured Conversations
+Message threads per participant pair (and booking), with a last-message pointer for the inbox
+"""
+
+import math
+import time
+
+from flask import current_app
+from sqlalchemy import event, func
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, joinedload
+
+from models_advanced import db, Booking, Conversation, Listing, Message
+from model_signals import on_commit
+from pagination import keyset_paginate
+from pubsub import pubsub
+
+INBOX_ORDER = (Conversation.last_message_at, Conversation.id)
+MESSAGE_ORDER = (Message.created_at, Message.id)
+
+# Longest a poll request is held open, and how often it re-reads the database
+# to pick up messages sent through other worker processes. A waiting poll
+# occupies a worker thread, so the timeout stays short unless the server runs
+# an async worker class.
+MESSAGE_POLL_TIMEOUT = 5
+MESSAGE_POLL_RECHECK = 2
+
+
+def thread_key(user_a, user_b, booking_id=None):
+    """Identity of the thread between two users, optionally about one booking"""
+    low, high = sorted((user_a, user_b))
+    return f'{low}:{high}:{booking_id or 0}'
+
+
+def channel(conversation_id):
+    return f'conversation:{conversation_id}'
+
+
+def get_or_create_conversation(user_a, user_b, booking_id=None):
+    """The thread for this pair and booking, created on first use"""
+    key = thread_key(user_a, user_b, booking_id)
+    conversation = Conversation.query.filter_by(thread_key=key).first()
+    if conversation is not None:
+        return conversation
+    low, high = sorted((user_a, user_b))
+    try:
+        with db.session.begin_nested():
+            conversation = Conversation(thread_key=key, user_low_id=low, user_high_id=high, booking_id=booking_id)
+            db.session.add(conversation)
+    except IntegrityError:
+        # Another request created the thread first
+        conversation = Conversation.query.filter_by(thread_key=key).one()
+    return conversation
+
+
+def booking_participants(booking_id):
+    """(renter_id, owner_id) of a booking, or None if it does not exist"""
+    row = db.session.query(Booking.renter_id, Listing.owner_id).join(
+        Listing, Booking.listing_id == Listing.id
+    ).filter(Booking.id == booking_id).first()
+    return tuple(row) if row else None
+
+
+def is_participant(conversation, user_id):
+    return user_id in (conversation.user_low_id, conversation.user_high_id)
+
+
+def send_message(conversation, sender_id, body, subject=None):
+    """Add a message to a thread; the caller commits"""
+    receiver_id = conversation.user_high_id if sender_id == conversation.user_low_id else conversation.user_low_id
+    message = Message(
+        conversation_id=conversation.id,
+        sender_id=sender_id,
+        receiver_id=receiver_id,
+        booking_id=conversation.booking_id,
+        subject=subject,
+        message=body
+    )
+    db.session.add(message)
+    return message
+
+
+@event.listens_for(Session, 'after_flush')
+def _move_last_message_pointers(session, flush_context):
+    """Point each thread at its newest message in the flushing transaction"""
+    newest = {}
+    for message in session.new:
+        if isinstance(message, Message) and message.conversation_id is not None:
+            current = newest.get(message.conversation_id)
+            if current is None or message.id > current.id:
+                newest[message.conversation_id] = message
+    if not newest:
+        return
+    conversations = Conversation.__table__
+    connection = session.connection()
+    for conversation_id, message in sorted(newest.items()):
+        # Only ever move forwards, so concurrent senders cannot rewind the pointer
+        connection.execute(conversations.update().where(
+            conversations.c.id == conversation_id,
+            db.or_(conversations.c.last_message_id.is_(None), conversations.c.last_message_id < message.id)
+        ).values(last_message_id=message.id, last_message_at=message.created_at))
+        conversation = session.identity_map.get(db.inspect(Conversation).identity_key_from_primary_key((conversation_id,)))
+        if conversation is not None:
+            session.expire(conversation, ['last_message_id', 'last_message_at'])
+
+
+@on_commit(Message, snapshot=lambda message: (message.conversation_id, message.id))
+def _message_committed(changes):
+    for operation, (conversation_id, message_id) in changes:
+        if operation == 'insert' and conversation_id is not None:
+            pubsub.publish(channel(conversation_id), message_id)
+
+
+def inbox_page(user_id, cursor=None, per_page=20):
+    """A user's threads, most recently active first, with the other participant and last message"""
+    query = Conversation.query.filter(
+        db.or_(Conversation.user_low_id == user_id, Conversation.user_high_id == user_id),
+        Conversation.last_message_id.isnot(None)
+    ).options(
+        joinedload(Conversation.user_low),
+        joinedload(Conversation.user_high),
+        joinedload(Conversation.last_message)
+    )
+    return keyset_paginate(query, INBOX_ORDER, per_page, cursor=cursor)
+
+
+def unread_by_conversation(user_id, conversation_ids):
+    """{conversation_id: unread messages for user_id} in one grouped query"""
+    if not conversation_ids:
+        return {}
+    return dict(db.session.query(Message.conversation_id, func.count(Message.id)).filter(
+        Message.conversation_id.in_(conversation_ids),
+        Message.receiver_id == user_id,
+        Message.is_read == db.false()
+    ).group_by(Message.conversation_id).all())
+
+
+def message_history(conversation_id, cursor=None, per_page=30):
+    """Newest-first page of a thread's messages"""
+    query = Message.query.filter(Message.conversation_id == conversation_id)
+    return keyset_paginate(query, MESSAGE_ORDER, per_page, cursor=cursor)
+
+
+def messages_after(conversation_id, after_id, limit=100):
+    return Message.query.filter(
+        Message.conversation_id == conversation_id, Message.id > after_id
+    ).order_by(Message.id).limit(limit).all()
+
+
+def wait_for_messages(conversation_id, after_id, timeout=None):
+    """Messages newer than `after_id`, waiting up to `timeout` seconds for one to arrive
+
+    Returns as soon as this worker commits a message to the thread, and
+    re-reads the database every MESSAGE_POLL_RECHECK seconds for messages
+    that other workers wrote.
+    """
+    limit = current_app.config.get('MESSAGE_POLL_TIMEOUT', MESSAGE_POLL_TIMEOUT)
+    recheck = current_app.config.get('MESSAGE_POLL_RECHECK', MESSAGE_POLL_RECHECK)
+    if timeout is None or not math.isfinite(timeout):
+        timeout = limit
+    deadline = time.monotonic() + max(0, min(timeout, limit))
+    with pubsub.subscribe(channel(conversation_id)) as subscription:
+        while True:
+            messages = messages_after(conversation_id, after_id)
+            remaining = deadline - time.monotonic()
+            if messages or remaining <= 0:
+                return messages
+            db.session.rollback()  # end the read transaction so the next read sees new commits
+            subscription.get(timeout=min(recheck, remaining))
+
+
+def backfill_conversations(batch_size=1000):
+    """Thread existing messages that have no conversation; returns the number of threads touched"""
+    messages = Message.__table__
+    pairs = db.session.query(
+        Message.sender_id, Message.receiver_id, Message.booking_id
+    ).filter(Message.conversation_id.is_(None)).distinct().all()
+
+    keys = {}
+    for sender_id, receiver_id, booking_id in pairs:
+        keys.setdefault(thread_key(sender_id, receiver_id, booking_id), (sender_id, receiver_id, booking_id))
+
+    for count, (user_a, user_b, booking_id) in enumerate(keys.values(), 1):
+        conversation = get_or_create_conversation(user_a, user_b, booking_id)
+        db.session.flush()
+        pair = db.or_(
+            db.and_(messages.c.sender_id == user_a, messages.c.receiver_id == user_b),
+            db.and_(messages.c.sender_id == user_b, messages.c.receiver_id == user_a)
+        )
+        same_booking = messages.c.booking_id.is_(None) if booking_id is None else messages.c.booking_id == booking_id
+        db.session.execute(messages.update().where(
+            messages.c.conversation_id.is_(None), pair, same_booking
+        ).values(conversation_id=conversation.id))
+        if count % batch_size == 0:
+            db.session.commit()
+
+    # Repoint every thread at its newest message
+    conversations = Conversation.__table__
+    newest = db.select(func.max(messages.c.id)).where(messages.c.conversation_id == conversations.c.id)
+    db.session.execute(conversations.update().values(last_message_id=newest.scalar_subquery()))
+    db.session.execute(conversations.update().values(
+        last_message_at=db.select(messages.c.created_at).where(
+            messages.c.id == conversations.c.last_message_id
+        ).scalar_subquery()
+    ))
+    db.session.commit()
+    return len(keys)
@@ -0,0 +1,108 @@
+"""
+RentAssured Dashboard Statistics
+Per-user listing and booking aggregates computed with GROUP BY and cached until the user's data changes
+"""
+
+from flask import current_app
+from sqlalchemy import func
+from sqlalchemy.orm import contains_eager
+
+from cache import cache
+from listing_queries import booking_list_query, listing_card_query
+from models_advanced import db, Listing, Booking
+from model_signals import on_commit
+
+# Entries are dropped when this process commits a change to the user's
+# listings or bookings; the TTL bounds staleness for other workers' writes
+# and for rating and view counters, which are written outside the ORM
+DASHBOARD_STATS_TTL = 300
+
+# Bookings that never turned into income
+UNPAID_BOOKING_STATUSES = ('cancelled',)
+
+SCOPES = ('owner', 'renter')
+
+
+def _key(user_id, scope):
+    return f'dashboard:stats:{user_id}:{scope}'
+
+
+def user_listings_query(user_id):
+    """A user's own listings as cards"""
+    return listing_card_query(Listing.query.filter_by(owner_id=user_id))
+
+
+def _filter_bookings(query, user_id, scope):
+    if scope == 'owner':
+        return query.join(Listing, Booking.listing_id == Listing.id).filter(Listing.owner_id == user_id)
+    return query.filter(Booking.renter_id == user_id)
+
+
+def user_bookings_query(user_id, scope):
+    """Bookings on an owner's listings, or a renter's own bookings, with their listing"""
+    if scope == 'owner':
+        return _filter_bookings(Booking.query, user_id, scope).options(contains_eager(Booking.listing))
+    return booking_list_query(_filter_bookings(Booking.query, user_id, scope))
+
+
+def _compute_stats(user_id, scope):
+    listing_rows = db.session.query(
+        Listing.status,
+        func.count(Listing.id),
+        func.sum(Listing.rating_sum),
+        func.sum(Listing.reviews_count)
+    ).filter(Listing.owner_id == user_id).group_by(Listing.status).all()
+
+    booking_rows = _filter_bookings(db.session.query(
+        Booking.status,
+        func.count(Booking.id),
+        func.sum(Booking.total_amount)
+    ), user_id, scope).group_by(Booking.status).all()
+
+    listings_by_status = {status: count for status, count, _, _ in listing_rows}
+    rating_sum = sum(row[2] or 0 for row in listing_rows)
+    reviews_count = sum(row[3] or 0 for row in listing_rows)
+    bookings_by_status = {status: count for status, count, _ in booking_rows}
+
+    return {
+        'scope': scope,
+        'total_listings': sum(listings_by_status.values()),
+        'active_listings': listings_by_status.get('active', 0),
+        'listings_by_status': listings_by_status,
+        'total_bookings': sum(bookings_by_status.values()),
+        'bookings_by_status': bookings_by_status,
+        'revenue': float(sum(total or 0 for status, _, total in booking_rows
+                             if status not in UNPAID_BOOKING_STATUSES)),
+        'rating_avg': round(rating_sum / reviews_count, 2) if reviews_count else 0.0,
+        'reviews_count': reviews_count
+    }
+
+
+def dashboard_stats(user_id, scope):
+    """Counts, revenue and status breakdowns for a user's dashboard
+
+    `scope` is 'owner' for bookings made on the user's listings, or 'renter'
+    for bookings the user made. Costs two GROUP BY queries on a cache miss.
+    """
+    ttl = current_app.config.get('DASHBOARD_STATS_TTL', DASHBOARD_STATS_TTL)
+    return cache.get_or_set(_key(user_id, scope), lambda: _compute_stats(user_id, scope), ttl)
+
+
+def invalidate_dashboard_stats(*user_ids):
+    """Drop cached stats for the given users"""
+    cache.delete(*[_key(user_id, scope) for user_id in set(user_ids) if user_id for scope in SCOPES])
+
+
+def _booking_users(booking):
+    listing = db.session.get(Listing, booking.listing_id)  # new bookings cannot lazy-load it during the flush
+    return (booking.renter_id, listing.owner_id if listing else None)
+
+
+@on_commit(Booking, snapshot=_booking_users)
+def _booking_changed(changes):
+    invalidate_dashboard_stats(*[user_id for _, users in changes for user_id in users])
+
+
+@on_commit(Listing, snapshot=lambda listing: listing.owner_id)
+def _listing_changed(changes):
+    invalidate_dashboard_stats(*[owner_id for _, owner_id in changes])
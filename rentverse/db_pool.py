@@ -0,0 +1,126 @@
+"""
+RentAssured Database Pool
+Instrumented connection pool: checkout latency, waits, timeouts and connection churn
+"""
+
+import threading
+import time
+from bisect import bisect_left
+
+from sqlalchemy import event
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import QueuePool
+
+# Upper bounds of the checkout latency histogram, in milliseconds
+LATENCY_BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+# Checkouts slower than this count as having waited for a free connection
+WAIT_THRESHOLD_MS = 5
+
+
+class PoolStats:
+    """Process-wide counters fed by InstrumentedQueuePool and pool events"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.buckets = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+            self.checkouts = 0
+            self.waits = 0
+            self.timeouts = 0
+            self.total_wait_ms = 0.0
+            self.max_wait_ms = 0.0
+            self.connects = 0
+            self.invalidations = 0
+            self.closes = 0
+
+    def observe_checkout(self, elapsed_ms):
+        with self._lock:
+            self.checkouts += 1
+            self.buckets[bisect_left(LATENCY_BUCKETS_MS, elapsed_ms)] += 1
+            self.total_wait_ms += elapsed_ms
+            self.max_wait_ms = max(self.max_wait_ms, elapsed_ms)
+            if elapsed_ms >= WAIT_THRESHOLD_MS:
+                self.waits += 1
+
+    def increment(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def snapshot(self, pool=None):
+        """Counters plus the live state of `pool`, as a JSON-ready dict"""
+        with self._lock:
+            histogram = [{'le_ms': bound, 'count': count}
+                         for bound, count in zip(LATENCY_BUCKETS_MS + ('+Inf',), self.buckets)]
+            stats = {
+                'checkouts': self.checkouts,
+                'waited_checkouts': self.waits,
+                'timeouts': self.timeouts,
+                'avg_checkout_ms': round(self.total_wait_ms / self.checkouts, 3) if self.checkouts else 0.0,
+                'max_checkout_ms': round(self.max_wait_ms, 3),
+                'connections_opened': self.connects,
+                'connections_invalidated': self.invalidations,
+                'connections_closed': self.closes,
+                'checkout_latency_histogram': histogram,
+            }
+        if pool is not None:
+            stats['pool_class'] = type(pool).__name__
+            if isinstance(pool, QueuePool):
+                stats.update({
+                    'size': pool.size(),
+                    'checked_out': pool.checkedout(),
+                    'checked_in': pool.checkedin(),
+                    'overflow': max(pool.overflow(), 0),
+                    'max_overflow': pool._max_overflow,
+                    'timeout': pool.timeout(),
+                })
+            stats['status'] = pool.status()
+        return stats
+
+
+pool_stats = PoolStats()
+
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool that times every checkout, including waits for a free slot"""
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            pool_stats.increment('timeouts')
+            raise
+        finally:
+            pool_stats.observe_checkout((time.perf_counter() - start) * 1000)
+
+
+@event.listens_for(InstrumentedQueuePool, 'connect')
+def _on_connect(dbapi_connection, connection_record):
+    pool_stats.increment('connects')
+
+
+@event.listens_for(InstrumentedQueuePool, 'invalidate')
+def _on_invalidate(dbapi_connection, connection_record, exception):
+    # Stale connections found by pool_pre_ping or a dropped server end up here
+    pool_stats.increment('invalidations')
+
+
+@event.listens_for(InstrumentedQueuePool, 'close')
+def _on_close(dbapi_connection, connection_record):
+    pool_stats.increment('closes')
+
+
+def init_pool(app):
+    """Use the instrumented pool for pooled engine options from app config
+
+    Must run before db.init_app(app). An empty SQLALCHEMY_ENGINE_OPTIONS
+    (as in TestingConfig) keeps the dialect's default pool untouched.
+    """
+    options = dict(app.config.get('SQLALCHEMY_ENGINE_OPTIONS') or {})
+    if options:
+        options.setdefault('poolclass', InstrumentedQueuePool)
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = options
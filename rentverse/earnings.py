@@ -0,0 +1,282 @@
+"""
+RentAssured Owner Earnings
+Incrementally maintained owner revenue summary keyed by (owner, listing, month, status)
+"""
+
+from collections import defaultdict
+from datetime import date, datetime
+from decimal import Decimal
+
+from sqlalchemy import case, event, extract, func
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from models_advanced import db, Booking, Listing, OwnerEarningsSummary, Payment
+from model_signals import old_value, track_old_values
+
+# Columns that decide which summary row a booking lands in, and what it adds
+BOOKING_FIELDS = ('listing_id', 'start_date', 'status', 'total_amount')
+PAYMENT_FIELDS = ('booking_id', 'amount', 'payment_type', 'status')
+
+KEY_COLUMNS = ('owner_id', 'listing_id', 'month', 'status')
+TOTAL_COLUMNS = ('bookings_count', 'gross_amount', 'paid_amount', 'refunded_amount')
+
+# The old contribution of a changed booking or payment is always subtracted
+track_old_values(Booking, *BOOKING_FIELDS)
+track_old_values(Payment, *PAYMENT_FIELDS)
+
+
+def month_start(day):
+    return date(day.year, day.month, 1)
+
+
+
+def _changed(instance, fields):
+    attrs = db.inspect(instance).attrs
+    return any(attrs[field].history.has_changes() for field in fields)
+
+
+def _summary_key(session, listing_id, start_date, status):
+    listing = session.get(Listing, listing_id) if listing_id is not None else None
+    if listing is None or start_date is None:
+        return None
+    return (listing.owner_id, listing_id, month_start(start_date), status or 'pending')
+
+
+def _booking_key(session, booking_id):
+    booking = session.get(Booking, booking_id) if booking_id is not None else None
+    if booking is None:
+        return None
+    return _summary_key(session, booking.listing_id, booking.start_date, booking.status)
+
+
+def _payment_amounts(payment_type, status, amount):
+    """(paid, refunded) a payment adds to its booking; only settled payments count"""
+    if status != 'success' or amount is None:
+        return Decimal(0), Decimal(0)
+    if payment_type == 'refund':
+        return Decimal(0), Decimal(amount)
+    if payment_type in (None, 'booking'):  # legacy rows predate payment_type
+        return Decimal(amount), Decimal(0)
+    return Decimal(0), Decimal(0)
+
+
+def _payment_columns(payments):
+    """SQL (paid, refunded) sums, by the same rule as _payment_amounts"""
+    settled = payments.c.status == 'success'
+    booking_payment = (payments.c.payment_type == 'booking') | payments.c.payment_type.is_(None)
+    paid = func.coalesce(func.sum(case(
+        (settled & booking_payment, payments.c.amount), else_=0)), 0)
+    refunded = func.coalesce(func.sum(case(
+        (settled & (payments.c.payment_type == 'refund'), payments.c.amount), else_=0)), 0)
+    return paid, refunded
+
+
+def _booking_payments(connection, booking_id):
+    if booking_id is None:
+        return Decimal(0), Decimal(0)
+    payments = Payment.__table__
+    paid, refunded = connection.execute(
+        db.select(*_payment_columns(payments)).where(payments.c.booking_id == booking_id)
+    ).one()
+    return Decimal(paid), Decimal(refunded)
+
+
+def _add(deltas, key, sign, count=0, gross=0, paid=0, refunded=0):
+    if key is None:
+        return
+    totals = deltas[key]
+    totals[0] += sign * count
+    totals[1] += sign * Decimal(gross or 0)
+    totals[2] += sign * paid
+    totals[3] += sign * refunded
+
+
+@event.listens_for(Session, 'before_flush')
+def _collect_old_earnings(session, flush_context, instances):
+    """Subtract what changed or deleted bookings and payments contributed before this flush"""
+    deltas = defaultdict(lambda: [0, Decimal(0), Decimal(0), Decimal(0)])
+    connection = None
+    handled = []
+
+    for booking in list(session.dirty) + list(session.deleted):
+        if not isinstance(booking, Booking):
+            continue
+        if booking not in session.deleted and not _changed(booking, BOOKING_FIELDS):
+            continue
+        handled.append(booking)
+        connection = connection or session.connection()
+        key = _summary_key(session, *(old_value(booking, field) for field in ('listing_id', 'start_date', 'status')))
+        paid, refunded = _booking_payments(connection, booking.id)
+        _add(deltas, key, -1, 1, old_value(booking, 'total_amount'), paid, refunded)
+    handled.extend(booking for booking in session.new if isinstance(booking, Booking))
+    handled_ids = {booking.id for booking in handled if booking.id is not None}
+
+    for payment in list(session.dirty) + list(session.deleted):
+        if not isinstance(payment, Payment):
+            continue
+        if payment not in session.deleted and not _changed(payment, PAYMENT_FIELDS):
+            continue
+        booking_id = old_value(payment, 'booking_id')
+        if booking_id in handled_ids:
+            continue  # the booking's own contribution re-reads its payments
+        paid, refunded = _payment_amounts(
+            old_value(payment, 'payment_type'), old_value(payment, 'status'), old_value(payment, 'amount')
+        )
+        if paid or refunded:
+            _add(deltas, _booking_key(session, booking_id), -1, paid=paid, refunded=refunded)
+
+    session.info['earnings'] = (handled, deltas)
+
+
+@event.listens_for(Session, 'after_flush')
+def _apply_earnings(session, flush_context):
+    """Add this flush's new contributions and fold the deltas into the summary"""
+    pending = session.info.pop('earnings', None)
+    if pending is None:
+        return
+    handled, deltas = pending
+    connection = session.connection()
+
+    for booking in handled:
+        if booking in session.deleted:
+            continue
+        key = _summary_key(session, booking.listing_id, booking.start_date, booking.status)
+        paid, refunded = _booking_payments(connection, booking.id)
+        _add(deltas, key, 1, 1, booking.total_amount, paid, refunded)
+    handled_ids = {booking.id for booking in handled}
+
+    for payment in list(session.new) + list(session.dirty):
+        if not isinstance(payment, Payment) or payment in session.deleted:
+            continue
+        if payment in session.dirty and not _changed(payment, PAYMENT_FIELDS):
+            continue
+        if payment.booking_id in handled_ids:
+            continue
+        paid, refunded = _payment_amounts(payment.payment_type, payment.status, payment.amount)
+        if paid or refunded:
+            _add(deltas, _booking_key(session, payment.booking_id), 1, paid=paid, refunded=refunded)
+
+    for key, totals in sorted(deltas.items()):  # fixed order keeps concurrent writers from deadlocking
+        if any(totals):
+            upsert_summary(connection, dict(zip(KEY_COLUMNS, key)), dict(zip(TOTAL_COLUMNS, totals)))
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_earnings(session):
+    session.info.pop('earnings', None)
+
+
+def upsert_summary(connection, key, totals):
+    """INSERT a summary row, or add `totals` to the existing row for `key`"""
+    table = OwnerEarningsSummary.__table__
+    values = dict(key, updated_at=datetime.utcnow(), **totals)
+    dialect_name = connection.dialect.name
+    if dialect_name == 'mysql':
+        stmt = mysql_insert(table).values(**values)
+        connection.execute(stmt.on_duplicate_key_update(
+            updated_at=stmt.inserted.updated_at,
+            **{column: table.c[column] + stmt.inserted[column] for column in TOTAL_COLUMNS}
+        ))
+    elif dialect_name in ('sqlite', 'postgresql'):
+        insert = sqlite_insert if dialect_name == 'sqlite' else postgresql_insert
+        stmt = insert(table).values(**values)
+        connection.execute(stmt.on_conflict_do_update(
+            index_elements=list(KEY_COLUMNS),
+            set_=dict(updated_at=stmt.excluded.updated_at,
+                      **{column: table.c[column] + stmt.excluded[column] for column in TOTAL_COLUMNS})
+        ))
+    else:
+        _update_or_insert_summary(connection, table, key, values, totals)
+
+
+def _update_or_insert_summary(connection, table, key, values, totals):
+    """Portable upsert for dialects without one: add to the row, else insert it"""
+    update = table.update().where(*[table.c[column] == key[column] for column in KEY_COLUMNS]).values(
+        updated_at=values['updated_at'],
+        **{column: table.c[column] + totals[column] for column in TOTAL_COLUMNS}
+    )
+    if connection.execute(update).rowcount:
+        return
+    try:
+        with connection.begin_nested():
+            connection.execute(table.insert().values(**values))
+    except IntegrityError:
+        # Another transaction inserted the row first; its unique key makes the update land now
+        connection.execute(update)
+
+
+def rebuild_earnings_summary(session, batch_size=1000):
+    """Recompute the whole summary from bookings and payments; returns the row count"""
+    payments = Payment.__table__
+    paid, refunded = _payment_columns(payments)
+    per_booking = db.select(payments.c.booking_id, paid.label('paid'), refunded.label('refunded')).group_by(
+        payments.c.booking_id
+    ).subquery()
+
+    year = extract('year', Booking.start_date)
+    month = extract('month', Booking.start_date)
+    rows = session.query(
+        Listing.owner_id, Booking.listing_id, year, month, Booking.status,
+        func.count(Booking.id),
+        func.coalesce(func.sum(Booking.total_amount), 0),
+        func.coalesce(func.sum(per_booking.c.paid), 0),
+        func.coalesce(func.sum(per_booking.c.refunded), 0)
+    ).join(Listing, Booking.listing_id == Listing.id).outerjoin(
+        per_booking, per_booking.c.booking_id == Booking.id
+    ).group_by(Listing.owner_id, Booking.listing_id, year, month, Booking.status).all()
+
+    now = datetime.utcnow()
+    summary = [{
+        'owner_id': owner_id, 'listing_id': listing_id, 'month': date(int(y), int(m), 1),
+        'status': status or 'pending', 'bookings_count': count, 'gross_amount': gross,
+        'paid_amount': paid_total, 'refunded_amount': refunded_total, 'updated_at': now
+    } for owner_id, listing_id, y, m, status, count, gross, paid_total, refunded_total in rows]
+
+    table = OwnerEarningsSummary.__table__
+    session.execute(table.delete())
+    for start in range(0, len(summary), batch_size):
+        session.execute(table.insert(), summary[start:start + batch_size])
+    return len(summary)
+
+
+def owner_earnings(owner_id, start_month=None, end_month=None, listing_id=None):
+    """Owner revenue by month, listing and status, read from the summary table only"""
+    query = OwnerEarningsSummary.query.filter(
+        OwnerEarningsSummary.owner_id == owner_id,
+        OwnerEarningsSummary.bookings_count > 0
+    )
+    if start_month:
+        query = query.filter(OwnerEarningsSummary.month >= start_month)
+    if end_month:
+        query = query.filter(OwnerEarningsSummary.month <= end_month)
+    if listing_id:
+        query = query.filter(OwnerEarningsSummary.listing_id == listing_id)
+
+    def bucket():
+        return {'bookings': 0, 'gross': 0.0, 'paid': 0.0, 'refunded': 0.0}
+
+    def add(target, row):
+        target['bookings'] += row.bookings_count
+        target['gross'] += float(row.gross_amount)
+        target['paid'] += float(row.paid_amount)
+        target['refunded'] += float(row.refunded_amount)
+
+    months, listings, statuses, totals = {}, {}, {}, bucket()
+    for row in query.order_by(OwnerEarningsSummary.month):
+        month = months.setdefault(row.month.strftime('%Y-%m'), dict(bucket(), by_status={}))
+        add(month, row)
+        month['by_status'][row.status] = month['by_status'].get(row.status, 0) + row.bookings_count
+        add(listings.setdefault(row.listing_id, bucket()), row)
+        add(statuses.setdefault(row.status, bucket()), row)
+        add(totals, row)
+
+    return {
+        'months': [dict(values, month=month) for month, values in months.items()],
+        'listings': [dict(values, listing_id=listing_id) for listing_id, values in sorted(listings.items())],
+        'statuses': statuses,
+        'totals': totals
+    }
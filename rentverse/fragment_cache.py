@@ -0,0 +1,67 @@
+"""
+RentAssured Fragment Cache
+Rendered HTML fragments keyed by a catalog data-version stamp
+"""
+
+from markupsafe import Markup
+
+from cache import cache
+from models_advanced import Listing, ListingImage, Category
+from model_signals import on_commit
+
+CATALOG_VERSION_KEY = 'version:catalog'
+
+# How long one worker may hold the regeneration lock before another retries
+REGENERATE_LOCK_TTL = 30
+
+# Upper bound on a fragment's age, for writes that never bump the version (raw SQL, other apps)
+FRAGMENT_CACHE_TTL = 300
+
+_settings = {'ttl': FRAGMENT_CACHE_TTL}
+
+
+def init_fragment_cache(app):
+    """Configure fragment caching
+
+    The catalog version only reaches other processes through a shared
+    backend; with the per-process cache and several workers, cache.py keeps
+    fragments for a few seconds, as it does every other cached value.
+    """
+    _settings['ttl'] = app.config.get('FRAGMENT_CACHE_TTL', FRAGMENT_CACHE_TTL)
+
+
+def catalog_version():
+    """Current catalog data version; bumped on Listing, ListingImage and Category writes"""
+    return int(cache.get(CATALOG_VERSION_KEY) or 0)
+
+
+@on_commit(Listing, ListingImage, Category)
+def _bump_catalog_version(changes):
+    cache.incr(CATALOG_VERSION_KEY)
+
+
+def cached_fragment(name, builder, version=None):
+    """Return the HTML for fragment `name`, rendering it with builder() when stale
+
+    Fragments are stored with the data version they were rendered from.
+    When the version moves on, the first request to take the regeneration
+    lock re-renders; everyone else keeps serving the stale copy meanwhile.
+    """
+    if version is None:
+        version = catalog_version()
+    key = 'fragment:' + name
+    entry = cache.get(key)
+    if entry and entry['version'] == version:
+        return Markup(entry['html'])
+
+    lock_key = key + ':lock'
+    if entry and not cache.add(lock_key, 1, REGENERATE_LOCK_TTL):
+        return Markup(entry['html'])
+
+    try:
+        html = str(builder())
+        cache.set(key, {'version': version, 'html': html}, _settings['ttl'])
+    finally:
+        if entry:
+            cache.delete(lock_key)
+    return Markup(html)
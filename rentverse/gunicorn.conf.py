@@ -0,0 +1,54 @@
+"""
+RentAssured Gunicorn Configuration
+Pre-fork server settings: several worker processes, each with its own connection pool
+"""
+
+import multiprocessing
+import os
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8000')
+
+# One process per core (plus headroom for I/O waits); threads overlap database calls
+# within a worker. Keep workers * (pool_size + max_overflow) below MySQL's max_connections.
+workers = int(os.environ.get('GUNICORN_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+
+# gthread ties a worker thread to each open request, so long-polls are capped at a few
+# seconds in Config and booking event streams are turned off. With an async class
+# (GUNICORN_WORKER_CLASS=gevent, needs the gevent package) streams are served and polls
+# can be held open longer through MESSAGE_POLL_TIMEOUT.
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')
+
+# Read by Config.WORKER_PROCESSES and Config.WORKER_CLASS when the app is imported, after this file
+os.environ['WORKER_PROCESSES'] = str(workers)
+os.environ['WORKER_CLASS'] = worker_class
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 30))
+graceful_timeout = 30
+
+# Import the app once in the master so workers share its memory copy-on-write
+preload_app = True
+
+accesslog = '-'
+errorlog = '-'
+
+
+def post_fork(server, worker):
+    """Give each worker its own connections instead of sockets inherited from the master"""
+    from models_advanced import db
+    from wsgi import app
+
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=False)  # leave the master's connections open for the master
+
+
+def on_starting(server):
+    """Start every run with an empty metrics directory, so no worker's stale gauges linger"""
+    from metrics import clear_directory
+    clear_directory()
+
+
+def child_exit(server, worker):
+    """Keep an exited worker's counters in the metrics totals and drop its gauges"""
+    from metrics import mark_process_dead
+    mark_process_dead(worker.pid)
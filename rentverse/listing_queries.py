@@ -0,0 +1,65 @@
+"""
+RentAssured Listing Queries
+Reusable query builders for pages that render listing cards
+"""
+
+from sqlalchemy.orm import joinedload
+
+from models_advanced import Listing, Booking
+
+
+def listing_card_query(query=None):
+    """Listing query that loads each card's category in bulk
+
+    The category is joined in and the card image is the denormalised
+    primary_image_url column, so rendering a page of cards costs one query
+    whatever its size.
+    """
+    if query is None:
+        query = Listing.query
+    return query.options(joinedload(Listing.category))
+
+
+def featured_listings(limit=8):
+    """Active listings for the homepage, featured first"""
+    return listing_card_query(Listing.query.filter_by(status='active')).order_by(
+        Listing.featured.desc(), Listing.created_at.desc()
+    ).limit(limit).all()
+
+
+def booking_list_query(query=None):
+    """Booking query that joins in the listing shown next to each booking"""
+    if query is None:
+        query = Booking.query
+    return query.options(joinedload(Booking.listing))
+
+
+def apply_listing_filters(query, args):
+    """Apply the category, price, type and rating filters from a request's args"""
+    category = args.get('category', '')
+    min_price = args.get('min_price', 0, type=float)
+    max_price = args.get('max_price', 100000, type=float)
+    listing_type = args.get('type', '')
+    min_rating = args.get('min_rating', 0, type=float)
+
+    if category:
+        query = query.filter_by(category_id=category)
+    if min_price:
+        query = query.filter(Listing.price >= min_price)
+    if max_price:
+        query = query.filter(Listing.price <= max_price)
+    if listing_type:
+        query = query.filter_by(type=listing_type)
+    if min_rating:
+        query = query.filter(Listing.rating_avg >= min_rating)
+    return query
+
+
+def load_listing_cards(listing_ids):
+    """Load card listings for the given ids, keeping the ids' order"""
+    if not listing_ids:
+        return []
+    listings = listing_card_query(Listing.query.filter(Listing.id.in_(listing_ids))).all()
+    by_id = {listing.id: listing for listing in listings}
+    return [by_id[listing_id] for listing_id in listing_ids if listing_id in by_id]
+
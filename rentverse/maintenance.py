@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+RentAssured Maintenance Commands
+Backfills and repairs for denormalised columns, run against the configured database
+"""
+
+import argparse
+import sys
+
+from app_advanced import create_app
+from models_advanced import db, Listing, Message, User, primary_image_select
+from ratings import reconcile_ratings_update
+from earnings import rebuild_earnings_summary
+from unread import reconcile_unread_update
+from conversations import backfill_conversations as thread_messages
+from schema import upgrade, index_diff, ensure_column as add_column
+
+
+def ensure_column(table, column):
+    """Add a model column to an existing table that predates it"""
+    with db.engine.begin() as connection:
+        return add_column(connection, table, column)
+
+
+def id_batches(column, batch_size):
+    """Yield (low, high) primary key ranges covering a table"""
+    low, high = db.session.query(db.func.min(column), db.func.max(column)).one()
+    if low is None:
+        return
+    while low <= high:
+        yield low, low + batch_size - 1
+        low += batch_size
+
+
+def backfill_primary_images(batch_size=1000):
+    """Recompute listings.primary_image_url from listing_images"""
+    listings = Listing.__table__
+    ensure_column(listings, listings.c.primary_image_url)
+
+    updated = 0
+    for low, high in id_batches(listings.c.id, batch_size):
+        result = db.session.execute(
+            listings.update()
+            .where(listings.c.id.between(low, high))
+            .values(
+                primary_image_url=primary_image_select(listings.c.id).scalar_subquery(),
+                updated_at=listings.c.updated_at  # a backfill is not a listing edit
+            )
+        )
+        db.session.commit()
+        updated += result.rowcount
+    print(f"✅ Backfilled primary images for {updated} listings")
+
+
+def reconcile_ratings(batch_size=1000):
+    """Recompute rating_sum, reviews_count and rating_avg from the reviews table"""
+    listings = Listing.__table__
+    ensure_column(listings, listings.c.rating_sum)
+
+    updated = 0
+    for low, high in id_batches(listings.c.id, batch_size):
+        result = db.session.execute(reconcile_ratings_update(low, high))
+        db.session.commit()
+        updated += result.rowcount
+    print(f"✅ Reconciled ratings for {updated} listings")
+
+
+def reconcile_unread(batch_size=1000):
+    """Recompute users.unread_notifications and unread_messages from their tables"""
+    users = User.__table__
+    ensure_column(users, users.c.unread_notifications)
+    ensure_column(users, users.c.unread_messages)
+
+    updated = 0
+    for low, high in id_batches(users.c.id, batch_size):
+        result = db.session.execute(reconcile_unread_update(low, high))
+        db.session.commit()
+        updated += result.rowcount
+    print(f"✅ Reconciled unread counters for {updated} users")
+
+
+def backfill_conversations(batch_size=1000):
+    """Group messages that predate conversations into threads and set last-message pointers"""
+    db.create_all()  # creates conversations on databases that predate it
+    messages = Message.__table__
+    ensure_column(messages, messages.c.conversation_id)
+    threads = thread_messages(batch_size=batch_size)
+    print(f"✅ Threaded messages into {threads} conversations")
+
+
+def rebuild_earnings(batch_size=1000):
+    """Recompute owner_earnings_summary from bookings and payments in one transaction"""
+    db.create_all()  # creates owner_earnings_summary on databases that predate it
+    rows = rebuild_earnings_summary(db.session, batch_size=batch_size)
+    db.session.commit()
+    print(f"✅ Rebuilt owner earnings summary ({rows} rows)")
+
+
+def migrate(batch_size=None):
+    """Apply pending schema migrations from the migrations package"""
+    applied = upgrade(db.engine)
+    if not applied:
+        print("✅ Schema is up to date")
+
+
+def check_indexes(batch_size=None):
+    """Compare the database's indexes with the ones declared on the models"""
+    problems = index_diff(db.engine)
+    for table, name, columns, problem in problems:
+        where = f"{table}.{name} ({', '.join(columns)})" if name else table
+        print(f"❌ {where}: {problem}")
+    if not problems:
+        print("✅ Indexes match the models")
+    return not problems
+
+
+COMMANDS = {
+    'backfill-conversations': backfill_conversations,
+    'backfill-primary-images': backfill_primary_images,
+    'index-diff': check_indexes,
+    'migrate': migrate,
+    'reconcile-ratings': reconcile_ratings,
+    'rebuild-earnings': rebuild_earnings,
+    'reconcile-unread': reconcile_unread,
+}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='RentAssured maintenance commands')
+    parser.add_argument('command', choices=sorted(COMMANDS))
+    parser.add_argument('--batch-size', type=int, default=1000,
+                        help='rows updated per transaction (default: 1000)')
+    args = parser.parse_args(argv)
+
+    with create_app().app_context():
+        try:
+            result = COMMANDS[args.command](batch_size=args.batch_size)
+        except Exception as e:
+            db.session.rollback()
+            print(f"❌ {args.command} failed: {e}")
+            return 1
+    return 1 if result is False else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,420 @@
+"""
+RentAssured Metrics
+Counters, gauges and histograms in Prometheus text format, shared across pre-fork workers through a directory
+"""
+
+import atexit
+import glob
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+
+from flask import g, request
+
+from db_pool import pool_stats
+from models_advanced import db, Booking, Payment
+from model_signals import on_commit
+from process_local import ProcessLocal
+
+METRICS_MULTIPROC_DIR = None  # directory each worker writes its values to; None keeps them in-process
+METRICS_FLUSH_INTERVAL = 5  # seconds between a worker's writes to METRICS_MULTIPROC_DIR
+
+# Upper bounds of the request latency histogram, in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+ARCHIVE_FILE = 'archive.json'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, int) or float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _sample(name, labelnames, labelvalues, value, extra=()):
+    pairs = list(zip(labelnames, labelvalues)) + list(extra)
+    labels = ','.join(f'{label}="{_escape(v)}"' for label, v in pairs)
+    return f"{name}{{{labels}}} {_format_value(value)}" if labels else f"{name} {_format_value(value)}"
+
+
+class Metric:
+    """Values of one metric keyed by label values"""
+
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} takes labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[label]) for label in self.labelnames)
+
+    def state(self):
+        """JSON-ready copy of the values, for writing to the multiprocess directory"""
+        with self._lock:
+            values = [[list(key), value] for key, value in self._values.items()]
+        return {'kind': self.kind, 'help': self.documentation, 'labels': list(self.labelnames), 'values': values}
+
+    def clear(self):
+        with self._lock:
+            self._values = {}
+
+
+class Counter(Metric):
+    """Monotonic total, summed across workers"""
+
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        if not self.labelnames:
+            self._values[()] = 0  # exposed from the start, so rates begin at zero rather than at the first event
+
+    def inc(self, amount=1, **labels):
+        if amount < 0:
+            raise ValueError(f"{self.name} can only go up")
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    """Current value, reported per worker"""
+
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(Metric):
+    """Observations counted into fixed buckets, summed across workers"""
+
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            # Per-bucket counts, then sum and count; made cumulative on exposition
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+            entry[bisect_left(self.buckets, value)] += 1
+            entry[-2] += value
+            entry[-1] += 1
+
+    def state(self):
+        state = super().state()
+        state['values'] = [[key, list(value)] for key, value in state['values']]
+        state['buckets'] = list(self.buckets)
+        return state
+
+
+def _merge(merged, states, pid=None):
+    """Fold one process's states into `merged`; gauges keep a pid label, the rest are summed"""
+    for name, state in states.items():
+        target = merged.setdefault(name, dict(state, values={}))
+        for key, value in state['values']:
+            if state['kind'] == 'gauge':
+                if pid is not None:
+                    target['values'][tuple(key) + (str(pid),)] = value
+                    target['pid_label'] = True
+                else:
+                    target['values'][tuple(key)] = value
+            elif state['kind'] == 'histogram':
+                current = target['values'].get(tuple(key))
+                target['values'][tuple(key)] = value if current is None else [a + b for a, b in zip(current, value)]
+            else:
+                target['values'][tuple(key)] = target['values'].get(tuple(key), 0) + value
+    return merged
+
+
+def render(merged):
+    """Prometheus text exposition (format 0.0.4) of merged states"""
+    lines = []
+    for name in sorted(merged):
+        state = merged[name]
+        labelnames = tuple(state['labels']) + (('pid',) if state.get('pid_label') else ())
+        lines.append(f"# HELP {name} {_escape(state['help'])}")
+        lines.append(f"# TYPE {name} {state['kind']}")
+        for key in sorted(state['values']):
+            value = state['values'][key]
+            if state['kind'] != 'histogram':
+                lines.append(_sample(name, labelnames, key, value))
+                continue
+            cumulative = 0
+            for bound, count in zip(list(state['buckets']) + [float('inf')], value[:-2]):
+                cumulative += count
+                lines.append(_sample(f'{name}_bucket', labelnames, key, cumulative, [('le', _format_value(bound))]))
+            lines.append(_sample(f'{name}_sum', labelnames, key, value[-2]))
+            lines.append(_sample(f'{name}_count', labelnames, key, value[-1]))
+    return '\n'.join(lines) + '\n'
+
+
+def _write_json(path, data):
+    # Readers only ever see a whole file
+    temporary = f'{path}.{os.getpid()}.tmp'
+    with open(temporary, 'w') as handle:
+        json.dump(data, handle)
+    os.replace(temporary, path)
+
+
+def _read_json(path):
+    try:
+        with open(path) as handle:
+            return json.load(handle)
+    except (OSError, ValueError):
+        return None  # removed or half-written by a worker that died mid-write
+
+
+class MetricsRegistry:
+    """The app's metrics, exposed for this process or for every worker
+
+    Without a multiprocess directory the exposition covers this process
+    only. With one, each worker writes its values to <dir>/<pid>.json every
+    METRICS_FLUSH_INTERVAL seconds (and at exit), and the exposition merges
+    every file: counters and histograms are summed, gauges are reported per
+    worker with a `pid` label. The gunicorn master folds the counters of
+    exited workers into archive.json so totals survive worker restarts.
+    """
+
+    def __init__(self):
+        self.directory = METRICS_MULTIPROC_DIR
+        self.flush_interval = METRICS_FLUSH_INTERVAL
+        self.app = None
+        self._metrics = {}
+        self._collectors = []
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._writer = ProcessLocal(self._start_writer)
+
+    def init_app(self, app):
+        self.app = app
+        self.directory = app.config.get('METRICS_MULTIPROC_DIR', self.directory) or None
+        self.flush_interval = app.config.get('METRICS_FLUSH_INTERVAL', self.flush_interval)
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+        app.before_request(self._start_request)
+        app.after_request(self._finish_request)
+        app.teardown_request(self._teardown_request)
+        app.extensions['metrics'] = self
+        atexit.register(self.shutdown)
+
+    def _register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric {metric.name} is already registered")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def collector(self, function):
+        """Register a function that refreshes gauges right before values are read or written"""
+        self._collectors.append(function)
+        return function
+
+    def states(self):
+        for function in self._collectors:
+            try:
+                function()
+            except Exception as e:
+                print(f"Metrics collector {function.__name__} failed: {e}")
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return {metric.name: metric.state() for metric in metrics}
+
+    def exposition(self):
+        """Text exposition of this process, or of every worker when a directory is set"""
+        if not self.directory:
+            return render(_merge({}, self.states()))
+        self.write()
+        merged = {}
+        archive = _read_json(os.path.join(self.directory, ARCHIVE_FILE))
+        if archive:
+            _merge(merged, archive)
+        for path in sorted(glob.glob(os.path.join(self.directory, '[0-9]*.json'))):
+            states = _read_json(path)
+            if states:
+                _merge(merged, states, pid=os.path.basename(path).split('.')[0])
+        return render(merged)
+
+    def write(self):
+        """Write this process's values to the multiprocess directory"""
+        if self.directory:
+            _write_json(os.path.join(self.directory, f'{os.getpid()}.json'), self.states())
+
+    def _start_writer(self):
+        thread = threading.Thread(target=self._run, name='metrics-writer', daemon=True)
+        thread.start()
+        return thread
+
+    def _run(self):
+        while not self._wake.wait(self.flush_interval):
+            try:
+                self.write()
+            except Exception as e:
+                print(f"Metrics write failed: {e}")
+
+    def shutdown(self):
+        # Only processes that served requests have values worth keeping; not the gunicorn master
+        if self._writer.started():
+            self._wake.set()
+            self.write()
+
+    def _start_request(self):
+        g.metrics_started = time.perf_counter()
+
+    def _finish_request(self, response):
+        started = g.pop('metrics_started', None)
+        if started is not None:
+            # Endpoint names, not paths, keep label cardinality bounded
+            endpoint = request.endpoint or '<unmatched>'
+            request_latency.observe(time.perf_counter() - started, endpoint=endpoint, method=request.method)
+            requests_total.inc(endpoint=endpoint, method=request.method, status=response.status_code)
+        if self.directory:
+            self._writer.get()
+        return response
+
+    def _teardown_request(self, exc):
+        if exc is not None:
+            unhandled_exceptions.inc(endpoint=request.endpoint or '<unmatched>')
+
+
+metrics = MetricsRegistry()
+
+
+def mark_process_dead(pid, directory=None):
+    """Fold an exited worker's counters and histograms into the archive and drop its gauges
+
+    Called from the gunicorn master only, so the archive has a single writer.
+    """
+    directory = directory or os.environ.get('METRICS_MULTIPROC_DIR')
+    if not directory:
+        return
+    path = os.path.join(directory, f'{pid}.json')
+    states = _read_json(path)
+    if states:
+        archive_path = os.path.join(directory, ARCHIVE_FILE)
+        merged = {}
+        for source in (_read_json(archive_path) or {}, states):
+            _merge(merged, {name: state for name, state in source.items() if state['kind'] != 'gauge'})
+        _write_json(archive_path, {
+            name: dict(state, values=[[list(key), value] for key, value in state['values'].items()])
+            for name, state in merged.items()
+        })
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def clear_directory(directory=None):
+    """Remove every worker file and the archive; run once when the server starts"""
+    directory = directory or os.environ.get('METRICS_MULTIPROC_DIR')
+    if not directory:
+        return
+    for path in glob.glob(os.path.join(directory, '*.json')):
+        os.remove(path)
+
+
+# Requests
+request_latency = metrics.histogram(
+    'rentassured_request_duration_seconds', 'Time to build a response, by endpoint', ('endpoint', 'method')
+)
+requests_total = metrics.counter(
+    'rentassured_requests_total', 'Responses sent, by endpoint and status code', ('endpoint', 'method', 'status')
+)
+unhandled_exceptions = metrics.counter(
+    'rentassured_unhandled_exceptions_total', 'Requests that ended in an uncaught exception', ('endpoint',)
+)
+auth_failures = metrics.counter(
+    'rentassured_auth_failures_total', 'Rejected logins and requests, by reason', ('reason',)
+)
+
+# Bookings, counted once the transaction that wrote them commits
+bookings_created = metrics.counter('rentassured_bookings_created_total', 'Bookings created')
+booking_cancellations = metrics.counter('rentassured_booking_cancellations_total', 'Bookings cancelled')
+refunds = metrics.counter('rentassured_refunds_total', 'Refund payments recorded')
+refund_amount = metrics.counter('rentassured_refund_amount_total', 'Sum of refund payments, in rupees')
+booking_errors = metrics.counter(
+    'rentassured_booking_errors_total', 'Booking requests turned away or failed, by reason', ('reason',)
+)
+
+# Background work
+view_flush_failures = metrics.counter(
+    'rentassured_view_flush_failures_total', 'View count flushes that failed; their counts stay buffered'
+)
+
+# Database pool of this worker
+pool_connections = metrics.gauge(
+    'rentassured_db_pool_connections', 'Pooled connections by state; checkout waits are in /api/admin/pool_stats', ('state',)
+)
+
+
+@metrics.collector
+def _collect_pool():
+    if metrics.app is None:
+        return
+    with metrics.app.app_context():
+        stats = pool_stats.snapshot(db.engine.pool)
+    # Only QueuePool reports these; SQLite's default pool has no fixed size
+    for state in ('checked_out', 'checked_in', 'overflow', 'size', 'max_overflow'):
+        if state in stats:
+            pool_connections.set(stats[state], state=state)
+
+
+def _booking_snapshot(booking):
+    history = db.inspect(booking).attrs.status.history
+    return booking.status, history.has_changes()
+
+
+@on_commit(Booking, snapshot=_booking_snapshot)
+def _count_bookings(changes):
+    for operation, (status, status_changed) in changes:
+        if operation == 'insert':
+            bookings_created.inc()
+        elif operation == 'update' and status_changed and status == 'cancelled':
+            booking_cancellations.inc()
+
+
+@on_commit(Payment, snapshot=lambda payment: (payment.payment_type, payment.amount))
+def _count_refunds(changes):
+    for operation, (payment_type, amount) in changes:
+        if operation == 'insert' and payment_type == 'refund':
+            refunds.inc()
+            refund_amount.inc(float(amount or 0))
@@ -4,10 +4,20 @@ Migration Script: RentAssured Basic to Advanced Database
 Migrates data from the old database structure to the new advanced structure
 """
 
-import pymysql
+import argparse
+import json
+import queue
 import sys
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import contextmanager
 from datetime import datetime
 
+import pymysql
+import pymysql.cursors
+
 # Database configurations
 OLD_DB_CONFIG = {
     'host': 'localhost',
@@ -25,399 +35,683 @@ NEW_DB_CONFIG = {
     'charset': 'utf8mb4'
 }
 
-def migrate_users():
-    """Migrate users from old to new database"""
-    try:
-        old_conn = pymysql.connect(**OLD_DB_CONFIG)
-        new_conn = pymysql.connect(**NEW_DB_CONFIG)
-        
-        old_cursor = old_conn.cursor()
-        new_cursor = new_conn.cursor()
-        
-        # Get users from old database
-        old_cursor.execute("SELECT * FROM user")
-        users = old_cursor.fetchall()
-        
-        # Get column names
-        old_cursor.execute("DESCRIBE user")
-        columns = [row[0] for row in old_cursor.fetchall()]
-        
-        migrated_count = 0
-        
-        for user in users:
-            user_dict = dict(zip(columns, user))
-            
-            # Map user_type to role_id
-            role_id = 1  # Default to renter
-            if user_dict.get('user_type') == 'owner':
-                role_id = 2
-            elif user_dict.get('user_type') == 'freelancer':
-                role_id = 3
-            
-            # Insert into new database
-            new_cursor.execute("""
-                INSERT IGNORE INTO users (
-                    id, name, email, phone, password, role_id, profile_picture,
-                    is_verified, is_active, created_at, updated_at
-                ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-            """, (
-                user_dict['id'],
-                user_dict['name'],
-                user_dict['email'],
-                user_dict['phone'],
-                user_dict['password'],
-                role_id,
-                user_dict.get('profile_picture'),
-                user_dict.get('is_verified', False),
-                True,  # is_active
-                user_dict.get('created_at', datetime.now()),
-                user_dict.get('updated_at', datetime.now())
-            ))
-            
-            migrated_count += 1
-        
-        new_conn.commit()
-        print(f"✅ Migrated {migrated_count} users")
-        
-        old_cursor.close()
-        new_cursor.close()
-        old_conn.close()
-        new_conn.close()
-        
-        return True
-        
-    except Exception as e:
-        print(f"❌ Error migrating users: {e}")
-        return False
-
-def migrate_categories():
-    """Migrate categories from old to new database"""
-    try:
-        old_conn = pymysql.connect(**OLD_DB_CONFIG)
-        new_conn = pymysql.connect(**NEW_DB_CONFIG)
-        
-        old_cursor = old_conn.cursor()
-        new_cursor = new_conn.cursor()
-        
-        # Get categories from old database
-        old_cursor.execute("SELECT * FROM category")
-        categories = old_cursor.fetchall()
-        
-        # Get column names
-        old_cursor.execute("DESCRIBE category")
-        columns = [row[0] for row in old_cursor.fetchall()]
-        
-        migrated_count = 0
-        
-        for category in categories:
-            category_dict = dict(zip(columns, category))
-            
-            # Check if category already exists to avoid duplicates
-            new_cursor.execute("SELECT id FROM categories WHERE name = %s", (category_dict['name'],))
-            if new_cursor.fetchone():
-                continue  # Skip if category already exists
-            
-            # Insert into new database
-            new_cursor.execute("""
-                INSERT IGNORE INTO categories (
-                    id, name, description, icon, is_active, created_at
-                ) VALUES (%s, %s, %s, %s, %s, %s)
-            """, (
-                category_dict['id'],
-                category_dict['name'],
-                category_dict.get('description'),
-                category_dict.get('icon'),
-                True,  # is_active
-                category_dict.get('created_at', datetime.now())
-            ))
-            
-            migrated_count += 1
-        
-        new_conn.commit()
-        print(f"✅ Migrated {migrated_count} categories")
-        
-        old_cursor.close()
-        new_cursor.close()
-        old_conn.close()
-        new_conn.close()
-        
-        return True
-        
-    except Exception as e:
-        print(f"❌ Error migrating categories: {e}")
-        return False
-
-def migrate_listings():
-    """Migrate listings from old to new database"""
-    try:
-        old_conn = pymysql.connect(**OLD_DB_CONFIG)
-        new_conn = pymysql.connect(**NEW_DB_CONFIG)
-        
-        old_cursor = old_conn.cursor()
-        new_cursor = new_conn.cursor()
-        
-        # Get listings from old database
-        old_cursor.execute("SELECT * FROM listing")
-        listings = old_cursor.fetchall()
-        
-        # Get column names
-        old_cursor.execute("DESCRIBE listing")
-        columns = [row[0] for row in old_cursor.fetchall()]
-        
-        migrated_count = 0
-        
-        for listing in listings:
-            listing_dict = dict(zip(columns, listing))
-            
-            # Handle availability field - ensure it's valid JSON
-            availability = listing_dict.get('availability', '{}')
-            if availability and availability != '{}':
-                try:
-                    # Try to parse as JSON to validate
-                    import json
-                    json.loads(availability)
-                except:
-                    # If invalid, use default empty object
-                    availability = '{}'
-            else:
-                availability = '{}'
-            
-            # Insert into new database
-            new_cursor.execute("""
-                INSERT IGNORE INTO listings (
-                    id, title, description, price, location, category_id, owner_id,
-                    availability, status, created_at, updated_at
-                ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-            """, (
-                listing_dict['id'],
-                listing_dict['title'],
-                listing_dict['description'],
-                listing_dict['price'],
-                listing_dict['location'],
-                listing_dict['category_id'],
-                listing_dict['owner_id'],
-                availability,
-                'active' if listing_dict.get('status') == 'active' else 'draft',
-                listing_dict.get('created_at', datetime.now()),
-                listing_dict.get('updated_at', datetime.now())
-            ))
-            
-            # Migrate images if they exist
-            if listing_dict.get('images'):
-                try:
-                    import json
-                    images = json.loads(listing_dict['images'])
-                    if isinstance(images, list) and images:
-                        for i, image_url in enumerate(images):
-                            new_cursor.execute("""
-                                INSERT INTO listing_images (
-                                    listing_id, image_url, sort_order, is_primary
-                                ) VALUES (%s, %s, %s, %s)
-                            """, (
-                                listing_dict['id'],
-                                image_url,
-                                i,
-                                i == 0  # First image is primary
-                            ))
-                except:
-                    pass  # Skip if images can't be parsed
-            
-            migrated_count += 1
-        
-        new_conn.commit()
-        print(f"✅ Migrated {migrated_count} listings")
-        
-        old_cursor.close()
-        new_cursor.close()
-        old_conn.close()
-        new_conn.close()
-        
-        return True
-        
-    except Exception as e:
-        print(f"❌ Error migrating listings: {e}")
-        return False
-
-def migrate_bookings():
-    """Migrate bookings from old to new database"""
+CHUNK_SIZE = 10000  # rows per keyset query on the old database
+BATCH_SIZE = 1000  # rows per executemany and per transaction on the new database
+PROGRESS_EVERY = 5  # seconds between progress lines
+WORKERS = 4  # shards copied at once
+SHARD_SIZE = 250000  # primary keys per shard of a large table
+
+# Lock wait timeout and deadlock; a batch that hits one is rolled back and retried
+RETRYABLE_ERRORS = (1205, 1213)
+LOCK_RETRIES = 3
+
+# Where each table got to, written in the same transaction as the rows it covers
+CHECKPOINT_TABLE = """
+    CREATE TABLE IF NOT EXISTS migration_checkpoints (
+        table_name VARCHAR(64) NOT NULL,
+        range_start BIGINT NOT NULL DEFAULT 0,
+        last_key BIGINT NOT NULL,
+        rows_copied BIGINT NOT NULL DEFAULT 0,
+        completed BOOLEAN DEFAULT FALSE,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+        PRIMARY KEY (table_name, range_start)
+    ) ENGINE=InnoDB
+"""
+
+
+class TableSpec:
+    """How one old table is copied into the new schema
+
+    `inserts` maps each new table the old rows feed to its INSERT statement,
+    parents first; `transform(row)` turns one old row (a dict) into
+    (new table, values) pairs. Rows are read in `key` order, so a copy can
+    stop anywhere and resume after the last key it committed. `checksum`
+    lists (old column, new column) pairs copied unchanged, which verification
+    compares between the two databases. Rows for the `children` tables start
+    with their parent's key and are only written alongside a parent row the
+    same batch inserted, so re-copies and skipped parents add nothing.
+    """
+
+    def __init__(self, name, source, inserts, transform, depends_on=(), key='id', checksum=(), children=()):
+        self.name = name
+        self.source = source
+        self.inserts = inserts
+        self.transform = transform
+        self.depends_on = tuple(depends_on)
+        self.key = key
+        self.checksum = tuple(checksum)
+        self.children = tuple(children)
+
+    @property
+    def target(self):
+        return next(iter(self.inserts))
+
+
+def _now_default(row, column):
+    return row.get(column) or datetime.now()
+
+
+def _user_rows(user):
+    # Map user_type to role_id; renters are the default
+    role_id = {'owner': 2, 'freelancer': 3}.get(user.get('user_type'), 1)
+    return [('users', (
+        user['id'],
+        user['name'],
+        user['email'],
+        user['phone'],
+        user['password'],
+        role_id,
+        user.get('profile_picture'),
+        user.get('is_verified', False),
+        True,  # is_active
+        _now_default(user, 'created_at'),
+        _now_default(user, 'updated_at')
+    ))]
+
+
+def _category_rows(category):
+    return [('categories', (
+        category['id'],
+        category['name'],
+        category.get('description'),
+        category.get('icon'),
+        True,  # is_active
+        _now_default(category, 'created_at'),
+        category['name']
+    ))]
+
+
+def _json_or(value, default):
     try:
-        old_conn = pymysql.connect(**OLD_DB_CONFIG)
-        new_conn = pymysql.connect(**NEW_DB_CONFIG)
-        
-        old_cursor = old_conn.cursor()
-        new_cursor = new_conn.cursor()
-        
-        # Get bookings from old database
-        old_cursor.execute("SELECT * FROM booking")
-        bookings = old_cursor.fetchall()
-        
-        # Get column names
-        old_cursor.execute("DESCRIBE booking")
-        columns = [row[0] for row in old_cursor.fetchall()]
-        
-        migrated_count = 0
-        
-        for booking in bookings:
-            booking_dict = dict(zip(columns, booking))
-            
-            # Insert into new database
-            new_cursor.execute("""
-                INSERT IGNORE INTO bookings (
-                    id, listing_id, renter_id, start_date, end_date, total_amount,
-                    security_deposit, status, payment_status, special_requests,
-                    created_at, updated_at
-                ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-            """, (
-                booking_dict['id'],
-                booking_dict['listing_id'],
-                booking_dict['renter_id'],
-                booking_dict['start_date'],
-                booking_dict['end_date'],
-                booking_dict['total_amount'],
-                booking_dict.get('security_deposit', 0.00),
-                booking_dict.get('status', 'pending'),
-                booking_dict.get('payment_status', 'pending'),
-                booking_dict.get('special_requests'),
-                booking_dict.get('created_at', datetime.now()),
-                booking_dict.get('updated_at', datetime.now())
-            ))
-            
-            migrated_count += 1
-        
-        new_conn.commit()
-        print(f"✅ Migrated {migrated_count} bookings")
-        
-        old_cursor.close()
-        new_cursor.close()
-        old_conn.close()
-        new_conn.close()
-        
-        return True
-        
-    except Exception as e:
-        print(f"❌ Error migrating bookings: {e}")
-        return False
-
-def migrate_reviews():
-    """Migrate reviews from old to new database"""
+        return json.loads(value) if value else default
+    except (TypeError, ValueError):
+        return default
+
+
+def _listing_rows(listing):
+    # Availability must be valid JSON in the new schema
+    availability = listing.get('availability')
+    if _json_or(availability, None) is None:
+        availability = '{}'
+
+    # Old listings keep their images as a JSON list; the first one is primary
+    images = _json_or(listing.get('images'), [])
+    if not isinstance(images, list):
+        images = []
+
+    rows = [('listings', (
+        listing['id'],
+        listing['title'],
+        listing['description'],
+        listing['price'],
+        listing['location'],
+        listing['category_id'],
+        listing['owner_id'],
+        availability,
+        'active' if listing.get('status') == 'active' else 'draft',
+        images[0] if images else None,
+        _now_default(listing, 'created_at'),
+        _now_default(listing, 'updated_at')
+    ))]
+    rows.extend(('listing_images', (listing['id'], image_url, i, i == 0)) for i, image_url in enumerate(images))
+    return rows
+
+
+def _booking_rows(booking):
+    return [('bookings', (
+        booking['id'],
+        booking['listing_id'],
+        booking['renter_id'],
+        booking['start_date'],
+        booking['end_date'],
+        booking['total_amount'],
+        booking.get('security_deposit') or 0.00,
+        booking.get('status') or 'pending',
+        booking.get('payment_status') or 'pending',
+        booking.get('special_requests'),
+        _now_default(booking, 'created_at'),
+        _now_default(booking, 'updated_at')
+    ))]
+
+
+def _review_rows(review):
+    return [('reviews', (
+        review['id'],
+        review['listing_id'],
+        review['reviewer_id'],
+        review['reviewee_id'],
+        review['rating'],
+        review.get('comment'),
+        _now_default(review, 'created_at')
+    ))]
+
+
+# Every table the migration copies and the tables whose rows it references
+MIGRATIONS = [
+    TableSpec('users', 'user', {
+        'users': """
+            INSERT IGNORE INTO users (
+                id, name, email, phone, password, role_id, profile_picture,
+                is_verified, is_active, created_at, updated_at
+            ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+        """,
+    }, _user_rows, checksum=[('id', 'id'), ('email', 'email')]),
+    TableSpec('categories', 'category', {
+        # Categories already in the new database by name are kept as they are
+        'categories': """
+            INSERT IGNORE INTO categories (id, name, description, icon, is_active, created_at)
+            SELECT %s, %s, %s, %s, %s, %s FROM DUAL
+            WHERE NOT EXISTS (SELECT 1 FROM categories WHERE name = %s)
+        """,
+    }, _category_rows),
+    TableSpec('listings', 'listing', {
+        'listings': """
+            INSERT IGNORE INTO listings (
+                id, title, description, price, location, category_id, owner_id,
+                availability, status, primary_image_url, created_at, updated_at
+            ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+        """,
+        'listing_images': """
+            INSERT INTO listing_images (
+                listing_id, image_url, sort_order, is_primary
+            ) VALUES (%s, %s, %s, %s)
+        """,
+    }, _listing_rows, depends_on=('users', 'categories'), children=('listing_images',),
+        checksum=[('id', 'id'), ('owner_id', 'owner_id'), ('category_id', 'category_id'), ('title', 'title')]),
+    TableSpec('bookings', 'booking', {
+        'bookings': """
+            INSERT IGNORE INTO bookings (
+                id, listing_id, renter_id, start_date, end_date, total_amount,
+                security_deposit, status, payment_status, special_requests,
+                created_at, updated_at
+            ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+        """,
+    }, _booking_rows, depends_on=('users', 'listings'),
+        checksum=[('id', 'id'), ('listing_id', 'listing_id'), ('renter_id', 'renter_id')]),
+    TableSpec('reviews', 'review', {
+        'reviews': """
+            INSERT IGNORE INTO reviews (
+                id, listing_id, reviewer_id, reviewee_id, rating, comment,
+                created_at
+            ) VALUES (%s, %s, %s, %s, %s, %s, %s)
+        """,
+    }, _review_rows, depends_on=('users', 'listings'),
+        checksum=[('id', 'id'), ('listing_id', 'listing_id'), ('reviewer_id', 'reviewer_id'), ('rating', 'rating')]),
+]
+
+
+class Progress:
+    """Rows copied for one table across its shards, printed every PROGRESS_EVERY seconds"""
+
+    def __init__(self, name, total, done=0, every=PROGRESS_EVERY):
+        self.name = name
+        self.total = total
+        self.done = done
+        self.copied = 0
+        self.every = every
+        self.started = time.monotonic()
+        self._last_report = self.started
+        self._lock = threading.Lock()
+
+    def start(self):
+        self.started = self._last_report = time.monotonic()
+
+    def add(self, rows):
+        with self._lock:
+            self.copied += rows
+            self.done += rows
+            now = time.monotonic()
+            if now - self._last_report < self.every:
+                return
+            self._last_report = now
+        print(f"   … {self.name}: {self.done:,}/{self.total:,} rows ({self.percent():.0f}%), {self.rate():,.0f} rows/s")
+
+    def percent(self):
+        return 100.0 * self.done / self.total if self.total else 100.0
+
+    def elapsed(self):
+        return time.monotonic() - self.started
+
+    def rate(self):
+        elapsed = self.elapsed()
+        return self.copied / elapsed if elapsed > 0 else 0.0
+
+
+def connect(config):
+    return pymysql.connect(**config)
+
+
+class ConnectionPool:
+    """Up to `size` open connections to one database, shared by the worker threads"""
+
+    def __init__(self, config, size):
+        self.config = config
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+
+    @contextmanager
+    def connection(self):
+        self._slots.acquire()
+        try:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                conn = connect(self.config)
+            try:
+                yield conn
+            except Exception:
+                conn.close()  # the connection may be mid-transaction or broken
+                raise
+            self._idle.put(conn)
+        finally:
+            self._slots.release()
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+def load_checkpoint(cursor, name, range_start=0):
+    """(last_key, rows_copied, completed) for a table range, or None if it never started"""
+    cursor.execute(
+        "SELECT last_key, rows_copied, completed FROM migration_checkpoints WHERE table_name = %s AND range_start = %s",
+        (name, range_start)
+    )
+    return cursor.fetchone()
+
+
+def save_checkpoint(cursor, name, range_start, last_key, rows_copied, completed=False):
+    cursor.execute("""
+        INSERT INTO migration_checkpoints (table_name, range_start, last_key, rows_copied, completed)
+        VALUES (%s, %s, %s, %s, %s)
+        ON DUPLICATE KEY UPDATE last_key = VALUES(last_key), rows_copied = VALUES(rows_copied),
+            completed = VALUES(completed)
+    """, (name, range_start, last_key, rows_copied, completed))
+
+
+def read_batches(conn, spec, after, high=None, chunk_size=CHUNK_SIZE, batch_size=BATCH_SIZE):
+    """Yield lists of old rows with key > after (and <= high), in key order
+
+    Each chunk is one keyset query streamed through a server-side cursor, so
+    neither side ever holds more than a batch and no query runs for long.
+    """
+    upper = f" AND `{spec.key}` <= %s" if high is not None else ""
+    sql = f"SELECT * FROM `{spec.source}` WHERE `{spec.key}` > %s{upper} ORDER BY `{spec.key}` LIMIT %s"
+    while True:
+        read = 0
+        with conn.cursor(pymysql.cursors.SSDictCursor) as cursor:
+            cursor.execute(sql, (after, high, chunk_size) if high is not None else (after, chunk_size))
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                read += len(rows)
+                after = rows[-1][spec.key]
+                yield rows
+        if read < chunk_size:
+            return
+
+
+def existing_keys(cursor, table, key, keys):
+    """The subset of `keys` already present in a new table"""
+    if not keys:
+        return set()
+    placeholders = ', '.join(['%s'] * len(keys))
+    cursor.execute(f"SELECT `{key}` FROM `{table}` WHERE `{key}` IN ({placeholders})", list(keys))
+    return {row[0] for row in cursor.fetchall()}
+
+
+def write_batch(cursor, spec, rows):
+    """Insert the new rows for one batch of old rows, one executemany per new table"""
+    params = defaultdict(list)
+    for row in rows:
+        for target, values in spec.transform(row):
+            params[target].append(values)
+
+    # INSERT IGNORE skips parents that already exist (a reset or re-sharded run)
+    # or whose own parents are missing; their children must be skipped with them
+    if spec.children:
+        parent_keys = [values[0] for values in params[spec.target]]
+        before = existing_keys(cursor, spec.target, spec.key, parent_keys)
+
+    # pymysql folds executemany of a plain INSERT ... VALUES into multi-row inserts
+    for target, sql in spec.inserts.items():
+        values = params[target]
+        if target in spec.children and values:
+            inserted = existing_keys(cursor, spec.target, spec.key, parent_keys) - before
+            values = [child for child in values if child[0] in inserted]
+        if values:
+            cursor.executemany(sql, values)
+
+
+def _commit_batch(new_conn, spec, rows, range_start, last_key, rows_copied):
+    # Shards of one table insert side by side, so InnoDB may pick one of them
+    # as a deadlock victim; the batch is simply retried
+    for attempt in range(1, LOCK_RETRIES + 1):
+        try:
+            with new_conn.cursor() as cursor:
+                write_batch(cursor, spec, rows)
+                save_checkpoint(cursor, spec.name, range_start, last_key, rows_copied)
+            new_conn.commit()
+            return
+        except pymysql.err.OperationalError as e:
+            new_conn.rollback()
+            if e.args[0] not in RETRYABLE_ERRORS or attempt == LOCK_RETRIES:
+                raise
+            time.sleep(0.1 * attempt)
+
+
+def copy_range(spec, old_conn, new_conn, low=None, high=None, progress=None,
+               chunk_size=CHUNK_SIZE, batch_size=BATCH_SIZE):
+    """Copy old rows with low <= key <= high, resuming from the range's checkpoint
+
+    Returns the number of old rows copied by this call.
+    """
+    range_start = low or 0
+    with new_conn.cursor() as cursor:
+        checkpoint = load_checkpoint(cursor, spec.name, range_start)
+    if checkpoint and checkpoint[2]:
+        return 0
+    after, rows_copied = (checkpoint[0], checkpoint[1]) if checkpoint else ((low or 0) - 1, 0)
+
+    copied = 0
+    for rows in read_batches(old_conn, spec, after, high, chunk_size, batch_size):
+        after = rows[-1][spec.key]
+        rows_copied += len(rows)
+        _commit_batch(new_conn, spec, rows, range_start, after, rows_copied)
+        copied += len(rows)
+        if progress:
+            progress.add(len(rows))
+
+    with new_conn.cursor() as cursor:
+        save_checkpoint(cursor, spec.name, range_start, after, rows_copied, completed=True)
+    new_conn.commit()
+    return copied
+
+
+def dependency_levels(specs):
+    """Tables grouped so every table comes after everything it depends on
+
+    Raises ValueError for unknown dependencies and cycles.
+    """
+    names = {spec.name for spec in specs}
+    for spec in specs:
+        unknown = set(spec.depends_on) - names
+        if unknown:
+            raise ValueError(f"{spec.name} depends on unknown tables: {', '.join(sorted(unknown))}")
+    levels, placed = [], set()
+    remaining = list(specs)
+    while remaining:
+        level = [spec for spec in remaining if set(spec.depends_on) <= placed]
+        if not level:
+            raise ValueError(f"Dependency cycle between: {', '.join(spec.name for spec in remaining)}")
+        levels.append(level)
+        placed.update(spec.name for spec in level)
+        remaining = [spec for spec in remaining if spec.name not in placed]
+    return levels
+
+
+def key_ranges(low, high, shard_size):
+    """Inclusive (start, end) key ranges covering low..high, aligned to shard_size
+
+    Alignment keeps range starts, and so checkpoints, the same from run to run.
+    """
+    if low is None:
+        return []
+    start = (low // shard_size) * shard_size
+    ranges = []
+    while start <= high:
+        ranges.append((start, start + shard_size - 1))
+        start += shard_size
+    return ranges
+
+
+def plan_table(cursor, spec, shard_size):
+    """(row count, key ranges) of an old table"""
+    cursor.execute(f"SELECT COUNT(*), MIN(`{spec.key}`), MAX(`{spec.key}`) FROM `{spec.source}`")
+    total, low, high = cursor.fetchone()
+    return total, key_ranges(low, high, shard_size)
+
+
+class MigrationScheduler:
+    """Copies tables shard by shard on a worker pool, respecting dependencies
+
+    A table's key-range shards are queued only once every table it depends
+    on has finished, so foreign keys always find their parent rows; tables
+    that do not depend on each other, and the shards of one table, run side
+    by side on pooled connections.
+    """
+
+    def __init__(self, specs, workers=WORKERS, shard_size=SHARD_SIZE,
+                 chunk_size=CHUNK_SIZE, batch_size=BATCH_SIZE):
+        dependency_levels(specs)  # fail before copying anything
+        self.specs = {spec.name: spec for spec in specs}
+        self.workers = workers
+        self.shard_size = shard_size
+        self.chunk_size = chunk_size
+        self.batch_size = batch_size
+        self.old_pool = ConnectionPool(OLD_DB_CONFIG, workers)
+        self.new_pool = ConnectionPool(NEW_DB_CONFIG, workers)
+        self.plans = {}
+        self.progress = {}
+
+    def plan(self):
+        with self.old_pool.connection() as old_conn, self.new_pool.connection() as new_conn:
+            with old_conn.cursor() as old_cursor, new_conn.cursor() as new_cursor:
+                for name, spec in self.specs.items():
+                    total, ranges = plan_table(old_cursor, spec, self.shard_size)
+                    new_cursor.execute(
+                        "SELECT COALESCE(SUM(rows_copied), 0) FROM migration_checkpoints WHERE table_name = %s",
+                        (name,)
+                    )
+                    self.plans[name] = ranges
+                    self.progress[name] = Progress(name, total, done=int(new_cursor.fetchone()[0]))
+            old_conn.commit()
+            new_conn.commit()
+
+    def _copy_shard(self, spec, low, high):
+        with self.old_pool.connection() as old_conn, self.new_pool.connection() as new_conn:
+            return copy_range(spec, old_conn, new_conn, low, high, progress=self.progress[spec.name],
+                              chunk_size=self.chunk_size, batch_size=self.batch_size)
+
+    def run(self):
+        """Copy every table; returns True if all of them finished"""
+        self.plan()
+        waiting = dict(self.specs)
+        finished = set()
+        shards_left = {}
+        running = {}
+        failed = False
+
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='migrate') as executor:
+            while True:
+                if not failed:
+                    for name, spec in list(waiting.items()):
+                        if not set(spec.depends_on) <= finished:
+                            continue
+                        del waiting[name]
+                        shards_left[name] = len(self.plans[name])
+                        self.progress[name].start()
+                        for low, high in self.plans[name]:
+                            running[executor.submit(self._copy_shard, spec, low, high)] = name
+                        if not shards_left[name]:
+                            finished.add(name)
+                            print(f"✅ {name}: nothing to migrate")
+                    if waiting and not running and not failed:
+                        continue  # tables just finished without shards may have unblocked others
+                if not running:
+                    break
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    try:
+                        future.result()
+                    except Exception as e:
+                        print(f"❌ Error migrating {name}: {e}")
+                        failed = True  # let running shards finish, start nothing new
+                        continue
+                    shards_left[name] -= 1
+                    if shards_left[name] == 0:
+                        finished.add(name)
+                        progress = self.progress[name]
+                        print(f"✅ Migrated {progress.copied:,} {name} in {progress.elapsed():.1f}s "
+                              f"({progress.rate():,.0f} rows/s)")
+
+        return not failed and not waiting
+
+    def verify(self):
+        """Compare row counts and checksums of each shard between the old and new tables
+
+        Only the columns a spec copies unchanged are checksummed. Rows the new
+        database already had, or skipped as duplicates, show up as mismatches.
+        """
+        ok = True
+        with self.old_pool.connection() as old_conn, self.new_pool.connection() as new_conn:
+            with old_conn.cursor() as old_cursor, new_conn.cursor() as new_cursor:
+                for name, spec in self.specs.items():
+                    if not spec.checksum:
+                        print(f"⏭️  {name}: not verified (rows are matched by value, not key)")
+                        continue
+                    old_columns = [old for old, _ in spec.checksum]
+                    new_columns = [new for _, new in spec.checksum]
+                    old_total = new_total = 0
+                    mismatched = []
+                    for low, high in self.plans[name]:
+                        old_count, old_sum = _range_checksum(old_cursor, spec.source, spec.key, old_columns, low, high)
+                        new_count, new_sum = _range_checksum(new_cursor, spec.target, spec.key, new_columns, low, high)
+                        old_total += old_count
+                        new_total += new_count
+                        if (old_count, old_sum) != (new_count, new_sum):
+                            mismatched.append((low, high))
+                    if mismatched:
+                        ok = False
+                        ranges = ', '.join(f'{low}-{high}' for low, high in mismatched[:5])
+                        print(f"⚠️  {name}: {old_total:,} old rows, {new_total:,} new rows; "
+                              f"{len(mismatched)} key ranges differ ({ranges})")
+                    else:
+                        print(f"✅ {name}: {new_total:,} rows match")
+            old_conn.commit()
+            new_conn.commit()
+        return ok
+
+    def close(self):
+        self.old_pool.close()
+        self.new_pool.close()
+
+
+def _range_checksum(cursor, table, key, columns, low, high):
+    """(row count, sum of per-row CRC32s) for a key range; order independent"""
+    row = ", ".join(f"`{column}`" for column in columns)
+    cursor.execute(
+        f"SELECT COUNT(*), COALESCE(SUM(CRC32(CONCAT_WS('|', {row}))), 0) FROM `{table}` "
+        f"WHERE `{key}` BETWEEN %s AND %s",
+        (low, high)
+    )
+    count, checksum = cursor.fetchone()
+    return int(count), int(checksum)
+
+
+def prepare_checkpoints(reset=False):
+    conn = connect(NEW_DB_CONFIG)
     try:
-        old_conn = pymysql.connect(**OLD_DB_CONFIG)
-        new_conn = pymysql.connect(**NEW_DB_CONFIG)
-        
-        old_cursor = old_conn.cursor()
-        new_cursor = new_conn.cursor()
-        
-        # Get reviews from old database
-        old_cursor.execute("SELECT * FROM review")
-        reviews = old_cursor.fetchall()
-        
-        # Get column names
-        old_cursor.execute("DESCRIBE review")
-        columns = [row[0] for row in old_cursor.fetchall()]
-        
-        migrated_count = 0
-        
-        for review in reviews:
-            review_dict = dict(zip(columns, review))
-            
-            # Insert into new database
-            new_cursor.execute("""
-                INSERT IGNORE INTO reviews (
-                    id, listing_id, reviewer_id, reviewee_id, rating, comment,
-                    created_at
-                ) VALUES (%s, %s, %s, %s, %s, %s, %s)
-            """, (
-                review_dict['id'],
-                review_dict['listing_id'],
-                review_dict['reviewer_id'],
-                review_dict['reviewee_id'],
-                review_dict['rating'],
-                review_dict.get('comment'),
-                review_dict.get('created_at', datetime.now())
-            ))
-            
-            migrated_count += 1
-        
-        new_conn.commit()
-        print(f"✅ Migrated {migrated_count} reviews")
-        
-        old_cursor.close()
-        new_cursor.close()
-        old_conn.close()
-        new_conn.close()
-        
-        return True
-        
-    except Exception as e:
-        print(f"❌ Error migrating reviews: {e}")
-        return False
-
-def main():
+        with conn.cursor() as cursor:
+            cursor.execute(CHECKPOINT_TABLE)
+            if reset:
+                cursor.execute("DELETE FROM migration_checkpoints")
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def main(argv=None):
     """Main migration function"""
+    parser = argparse.ArgumentParser(description='Migrate RentAssured Basic data into the advanced database')
+    parser.add_argument('--workers', type=int, default=WORKERS,
+                        help=f'shards copied at once (default: {WORKERS})')
+    parser.add_argument('--shard-size', type=int, default=SHARD_SIZE,
+                        help=f'primary keys per shard; keep it the same when resuming (default: {SHARD_SIZE})')
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE,
+                        help=f'rows per insert batch and transaction (default: {BATCH_SIZE})')
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE,
+                        help=f'rows per read query on the old database (default: {CHUNK_SIZE})')
+    parser.add_argument('--reset', action='store_true',
+                        help='forget checkpoints from earlier runs and copy every table again')
+    parser.add_argument('--verify-only', action='store_true',
+                        help='skip copying and only compare the two databases')
+    args = parser.parse_args(argv)
+
     print("🚀 Starting migration from RentAssured Basic to Advanced Database...")
     print("=" * 60)
-    
+
     # Check if old database exists
     try:
-        old_conn = pymysql.connect(**OLD_DB_CONFIG)
+        old_conn = connect(OLD_DB_CONFIG)
         old_conn.close()
-    except:
+    except Exception:
         print("❌ Old database 'rentassured' not found or not accessible")
         print("Please ensure the old database exists and is accessible")
         sys.exit(1)
-    
+
     # Check if new database exists
     try:
-        new_conn = pymysql.connect(**NEW_DB_CONFIG)
-        new_conn.close()
-    except:
+        prepare_checkpoints(reset=args.reset)
+    except Exception:
         print("❌ New database 'rentassured_advanced' not found")
         print("Please run setup_advanced_database.py first")
         sys.exit(1)
-    
+
     print("✅ Both databases are accessible")
     print()
-    
-    # Start migration
-    success = True
-    
-    print("📊 Migrating data...")
-    print("-" * 30)
-    
-    if not migrate_users():
-        success = False
-    
-    if not migrate_categories():
-        success = False
-    
-    if not migrate_listings():
-        success = False
-    
-    if not migrate_bookings():
-        success = False
-    
-    if not migrate_reviews():
-        success = False
-    
-    print("-" * 30)
-    
-    if success:
-        print("🎉 Migration completed successfully!")
-        print()
-        print("📋 Migration Summary:")
-        print("   • Users migrated with role mapping")
-        print("   • Categories migrated")
-        print("   • Listings migrated with image handling")
-        print("   • Bookings migrated")
-        print("   • Reviews migrated")
-        print()
-        print("🔄 Next Steps:")
-        print("   1. Update your app.py to use the new database")
-        print("   2. Test the application with the new structure")
-        print("   3. Consider backing up the old database")
+
+    scheduler = MigrationScheduler(MIGRATIONS, workers=args.workers, shard_size=args.shard_size,
+                                   chunk_size=args.chunk_size, batch_size=args.batch_size)
+    started = time.monotonic()
+    try:
+        if args.verify_only:
+            scheduler.plan()
+            success = True
+        else:
+            print(f"📊 Migrating data with {args.workers} workers...")
+            print("-" * 30)
+            success = scheduler.run()
+            print("-" * 30)
+
+        if success:
+            print("🔍 Verifying row counts and checksums...")
+            verified = scheduler.verify()
+    finally:
+        scheduler.close()
+
+    if not success:
+        print("❌ Migration stopped with errors")
+        print("Fix the error above and run the script again; it resumes where it stopped")
+        sys.exit(1)
+
+    print()
+    if verified:
+        print(f"🎉 Migration completed successfully in {time.monotonic() - started:.1f}s!")
     else:
-        print("❌ Migration completed with errors")
-        print("Please check the error messages above and fix any issues")
+        print(f"⚠️  Migration finished in {time.monotonic() - started:.1f}s, but some tables differ")
+        print("   Rows skipped by INSERT IGNORE (duplicates, missing parents) are the usual cause")
+    print()
+    print("📋 Migration Summary:")
+    print("   • Users migrated with role mapping")
+    print("   • Categories migrated")
+    print("   • Listings migrated with image handling")
+    print("   • Bookings migrated")
+    print("   • Reviews migrated")
+    print()
+    print("🔄 Next Steps:")
+    print("   1. Run maintenance.py reconcile-ratings to fill listing rating totals")
+    print("   2. Test the application with the new structure")
+    print("   3. Consider backing up the old database")
+    if not verified:
+        sys.exit(2)
+
 
 if __name__ == "__main__":
     main()
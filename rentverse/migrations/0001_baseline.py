@@ -0,0 +1,19 @@
+"""Tables and columns that databases built by the old setup script may predate"""
+
+from models_advanced import db, Listing, Message, User
+from schema import ensure_column
+
+# Columns added to existing tables since the first release
+ADDED_COLUMNS = (
+    Listing.__table__.c.primary_image_url,
+    Listing.__table__.c.rating_sum,
+    User.__table__.c.unread_notifications,
+    User.__table__.c.unread_messages,
+    Message.__table__.c.conversation_id,
+)
+
+
+def upgrade(connection):
+    db.metadata.create_all(connection)  # only creates tables that are missing, e.g. conversations
+    for column in ADDED_COLUMNS:
+        ensure_column(connection, column.table, column)
@@ -0,0 +1,23 @@
+"""Composite indexes for listing browsing and booking availability, and drop the ones they replace"""
+
+from schema import create_missing_indexes, drop_index
+
+# Indexes made redundant by a composite with the same leading column, or by a unique constraint
+SUPERSEDED = {
+    'users': ('idx_email',),
+    'listings': ('idx_status', 'idx_featured'),
+    'listing_images': ('idx_listing', 'idx_primary', 'idx_sort'),
+    'bookings': ('idx_listing',),
+    'payments': ('idx_transaction',),
+    'wishlists': ('idx_user',),
+    'coupons': ('idx_code',),
+    'coupon_usage': ('idx_booking',),
+}
+
+
+def upgrade(connection):
+    # Create first: MySQL will not drop the only index behind a foreign key
+    create_missing_indexes(connection)
+    for table_name, names in SUPERSEDED.items():
+        for name in names:
+            drop_index(connection, table_name, name)
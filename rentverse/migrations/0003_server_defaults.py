@@ -0,0 +1,23 @@
+"""Database-side defaults, so rows written with raw SQL get them too, and fill the NULLs written without them"""
+
+from models_advanced import db
+from schema import backfill_default, ensure_server_default
+
+
+def _defaulted_columns():
+    for table in db.metadata.sorted_tables:
+        for column in table.columns:
+            if column.server_default is not None:
+                yield table, column
+
+
+def upgrade(connection):
+    for table, column in _defaulted_columns():
+        ensure_server_default(connection, table, column)
+
+
+def backfill(engine):
+    for table, column in _defaulted_columns():
+        # A NULL foreign key means the referenced row was deleted, not that a default is missing
+        if not column.foreign_keys:
+            backfill_default(engine, table, column)
@@ -0,0 +1,11 @@
+"""Drop the FULLTEXT index on listings; keyword search runs on the in-process index in search.py"""
+
+from schema import drop_index
+
+# idx_search came from the original DDL, idx_listings_search from the models that replaced it
+SEARCH_INDEXES = ('idx_search', 'idx_listings_search')
+
+
+def upgrade(connection):
+    for name in SEARCH_INDEXES:
+        drop_index(connection, 'listings', name)
@@ -0,0 +1,4 @@
+"""
+RentAssured Schema Migrations
+Numbered NNNN_name.py modules, each with an upgrade(connection) function; applied by schema.py
+"""
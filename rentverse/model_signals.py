@@ -0,0 +1,68 @@
+"""
+RentAssured Model Signals
+Run callbacks once a transaction that wrote given models has committed
+"""
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+_receivers = []
+
+
+def _keep_old_value(target, value, oldvalue, initiator):
+    pass
+
+
+def track_old_values(model, *fields):
+    """Load a column's previous value when an expired instance has it reassigned
+
+    Without this the history of an unloaded column has no old value, and a
+    flush hook cannot tell what the row contributed before the change.
+    """
+    for field in fields:
+        event.listen(getattr(model, field), 'set', _keep_old_value, active_history=True)
+
+
+def old_value(instance, field):
+    """Value `field` had when the instance was loaded; the current one if unchanged"""
+    history = inspect(instance).attrs[field].load_history()
+    return history.deleted[0] if history.deleted else getattr(instance, field)
+
+
+def on_commit(*models, snapshot=None):
+    """Register a receiver for committed writes to the given models
+
+    The decorated function is called after commit with a list of
+    (operation, value) pairs, where operation is 'insert', 'update' or
+    'delete' and value is snapshot(instance), taken at flush time while the
+    instance is still loaded. By default the snapshot is the instance itself.
+    """
+    def decorator(receiver):
+        _receivers.append((models, snapshot, receiver))
+        return receiver
+    return decorator
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_changes(session, flush_context):
+    pending = session.info.setdefault('model_signals', {})
+    for operation, instances in (('insert', session.new), ('update', session.dirty), ('delete', session.deleted)):
+        for instance in instances:
+            for index, (models, snapshot, _) in enumerate(_receivers):
+                if isinstance(instance, models):
+                    value = snapshot(instance) if snapshot else instance
+                    pending.setdefault(index, []).append((operation, value))
+
+
+@event.listens_for(Session, 'after_commit')
+def _dispatch_changes(session):
+    pending = session.info.pop('model_signals', None)
+    if not pending:
+        return
+    for index, changes in pending.items():
+        _receivers[index][2](changes)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_changes(session):
+    session.info.pop('model_signals', None)
@@ -4,7 +4,11 @@ Enhanced database models with advanced marketplace features
 """
 
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import set_committed_value
 from datetime import datetime, timedelta
+from itertools import chain
 import json
 
 db = SQLAlchemy()
@@ -17,8 +21,8 @@ class Role(db.Model):
     role_name = db.Column(db.String(50), unique=True, nullable=False)
     description = db.Column(db.Text)
     permissions = db.Column(db.JSON)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, server_default=db.text('CURRENT_TIMESTAMP'))
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, server_default=db.text('CURRENT_TIMESTAMP'), onupdate=datetime.utcnow)
     
     # Relationships
     users = db.relationship('User', backref='role', lazy=True)
@@ -32,18 +36,26 @@ class User(db.Model):
     email = db.Column(db.String(120), unique=True, nullable=False)
     phone = db.Column(db.String(15), nullable=False)
     password = db.Column(db.String(255), nullable=False)
-    role_id = db.Column(db.Integer, db.ForeignKey('roles.id'), default=1)
+    role_id = db.Column(db.Integer, db.ForeignKey('roles.id', ondelete='SET NULL'), default=1, server_default='1')
     profile_picture = db.Column(db.String(255))
     bio = db.Column(db.Text)
     location = db.Column(db.String(200))
-    is_verified = db.Column(db.Boolean, default=False)
-    is_active = db.Column(db.Boolean, default=True)
-    is_suspended = db.Column(db.Boolean, default=False)
+    is_verified = db.Column(db.Boolean, default=False, server_default=db.false())
+    is_active = db.Column(db.Boolean, default=True, server_default=db.true())
+    is_suspended = db.Column(db.Boolean, default=False, server_default=db.false())
     verification_token = db.Column(db.String(255))
     reset_token = db.Column(db.String(255))
     last_login = db.Column(db.DateTime)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    unread_notifications = db.Column(db.Integer, default=0, server_default='0')  # Maintained with unread_messages by unread.py
+    unread_messages = db.Column(db.Integer, default=0, server_default='0')
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, server_default=db.text('CURRENT_TIMESTAMP'))
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, server_default=db.text('CURRENT_TIMESTAMP'), onupdate=datetime.utcnow)
+    
+    __table_args__ = (
+        db.Index('idx_users_phone', 'phone'),
+        db.Index('idx_users_role', 'role_id'),
+        db.Index('idx_users_active', 'is_active'),
+    )
     
     # Relationships
     listings = db.relationship('Listing', backref='owner', lazy=True)
@@ -66,11 +78,16 @@ class Category(db.Model):
     name = db.Column(db.String(100), nullable=False)
     description = db.Column(db.Text)
     icon = db.Column(db.String(100))
-    parent_id = db.Column(db.Integer, db.ForeignKey('categories.id'))
-    is_active = db.Column(db.Boolean, default=True)
-    sort_order = db.Column(db.Integer, default=0)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    parent_id = db.Column(db.Integer, db.ForeignKey('categories.id', ondelete='SET NULL'))
+    is_active = db.Column(db.Boolean, default=True, server_default=db.true())
+    sort_order = db.Column(db.Integer, default=0, server_default='0')
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, server_default=db.text('CURRENT_TIMESTAMP'))
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, server_default=db.text('CURRENT_TIMESTAMP'), onupdate=datetime.utcnow)
+    
+    __table_args__ = (
+        db.Index('idx_categories_parent', 'parent_id'),
+        db.Index('idx_categories_active', 'is_active'),
+    )
     
     # Relationships
     listings = db.relationship('Listing', backref='category', lazy=True)
@@ -85,18 +102,31 @@ class Listing(db.Model):
     description = db.Column(db.Text, nullable=False)
     price = db.Column(db.Numeric(10, 2), nullable=False)
     location = db.Column(db.String(200), nullable=False)
-    category_id = db.Column(db.Integer, db.ForeignKey('categories.id'), nullable=False)
-    owner_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
-    type = db.Column(db.Enum('product', 'service', name='listing_type'), default='product')
+    category_id = db.Column(db.Integer, db.ForeignKey('categories.id', ondelete='CASCADE'), nullable=False)
+    owner_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
+    type = db.Column(db.Enum('product', 'service', name='listing_type'), default='product', server_default='product')
     availability = db.Column(db.JSON)
-    status = db.Column(db.Enum('draft', 'active', 'inactive', 'suspended', name='listing_status'), default='draft')
-    featured = db.Column(db.Boolean, default=False)
-    views_count = db.Column(db.Integer, default=0)
-    likes_count = db.Column(db.Integer, default=0)
-    rating_avg = db.Column(db.Numeric(3, 2), default=0.00)
-    reviews_count = db.Column(db.Integer, default=0)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    status = db.Column(db.Enum('draft', 'active', 'inactive', 'suspended', name='listing_status'), default='draft', server_default='draft')
+    featured = db.Column(db.Boolean, default=False, server_default=db.false())
+    views_count = db.Column(db.Integer, default=0, server_default='0')  # Written in batches by view_counter.py
+    likes_count = db.Column(db.Integer, default=0, server_default='0')
+    rating_avg = db.Column(db.Numeric(3, 2), default=0.00, server_default='0')
+    rating_sum = db.Column(db.Integer, default=0, server_default='0')  # Maintained with reviews_count by ratings.py
+    reviews_count = db.Column(db.Integer, default=0, server_default='0')
+    primary_image_url = db.Column(db.String(500))  # Denormalised from listing_images, see refresh_primary_images
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, server_default=db.text('CURRENT_TIMESTAMP'))
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, server_default=db.text('CURRENT_TIMESTAMP'), onupdate=datetime.utcnow)
+    
+    __table_args__ = (
+        db.Index('idx_listings_status_featured_created', 'status', 'featured', 'created_at'),  # browse and homepage order; InnoDB appends id
+        db.Index('idx_listings_category', 'category_id'),
+        db.Index('idx_listings_owner', 'owner_id'),
+        db.Index('idx_listings_type', 'type'),
+        db.Index('idx_listings_price', 'price'),
+        db.Index('idx_listings_rating', 'rating_avg'),
+        db.Index('idx_listings_views', 'views_count'),
+        db.Index('idx_listings_location', 'location'),
+    )
     
     # Relationships
     images = db.relationship('ListingImage', backref='listing', lazy=True, cascade='all, delete-orphan')
@@ -109,12 +139,62 @@ class ListingImage(db.Model):
     __tablename__ = 'listing_images'
     
     id = db.Column(db.Integer, primary_key=True)
-    listing_id = db.Column(db.Integer, db.ForeignKey('listings.id'), nullable=False)
+    listing_id = db.Column(db.Integer, db.ForeignKey('listings.id', ondelete='CASCADE'), nullable=False)
     image_url = db.Column(db.String(500), nullable=False)
     alt_text = db.Column(db.String(200))
-    sort_order = db.Column(db.Integer, default=0)
-    is_primary = db.Column(db.Boolean, default=False)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    sort_order = db.Column(db.Integer, default=0, server_default='0')
+    is_primary = db.Column(db.Boolean, default=False, server_default=db.false())
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, server_default=db.text('CURRENT_TIMESTAMP'))
+    
+    __table_args__ = (
+        db.Index('idx_listing_images_listing_order', 'listing_id', 'is_primary', 'sort_order'),  # primary_image_select
+    )
+
+def primary_image_select(listing_id):
+    """Select a listing's card image: the primary image, else the first by sort order"""
+    return (
+        db.select(ListingImage.image_url)
+        .where(ListingImage.listing_id == listing_id)
+        .order_by(ListingImage.is_primary.desc(), ListingImage.sort_order, ListingImage.id)
+        .limit(1)
+    )
+
+# ListingImage columns that can change which image a listing shows on its card
+PRIMARY_IMAGE_FIELDS = ('listing_id', 'image_url', 'sort_order', 'is_primary')
+
+@event.listens_for(Session, 'after_flush')
+def refresh_primary_images(session, flush_context):
+    """Rewrite Listing.primary_image_url for listings whose images were just flushed
+
+    Runs inside the flushing transaction, so the column commits or rolls back
+    together with the image rows. Bulk query deletes bypass this hook; run
+    `python maintenance.py backfill-primary-images` after any such cleanup.
+    """
+    listing_ids = set()
+    for image in chain(session.new, session.deleted):
+        if isinstance(image, ListingImage):
+            listing_ids.add(image.listing_id)
+    for image in session.dirty:
+        if not isinstance(image, ListingImage):
+            continue
+        attrs = db.inspect(image).attrs
+        if any(attrs[field].history.has_changes() for field in PRIMARY_IMAGE_FIELDS):
+            listing_ids.add(image.listing_id)
+            listing_ids.update(attrs.listing_id.history.deleted or ())
+    listing_ids.discard(None)
+    if not listing_ids:
+        return
+
+    connection = session.connection()
+    listings = Listing.__table__
+    for listing_id in listing_ids:
+        image_url = connection.execute(primary_image_select(listing_id)).scalar()
+        connection.execute(
+            listings.update().where(listings.c.id == listing_id).values(primary_image_url=image_url)
+        )
+        listing = session.identity_map.get(db.inspect(Listing).identity_key_from_primary_key((listing_id,)))
+        if listing is not None:
+            set_committed_value(listing, 'primary_image_url', image_url)
 
 # Cancellation Policy Model
 class CancellationPolicy(db.Model):
@@ -123,11 +203,11 @@ class CancellationPolicy(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
     description = db.Column(db.Text)
-    penalty_percentage = db.Column(db.Numeric(5, 2), default=0.00)
-    effective_duration_hours = db.Column(db.Integer, default=24)
-    is_active = db.Column(db.Boolean, default=True)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    penalty_percentage = db.Column(db.Numeric(5, 2), default=0.00, server_default='0')
+    effective_duration_hours = db.Column(db.Integer, default=24, server_default='24')
+    is_active = db.Column(db.Boolean, default=True, server_default=db.true())
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, server_default=db.text('CURRENT_TIMESTAMP'))
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, server_default=db.text('CURRENT_TIMESTAMP'), onupdate=datetime.utcnow)
     
     # Relationships
     bookings = db.relationship('Booking', backref='cancellation_policy', lazy=True)
@@ -137,23 +217,31 @@ class Booking(db.Model):
     __tablename__ = 'bookings'
     
     id = db.Column(db.Integer, primary_key=True)
-    listing_id = db.Column(db.Integer, db.ForeignKey('listings.id'), nullable=False)
-    renter_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    listing_id = db.Column(db.Integer, db.ForeignKey('listings.id', ondelete='CASCADE'), nullable=False)
+    renter_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
     start_date = db.Column(db.Date, nullable=False)
     end_date = db.Column(db.Date, nullable=False)
     total_amount = db.Column(db.Numeric(10, 2), nullable=False)
-    security_deposit = db.Column(db.Numeric(10, 2), default=0.00)
-    service_fee = db.Column(db.Numeric(10, 2), default=0.00)
-    status = db.Column(db.Enum('pending', 'confirmed', 'cancelled', 'completed', 'disputed', name='booking_status'), default='pending')
-    payment_status = db.Column(db.Enum('pending', 'paid', 'refunded', 'partial_refund', name='payment_status'), default='pending')
-    cancellation_policy_id = db.Column(db.Integer, db.ForeignKey('cancellation_policies.id'))
+    security_deposit = db.Column(db.Numeric(10, 2), default=0.00, server_default='0')
+    service_fee = db.Column(db.Numeric(10, 2), default=0.00, server_default='0')
+    status = db.Column(db.Enum('pending', 'confirmed', 'cancelled', 'completed', 'disputed', name='booking_status'), default='pending', server_default='pending')
+    payment_status = db.Column(db.Enum('pending', 'paid', 'refunded', 'partial_refund', name='payment_status'), default='pending', server_default='pending')
+    cancellation_policy_id = db.Column(db.Integer, db.ForeignKey('cancellation_policies.id', ondelete='SET NULL'))
     cancellation_reason = db.Column(db.Text)
     cancellation_date = db.Column(db.DateTime)
     special_requests = db.Column(db.Text)
     owner_notes = db.Column(db.Text)
     renter_notes = db.Column(db.Text)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, server_default=db.text('CURRENT_TIMESTAMP'))
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, server_default=db.text('CURRENT_TIMESTAMP'), onupdate=datetime.utcnow)
+    
+    __table_args__ = (
+        db.Index('idx_bookings_listing_status_dates', 'listing_id', 'status', 'start_date', 'end_date'),  # availability checks
+        db.Index('idx_bookings_renter', 'renter_id', 'updated_at'),
+        db.Index('idx_bookings_status', 'status'),
+        db.Index('idx_bookings_payment_status', 'payment_status'),
+        db.Index('idx_bookings_dates', 'start_date', 'end_date'),
+    )
     
     # Relationships
     payments = db.relationship('Payment', backref='booking', lazy=True)
@@ -166,14 +254,20 @@ class PaymentMethod(db.Model):
     __tablename__ = 'payment_methods'
     
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
     type = db.Column(db.Enum('card', 'upi', 'netbanking', 'wallet', name='payment_type'), nullable=False)
     provider = db.Column(db.String(50), nullable=False)
     account_details = db.Column(db.JSON)
-    is_default = db.Column(db.Boolean, default=False)
-    is_active = db.Column(db.Boolean, default=True)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    is_default = db.Column(db.Boolean, default=False, server_default=db.false())
+    is_active = db.Column(db.Boolean, default=True, server_default=db.true())
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, server_default=db.text('CURRENT_TIMESTAMP'))
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, server_default=db.text('CURRENT_TIMESTAMP'), onupdate=datetime.utcnow)
+    
+    __table_args__ = (
+        db.Index('idx_payment_methods_user', 'user_id'),
+        db.Index('idx_payment_methods_type', 'type'),
+        db.Index('idx_payment_methods_active', 'is_active'),
+    )
     
     # Relationships
     payments = db.relationship('Payment', backref='payment_method', lazy=True)
@@ -183,38 +277,54 @@ class Payment(db.Model):
     __tablename__ = 'payments'
     
     id = db.Column(db.Integer, primary_key=True)
-    booking_id = db.Column(db.Integer, db.ForeignKey('bookings.id'), nullable=False)
-    payment_method_id = db.Column(db.Integer, db.ForeignKey('payment_methods.id'))
+    booking_id = db.Column(db.Integer, db.ForeignKey('bookings.id', ondelete='CASCADE'), nullable=False)
+    payment_method_id = db.Column(db.Integer, db.ForeignKey('payment_methods.id', ondelete='SET NULL'))
     amount = db.Column(db.Numeric(10, 2), nullable=False)
-    currency = db.Column(db.String(3), default='INR')
+    currency = db.Column(db.String(3), default='INR', server_default='INR')
     transaction_id = db.Column(db.String(100), unique=True)
     gateway_transaction_id = db.Column(db.String(100))
     gateway_response = db.Column(db.JSON)
-    status = db.Column(db.Enum('pending', 'success', 'failed', 'refunded', 'partial_refund', name='payment_status'), default='pending')
-    payment_type = db.Column(db.Enum('booking', 'deposit', 'refund', 'penalty', name='payment_type'), default='booking')
+    status = db.Column(db.Enum('pending', 'success', 'failed', 'refunded', 'partial_refund', name='payment_status'), default='pending', server_default='pending')
+    payment_type = db.Column(db.Enum('booking', 'deposit', 'refund', 'penalty', name='payment_type'), default='booking', server_default='booking')
     failure_reason = db.Column(db.Text)
     processed_at = db.Column(db.DateTime)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, server_default=db.text('CURRENT_TIMESTAMP'))
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, server_default=db.text('CURRENT_TIMESTAMP'), onupdate=datetime.utcnow)
+    
+    __table_args__ = (
+        db.Index('idx_payments_booking', 'booking_id'),
+        db.Index('idx_payments_status', 'status'),
+        db.Index('idx_payments_type', 'payment_type'),
+    )
 
 # Enhanced Review Model
 class Review(db.Model):
     __tablename__ = 'reviews'
     
     id = db.Column(db.Integer, primary_key=True)
-    listing_id = db.Column(db.Integer, db.ForeignKey('listings.id'), nullable=False)
-    booking_id = db.Column(db.Integer, db.ForeignKey('bookings.id'), unique=True)
-    reviewer_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
-    reviewee_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    listing_id = db.Column(db.Integer, db.ForeignKey('listings.id', ondelete='CASCADE'), nullable=False)
+    booking_id = db.Column(db.Integer, db.ForeignKey('bookings.id', ondelete='SET NULL'))
+    reviewer_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
+    reviewee_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
     rating = db.Column(db.Integer, nullable=False)
     comment = db.Column(db.Text)
-    is_verified = db.Column(db.Boolean, default=False)
-    is_flagged = db.Column(db.Boolean, default=False)
+    is_verified = db.Column(db.Boolean, default=False, server_default=db.false())
+    is_flagged = db.Column(db.Boolean, default=False, server_default=db.false())
     flag_reason = db.Column(db.Text)
     response = db.Column(db.Text)
     response_date = db.Column(db.DateTime)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, server_default=db.text('CURRENT_TIMESTAMP'))
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, server_default=db.text('CURRENT_TIMESTAMP'), onupdate=datetime.utcnow)
+    
+    __table_args__ = (
+        db.UniqueConstraint('booking_id', name='unique_booking_review'),
+        db.CheckConstraint('rating >= 1 AND rating <= 5', name='ck_review_rating'),
+        db.Index('idx_reviews_listing', 'listing_id', 'created_at', 'id'),
+        db.Index('idx_reviews_reviewer', 'reviewer_id'),
+        db.Index('idx_reviews_reviewee', 'reviewee_id'),
+        db.Index('idx_reviews_rating', 'rating'),
+        db.Index('idx_reviews_verified', 'is_verified'),
+    )
     
     def __init__(self, **kwargs):
         if 'rating' in kwargs:
@@ -226,39 +336,87 @@ class Message(db.Model):
     __tablename__ = 'messages'
     
     id = db.Column(db.Integer, primary_key=True)
-    sender_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
-    receiver_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
-    booking_id = db.Column(db.Integer, db.ForeignKey('bookings.id'))
+    sender_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
+    receiver_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
+    booking_id = db.Column(db.Integer, db.ForeignKey('bookings.id', ondelete='SET NULL'))
+    conversation_id = db.Column(db.Integer, db.ForeignKey('conversations.id', ondelete='CASCADE'))
     subject = db.Column(db.String(200))
     message = db.Column(db.Text, nullable=False)
-    is_read = db.Column(db.Boolean, default=False)
+    is_read = db.Column(db.Boolean, default=False, server_default=db.false())
     read_at = db.Column(db.DateTime)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, server_default=db.text('CURRENT_TIMESTAMP'))
+    
+    __table_args__ = (
+        db.Index('idx_conversation', 'conversation_id', 'created_at', 'id'),
+        db.Index('idx_messages_sender', 'sender_id'),
+        db.Index('idx_messages_receiver', 'receiver_id', 'is_read'),
+        db.Index('idx_messages_booking', 'booking_id'),
+        db.Index('idx_messages_read', 'is_read'),
+        db.Index('idx_messages_created', 'created_at'),
+    )
+
+# Conversation Model (a message thread between two users, optionally about one booking)
+class Conversation(db.Model):
+    __tablename__ = 'conversations'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    thread_key = db.Column(db.String(64), unique=True, nullable=False)  # "low:high:booking", see conversations.py
+    user_low_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
+    user_high_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
+    booking_id = db.Column(db.Integer, db.ForeignKey('bookings.id', ondelete='SET NULL'))
+    last_message_id = db.Column(db.Integer)  # Maintained by conversations.py; no FK, messages already point here
+    last_message_at = db.Column(db.DateTime)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, server_default=db.text('CURRENT_TIMESTAMP'))
+    
+    user_low = db.relationship('User', foreign_keys=[user_low_id])
+    user_high = db.relationship('User', foreign_keys=[user_high_id])
+    last_message = db.relationship('Message', primaryjoin='foreign(Conversation.last_message_id) == Message.id',
+                                   viewonly=True)
+    
+    __table_args__ = (
+        db.Index('idx_low_inbox', 'user_low_id', 'last_message_at', 'id'),
+        db.Index('idx_high_inbox', 'user_high_id', 'last_message_at', 'id'),
+        db.Index('idx_conversations_booking', 'booking_id'),
+    )
+    
+    def other_user(self, user_id):
+        return self.user_high if user_id == self.user_low_id else self.user_low
 
 # Notification Model
 class Notification(db.Model):
     __tablename__ = 'notifications'
     
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
     type = db.Column(db.Enum('booking', 'payment', 'message', 'review', 'system', name='notification_type'), nullable=False)
     title = db.Column(db.String(200), nullable=False)
     message = db.Column(db.Text, nullable=False)
     data = db.Column(db.JSON)
-    is_read = db.Column(db.Boolean, default=False)
+    is_read = db.Column(db.Boolean, default=False, server_default=db.false())
     read_at = db.Column(db.DateTime)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, server_default=db.text('CURRENT_TIMESTAMP'))
+    
+    __table_args__ = (
+        db.Index('idx_notifications_user', 'user_id', 'is_read'),
+        db.Index('idx_notifications_user_created', 'user_id', 'created_at', 'id'),
+        db.Index('idx_notifications_type', 'type'),
+        db.Index('idx_notifications_read', 'is_read'),
+        db.Index('idx_notifications_created', 'created_at'),
+    )
 
 # Wishlist Model
 class Wishlist(db.Model):
     __tablename__ = 'wishlists'
     
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
-    listing_id = db.Column(db.Integer, db.ForeignKey('listings.id'), nullable=False)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    
-    __table_args__ = (db.UniqueConstraint('user_id', 'listing_id', name='unique_user_listing'),)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
+    listing_id = db.Column(db.Integer, db.ForeignKey('listings.id', ondelete='CASCADE'), nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, server_default=db.text('CURRENT_TIMESTAMP'))
+    
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'listing_id', name='unique_user_listing'),
+        db.Index('idx_wishlists_listing', 'listing_id'),
+    )
 
 # Coupon Model
 class Coupon(db.Model):
@@ -270,15 +428,20 @@ class Coupon(db.Model):
     description = db.Column(db.Text)
     type = db.Column(db.Enum('percentage', 'fixed', name='coupon_type'), nullable=False)
     value = db.Column(db.Numeric(10, 2), nullable=False)
-    min_amount = db.Column(db.Numeric(10, 2), default=0.00)
+    min_amount = db.Column(db.Numeric(10, 2), default=0.00, server_default='0')
     max_discount = db.Column(db.Numeric(10, 2))
     usage_limit = db.Column(db.Integer)
-    used_count = db.Column(db.Integer, default=0)
+    used_count = db.Column(db.Integer, default=0, server_default='0')
     valid_from = db.Column(db.DateTime, nullable=False)
     valid_until = db.Column(db.DateTime, nullable=False)
-    is_active = db.Column(db.Boolean, default=True)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    is_active = db.Column(db.Boolean, default=True, server_default=db.true())
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, server_default=db.text('CURRENT_TIMESTAMP'))
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, server_default=db.text('CURRENT_TIMESTAMP'), onupdate=datetime.utcnow)
+    
+    __table_args__ = (
+        db.Index('idx_coupons_active', 'is_active'),
+        db.Index('idx_coupons_validity', 'valid_from', 'valid_until'),
+    )
     
     # Relationships
     usage = db.relationship('CouponUsage', backref='coupon', lazy=True)
@@ -288,20 +451,43 @@ class CouponUsage(db.Model):
     __tablename__ = 'coupon_usage'
     
     id = db.Column(db.Integer, primary_key=True)
-    coupon_id = db.Column(db.Integer, db.ForeignKey('coupons.id'), nullable=False)
-    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
-    booking_id = db.Column(db.Integer, db.ForeignKey('bookings.id'), nullable=False)
+    coupon_id = db.Column(db.Integer, db.ForeignKey('coupons.id', ondelete='CASCADE'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
+    booking_id = db.Column(db.Integer, db.ForeignKey('bookings.id', ondelete='CASCADE'), nullable=False)
     discount_amount = db.Column(db.Numeric(10, 2), nullable=False)
-    used_at = db.Column(db.DateTime, default=datetime.utcnow)
+    used_at = db.Column(db.DateTime, default=datetime.utcnow, server_default=db.text('CURRENT_TIMESTAMP'))
     
-    __table_args__ = (db.UniqueConstraint('booking_id', 'coupon_id', name='unique_booking_coupon'),)
+    __table_args__ = (
+        db.UniqueConstraint('booking_id', 'coupon_id', name='unique_booking_coupon'),
+        db.Index('idx_coupon_usage_coupon', 'coupon_id'),
+        db.Index('idx_coupon_usage_user', 'user_id'),
+    )
+
+# Owner Earnings Summary Model (maintained by earnings.py)
+class OwnerEarningsSummary(db.Model):
+    __tablename__ = 'owner_earnings_summary'
+    
+    owner_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), primary_key=True)
+    listing_id = db.Column(db.Integer, db.ForeignKey('listings.id', ondelete='CASCADE'), primary_key=True)
+    month = db.Column(db.Date, primary_key=True)  # First day of the booking's start month
+    status = db.Column(db.String(20), primary_key=True)  # Booking status
+    bookings_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    gross_amount = db.Column(db.Numeric(12, 2), nullable=False, default=0, server_default='0')
+    paid_amount = db.Column(db.Numeric(12, 2), nullable=False, default=0, server_default='0')
+    refunded_amount = db.Column(db.Numeric(12, 2), nullable=False, default=0, server_default='0')
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, server_default=db.text('CURRENT_TIMESTAMP'), onupdate=datetime.utcnow)
+    
+    __table_args__ = (
+        db.Index('idx_owner_earnings_summary_owner_month', 'owner_id', 'month'),
+        db.Index('idx_owner_earnings_summary_listing', 'listing_id'),
+    )
 
 # Audit Log Model
 class AuditLog(db.Model):
     __tablename__ = 'audit_logs'
     
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('users.id'))
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='SET NULL'))
     action = db.Column(db.String(100), nullable=False)
     table_name = db.Column(db.String(50))
     record_id = db.Column(db.Integer)
@@ -309,28 +495,27 @@ class AuditLog(db.Model):
     new_values = db.Column(db.JSON)
     ip_address = db.Column(db.String(45))
     user_agent = db.Column(db.Text)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, server_default=db.text('CURRENT_TIMESTAMP'))
+    
+    __table_args__ = (
+        db.Index('idx_audit_logs_user', 'user_id'),
+        db.Index('idx_audit_logs_action', 'action'),
+        db.Index('idx_audit_logs_table', 'table_name'),
+        db.Index('idx_audit_logs_created', 'created_at'),
+    )
+
+# Schema Migration Model (one row per migration applied by schema.py)
+class SchemaMigration(db.Model):
+    __tablename__ = 'schema_migrations'
+    
+    version = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    name = db.Column(db.String(100), nullable=False)
+    applied_at = db.Column(db.DateTime, default=datetime.utcnow, server_default=db.text('CURRENT_TIMESTAMP'))
 
 # Helper functions
 def get_primary_image(listing):
     """Get the primary image for a listing"""
-    primary_image = ListingImage.query.filter_by(
-        listing_id=listing.id, 
-        is_primary=True
-    ).first()
-    
-    if primary_image:
-        return primary_image.image_url
-    
-    # Fallback to first image
-    first_image = ListingImage.query.filter_by(
-        listing_id=listing.id
-    ).order_by(ListingImage.sort_order).first()
-    
-    if first_image:
-        return first_image.image_url
-    
-    return '/static/images/placeholder.jpg'
+    return listing.primary_image_url or '/static/images/placeholder.jpg'
 
 def calculate_booking_total(listing, start_date, end_date, coupon_code=None):
     """Calculate total booking amount including fees and discounts"""
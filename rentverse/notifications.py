@@ -0,0 +1,268 @@
+"""
+RentAssured Notifications
+In-process job queue that turns booking events into Notification rows and deliveries
+"""
+
+import atexit
+import heapq
+import itertools
+import queue
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime
+
+from werkzeug.utils import import_string
+
+from models_advanced import db, Notification
+from process_local import ProcessLocal
+from unread import apply_unread_deltas, invalidate_badges
+
+# Event type -> function(payload) returning notification dicts for that event
+EVENT_BUILDERS = {}
+
+
+def event_builder(event_type):
+    """Register the function that turns one event into notifications"""
+    def decorator(builder):
+        EVENT_BUILDERS[event_type] = builder
+        return builder
+    return decorator
+
+
+def _notification(user_id, type, title, message, **data):
+    return {'user_id': user_id, 'type': type, 'title': title, 'message': message, 'data': data}
+
+
+@event_builder('booking_created')
+def _booking_created(event):
+    dates = f"{event['start_date']} to {event['end_date']}"
+    return [
+        _notification(event['owner_id'], 'booking', 'New booking request',
+                      f"{event['renter_name']} requested {event['listing_title']} for {dates}.",
+                      booking_id=event['booking_id'], listing_id=event['listing_id']),
+        _notification(event['renter_id'], 'booking', 'Booking request sent',
+                      f"Your request for {event['listing_title']} ({dates}) is awaiting the owner.",
+                      booking_id=event['booking_id'], listing_id=event['listing_id']),
+    ]
+
+
+@event_builder('booking_cancelled')
+def _booking_cancelled(event):
+    by_renter = event['cancelled_by'] == event['renter_id']
+    other = event['owner_id'] if by_renter else event['renter_id']
+    return [
+        _notification(other, 'booking', 'Booking cancelled',
+                      f"The booking for {event['listing_title']} starting {event['start_date']} was cancelled "
+                      f"by the {'renter' if by_renter else 'owner'}: {event['reason']}",
+                      booking_id=event['booking_id'], listing_id=event['listing_id']),
+        _notification(event['cancelled_by'], 'booking', 'Cancellation confirmed',
+                      f"You cancelled the booking for {event['listing_title']} starting {event['start_date']}.",
+                      booking_id=event['booking_id'], listing_id=event['listing_id']),
+    ]
+
+
+@event_builder('refund_issued')
+def _refund_issued(event):
+    return [
+        _notification(event['renter_id'], 'payment', 'Refund issued',
+                      f"A refund of ₹{event['amount']:.2f} for {event['listing_title']} is on its way.",
+                      booking_id=event['booking_id'], amount=event['amount']),
+    ]
+
+
+class NotificationQueue:
+    """Bounded queue of events drained by worker threads
+
+    Requests only call publish(); workers group queued events into batches,
+    insert one batch of Notification rows per round trip, then hand each
+    notification to the delivery handlers (email, SMS, push). A handler that
+    raises is retried with exponential backoff without blocking new events.
+    Events still queued when a worker is killed without running its exit
+    hooks are lost.
+    """
+
+    def __init__(self, workers=2, batch_size=100, max_queue=10000, max_retries=3, retry_backoff=2.0):
+        self.workers = workers
+        self.batch_size = batch_size
+        self.max_queue = max_queue
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.app = None
+        self.handlers = []
+        self._lock = threading.Lock()
+        self._queue = None
+        self._threads = []
+        self._workers = ProcessLocal(self._start_workers)
+        self._stopping = False
+        self._retries = []  # heap of (due, seq, handler, notification, attempt)
+        self._seq = itertools.count()
+
+    def init_app(self, app):
+        self.app = app
+        self.workers = app.config.get('NOTIFICATION_WORKERS', self.workers)
+        self.batch_size = app.config.get('NOTIFICATION_BATCH_SIZE', self.batch_size)
+        self.max_queue = app.config.get('NOTIFICATION_QUEUE_SIZE', self.max_queue)
+        self.max_retries = app.config.get('NOTIFICATION_MAX_RETRIES', self.max_retries)
+        self.retry_backoff = app.config.get('NOTIFICATION_RETRY_BACKOFF', self.retry_backoff)
+        for path in app.config.get('NOTIFICATION_DELIVERY_HANDLERS', ()):
+            self.handler(import_string(path))
+        app.extensions['notification_queue'] = self
+        atexit.register(self.shutdown)
+
+    def handler(self, fn):
+        """Register a delivery handler: fn(notification_dict), raising on failure"""
+        if fn not in self.handlers:
+            self.handlers.append(fn)
+        return fn
+
+    def publish(self, event_type, **event):
+        """Queue an event; never touches the database. Returns False if it was dropped"""
+        if event_type not in EVENT_BUILDERS:
+            raise ValueError(f'Unknown notification event: {event_type}')
+        self._workers.get()
+        try:
+            self._queue.put_nowait((event_type, event))
+        except queue.Full:
+            print(f"Notification queue full, dropping {event_type} event")
+            return False
+        return True
+
+    def _start_workers(self):
+        self._stopping = False
+        self._queue = queue.Queue(self.max_queue)
+        self._retries = []
+        self._threads = [threading.Thread(target=self._run, name=f'notifications-{n}', daemon=True)
+                         for n in range(self.workers)]
+        for thread in self._threads:
+            thread.start()
+        return self._threads
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            if batch:
+                self._process(batch)
+            self._run_due_retries()
+
+    def _next_batch(self):
+        """Block for one event (or the next retry), then take whatever else is already queued"""
+        with self._lock:
+            wait = self._retries[0][0] - time.monotonic() if self._retries else 1.0
+        try:
+            item = self._queue.get(timeout=min(max(wait, 0.01), 1.0))
+        except queue.Empty:
+            return None if self._stopping else []
+        if item is None:
+            self._queue.task_done()
+            return None
+        batch = [item]
+        while len(batch) < self.batch_size:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                self._queue.put(None)  # leave the stop signal for this worker's next round
+                self._queue.task_done()
+                break
+            batch.append(item)
+        return batch
+
+    def _process(self, batch):
+        rows = []
+        for event_type, event in batch:
+            try:
+                rows.extend(EVENT_BUILDERS[event_type](event))
+            except Exception as e:
+                print(f"Could not build notifications for {event_type} event: {e}")
+        try:
+            if rows:
+                now = datetime.utcnow()
+                unread = defaultdict(int)
+                for row in rows:
+                    unread[row['user_id']] += 1
+                with self.app.app_context():
+                    db.session.execute(Notification.__table__.insert(),
+                                       [dict(row, is_read=False, created_at=now) for row in rows])
+                    apply_unread_deltas(db.session.connection(),
+                                        {user_id: {'unread_notifications': count} for user_id, count in unread.items()})
+                    db.session.commit()
+                invalidate_badges(*unread)
+        except Exception as e:
+            print(f"Failed to store {len(rows)} notifications: {e}")
+            rows = []
+        finally:
+            for _ in batch:
+                self._queue.task_done()
+        for notification in rows:
+            for handler in self.handlers:
+                self._deliver(handler, notification, 1)
+
+    def _deliver(self, handler, notification, attempt):
+        try:
+            handler(notification)
+        except Exception as e:
+            if attempt > self.max_retries:
+                print(f"Giving up delivering notification to user {notification['user_id']} "
+                      f"via {handler.__name__} after {attempt} attempts: {e}")
+                return
+            due = time.monotonic() + self.retry_backoff * 2 ** (attempt - 1)
+            with self._lock:
+                heapq.heappush(self._retries, (due, next(self._seq), handler, notification, attempt + 1))
+
+    def _run_due_retries(self):
+        now = time.monotonic()
+        while True:
+            with self._lock:
+                if not self._retries or self._retries[0][0] > now:
+                    return
+                _, _, handler, notification, attempt = heapq.heappop(self._retries)
+            self._deliver(handler, notification, attempt)
+
+    def wait_idle(self, timeout=None):
+        """Block until every queued event has been stored and delivered once"""
+        if not self._workers.started():
+            return
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._queue.all_tasks_done:
+            while self._queue.unfinished_tasks:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return
+                self._queue.all_tasks_done.wait(remaining)
+
+    def shutdown(self, timeout=5):
+        """Let workers store what is queued, then stop them"""
+        if not self._workers.started():
+            return
+        self._stopping = True
+        for _ in self._threads:
+            try:
+                self._queue.put(None, timeout=timeout)
+            except queue.Full:
+                break
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+        self._workers.reset()
+
+
+notification_queue = NotificationQueue()
+
+
+def booking_event(booking, **extra):
+    """Event payload for a booking, from objects the request already loaded"""
+    listing = booking.listing
+    return dict(
+        booking_id=booking.id,
+        listing_id=booking.listing_id,
+        listing_title=listing.title,
+        owner_id=listing.owner_id,
+        renter_id=booking.renter_id,
+        start_date=booking.start_date.isoformat(),
+        end_date=booking.end_date.isoformat(),
+        **extra
+    )
@@ -0,0 +1,172 @@
+"""
+RentAssured Pagination
+Keyset (cursor) pagination with opaque cursors and cached totals
+"""
+
+import base64
+import json
+import threading
+import time
+from collections import OrderedDict
+from datetime import date, datetime
+from decimal import Decimal, InvalidOperation
+
+from sqlalchemy import and_, literal, or_
+
+
+class InvalidCursor(ValueError):
+    """Raised for a cursor this module did not produce; callers should answer 400"""
+
+
+def encode_cursor(payload):
+    """Turn a JSON-serialisable payload into an opaque URL-safe cursor"""
+    raw = json.dumps(payload, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Reverse encode_cursor, returning None for missing or malformed cursors"""
+    if not cursor:
+        return None
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    except (ValueError, TypeError):
+        return None
+    return payload if isinstance(payload, dict) else None
+
+
+def _dump_value(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, bool):
+        return int(value)
+    if isinstance(value, Decimal):
+        return str(value)
+    return value
+
+
+def _load_value(column, value):
+    python_type = column.type.python_type
+    if python_type is datetime:
+        return datetime.fromisoformat(value)
+    if python_type is date:
+        return date.fromisoformat(value)
+    return python_type(value)
+
+
+def _after(columns, values, descending):
+    """Filter for rows strictly past `values` in (descending) column order"""
+    # Bind values with the column type; plain True/False only allow = and !=
+    values = [literal(value, column.type) for column, value in zip(columns, values)]
+    clauses = []
+    for i, column in enumerate(columns):
+        equal_prefix = [columns[j] == values[j] for j in range(i)]
+        past = column < values[i] if descending else column > values[i]
+        clauses.append(and_(*equal_prefix, past))
+    return or_(*clauses)
+
+
+class KeysetPage:
+    """One page of a keyset-paginated query"""
+
+    def __init__(self, items, next_cursor=None, prev_cursor=None, total=None):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+        self.has_next = next_cursor is not None
+        self.has_prev = prev_cursor is not None
+        self.total = total
+
+
+def keyset_paginate(query, columns, per_page, cursor=None, total=None):
+    """Fetch one page of `query` ordered by `columns`, all descending
+
+    `columns` must end with a unique column (normally the primary key) so
+    every row has a distinct position. `cursor` is one this function
+    produced; it points either after the previous page's last row or before
+    the next page's first row. Each page costs a single indexed range scan,
+    however deep it is. Any other cursor raises InvalidCursor.
+    """
+    state = decode_cursor(cursor)
+    if cursor and state is None:
+        raise InvalidCursor(cursor)
+    state = state or {}
+    direction = state.get('d', 'next')
+    values = state.get('k')
+
+    descending = direction == 'next'
+    if values is not None:
+        if (not isinstance(values, list) or len(values) != len(columns)
+                or not all(isinstance(value, (str, int, float)) for value in values)):
+            raise InvalidCursor(cursor)
+        try:
+            values = [_load_value(column, value) for column, value in zip(columns, values)]
+        except (TypeError, ValueError, InvalidOperation):
+            raise InvalidCursor(cursor) from None
+        query = query.filter(_after(columns, values, descending))
+
+    order = [column.desc() if descending else column.asc() for column in columns]
+    rows = query.order_by(*order).limit(per_page + 1).all()
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+    if not descending:
+        rows.reverse()
+
+    def position(row):
+        return [_dump_value(getattr(row, column.key)) for column in columns]
+
+    next_cursor = prev_cursor = None
+    if rows:
+        if has_more or not descending:
+            next_cursor = encode_cursor({'d': 'next', 'k': position(rows[-1])})
+        if values is not None and (descending or has_more):
+            prev_cursor = encode_cursor({'d': 'prev', 'k': position(rows[0])})
+
+    return KeysetPage(rows, next_cursor=next_cursor, prev_cursor=prev_cursor, total=total)
+
+
+class RankedPage(KeysetPage):
+    """Page over an in-memory ranked id list, with offset cursors"""
+
+    def __init__(self, items, offset, per_page, total, has_next):
+        next_cursor = encode_cursor({'o': offset + per_page}) if has_next else None
+        prev_cursor = encode_cursor({'o': max(offset - per_page, 0)}) if offset > 0 else None
+        super().__init__(items, next_cursor=next_cursor, prev_cursor=prev_cursor, total=total)
+
+    @staticmethod
+    def offset_from(cursor):
+        state = decode_cursor(cursor) or {}
+        offset = state.get('o', 0)
+        return offset if isinstance(offset, int) and offset > 0 else 0
+
+
+class CountCache:
+    """Short-lived cache of COUNT(*) results keyed by the compiled query"""
+
+    def __init__(self, ttl=60, max_entries=512):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def count(self, query):
+        compiled = query.statement.compile()
+        key = str(compiled) + repr(sorted(compiled.params.items()))
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and now - entry[1] < self.ttl:
+                self._entries.move_to_end(key)
+                return entry[0]
+
+        total = query.order_by(None).count()
+        with self._lock:
+            self._entries[key] = (total, now)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return total
+
+
+count_cache = CountCache()
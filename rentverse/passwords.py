@@ -0,0 +1,146 @@
+"""
+RentAssured Passwords
+Bcrypt hashing on a bounded worker pool, and login attempt throttling
+"""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+import bcrypt
+
+from cache import cache
+from process_local import ProcessLocal
+
+# bcrypt only reads the first 72 bytes; older hashes were made from the truncated value
+BCRYPT_MAX_BYTES = 72
+
+
+class PasswordHashBusy(Exception):
+    """Raised when the hashing pool is saturated; callers should answer 503"""
+
+
+class PasswordHasher:
+    """Runs bcrypt on a small thread pool with a bounded backlog
+
+    bcrypt releases the GIL, so at most `workers` hashes run at once per
+    process no matter how many requests arrive. Requests beyond `workers +
+    max_pending` are rejected immediately instead of queueing behind a login
+    storm and holding every web thread.
+    """
+
+    def __init__(self, rounds=12, workers=2, max_pending=16, timeout=5):
+        self.rounds = rounds
+        self.workers = workers
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self._pool = ProcessLocal(self._build_pool)
+        self._dummy_hash = None
+
+    def init_app(self, app):
+        self.rounds = app.config.get('BCRYPT_LOG_ROUNDS', self.rounds)
+        self.workers = app.config.get('PASSWORD_HASH_WORKERS', self.workers)
+        self.max_pending = app.config.get('PASSWORD_HASH_MAX_PENDING', self.max_pending)
+        self.timeout = app.config.get('PASSWORD_HASH_TIMEOUT', self.timeout)
+        self._pool.reset()
+        self._dummy_hash = None
+        app.extensions['password_hasher'] = self
+
+    def _build_pool(self):
+        slots = threading.BoundedSemaphore(self.workers + self.max_pending)
+        return ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='password-hash'), slots
+
+    def _run(self, fn, *args):
+        executor, slots = self._pool.get()
+        if not slots.acquire(blocking=False):
+            raise PasswordHashBusy()
+        try:
+            future = executor.submit(fn, *args)
+        except Exception:
+            slots.release()
+            raise
+        future.add_done_callback(lambda _: slots.release())
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            raise PasswordHashBusy()
+
+    @staticmethod
+    def _encode(password):
+        return (password or '').encode('utf-8')[:BCRYPT_MAX_BYTES]
+
+    def hash(self, password):
+        """bcrypt hash of `password` at the configured cost"""
+        salt = bcrypt.gensalt(self.rounds)
+        return self._run(bcrypt.hashpw, self._encode(password), salt).decode('utf-8')
+
+    def verify(self, password_hash, password):
+        """Check `password`; a missing hash still costs one hash so unknown emails are not faster"""
+        if not password_hash:
+            if self._dummy_hash is None:
+                self._dummy_hash = self.hash('not-a-password').encode('utf-8')
+            self._run(bcrypt.checkpw, self._encode(password), self._dummy_hash)
+            return False
+        try:
+            return self._run(bcrypt.checkpw, self._encode(password), password_hash.encode('utf-8'))
+        except ValueError:
+            return False  # not a bcrypt hash
+
+    def needs_rehash(self, password_hash):
+        """True when the stored hash was made with a different cost than configured"""
+        try:
+            return int(password_hash.split('$')[2]) != self.rounds
+        except (AttributeError, IndexError, ValueError):
+            return True
+
+
+password_hasher = PasswordHasher()
+
+
+class LoginThrottle:
+    """Fixed-window failure counters per client IP and per email
+
+    Counters live in the shared cache, so with the Redis backend the limits
+    hold across all workers. The per-IP limit stops credential spraying over
+    many accounts; the per-email limit stops guessing one account from many
+    addresses.
+    """
+
+    def __init__(self, window=900, max_per_ip=50, max_per_email=10):
+        self.window = window
+        self.max_per_ip = max_per_ip
+        self.max_per_email = max_per_email
+
+    def init_app(self, app):
+        self.window = app.config.get('LOGIN_THROTTLE_WINDOW', self.window)
+        self.max_per_ip = app.config.get('LOGIN_MAX_FAILURES_PER_IP', self.max_per_ip)
+        self.max_per_email = app.config.get('LOGIN_MAX_FAILURES_PER_EMAIL', self.max_per_email)
+        app.extensions['login_throttle'] = self
+
+    def _keys(self, ip, email):
+        bucket = int(time.time() // self.window)
+        keys = []
+        if ip:
+            keys.append((f'login:fail:ip:{ip}:{bucket}', self.max_per_ip))
+        if email:
+            keys.append((f'login:fail:email:{email.lower()}:{bucket}', self.max_per_email))
+        return keys
+
+    def retry_after(self, ip, email):
+        """Seconds until the client may try again, or 0 if it is not throttled"""
+        for key, limit in self._keys(ip, email):
+            if int(cache.get(key) or 0) >= limit:
+                return int(self.window - time.time() % self.window) + 1
+        return 0
+
+    def failure(self, ip, email):
+        for key, _ in self._keys(ip, email):
+            cache.add(key, 0, self.window)  # start the window with an expiry before counting
+            cache.incr(key)
+
+    def success(self, email):
+        if email:
+            cache.delete(*[key for key, _ in self._keys(None, email)])
+
+
+login_throttle = LoginThrottle()
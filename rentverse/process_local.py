@@ -0,0 +1,41 @@
+"""
+RentAssured Process Local
+Background threads and pools started lazily, once per worker process
+"""
+
+import os
+import threading
+
+
+class ProcessLocal:
+    """Value built by `factory` on first use in each process
+
+    Threads do not survive fork: a pool or thread the gunicorn master started
+    before forking is dead in every worker. Building on first use, and again
+    whenever the pid changes, gives each worker process its own.
+    """
+
+    def __init__(self, factory):
+        self._factory = factory
+        self._lock = threading.Lock()
+        self._value = None
+        self._pid = None
+
+    def get(self):
+        if self._pid == os.getpid():
+            return self._value
+        with self._lock:
+            if self._pid != os.getpid():
+                self._value = self._factory()
+                self._pid = os.getpid()
+            return self._value
+
+    def started(self):
+        """Whether this process has built its value"""
+        return self._pid == os.getpid()
+
+    def reset(self):
+        """Forget the value, so the next get() builds a new one"""
+        with self._lock:
+            self._value = None
+            self._pid = None
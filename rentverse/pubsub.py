@@ -0,0 +1,85 @@
+"""
+RentAssured Publish/Subscribe
+In-process message bus that wakes long-poll and streaming requests
+"""
+
+import queue
+import threading
+from collections import defaultdict
+
+
+class Subscription:
+    """Queue of messages published to a set of channels
+
+    A subscriber that falls more than `max_pending` messages behind loses
+    the newest ones and gets `missed` set, so it knows to re-read from the
+    database instead of trusting the stream.
+    """
+
+    def __init__(self, bus, channels, max_pending):
+        self.bus = bus
+        self.channels = channels
+        self.missed = False
+        self._queue = queue.Queue(max_pending)
+
+    def _put(self, channel, message):
+        try:
+            self._queue.put_nowait((channel, message))
+        except queue.Full:
+            self.missed = True
+
+    def get(self, timeout=None):
+        """Next (channel, message), or None after `timeout` seconds"""
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self):
+        self.bus._unsubscribe(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class PubSub:
+    """Channel name -> subscriptions, for this process only
+
+    Other workers never see these messages, so subscribers must also re-check
+    the database now and then; the bus only makes same-worker updates instant.
+    """
+
+    def __init__(self, max_pending=100):
+        self.max_pending = max_pending
+        self._subscribers = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def subscribe(self, *channels):
+        subscription = Subscription(self, channels, self.max_pending)
+        with self._lock:
+            for channel in channels:
+                self._subscribers[channel].add(subscription)
+        return subscription
+
+    def _unsubscribe(self, subscription):
+        with self._lock:
+            for channel in subscription.channels:
+                subscribers = self._subscribers.get(channel)
+                if subscribers is not None:
+                    subscribers.discard(subscription)
+                    if not subscribers:
+                        del self._subscribers[channel]
+
+    def publish(self, channel, message):
+        """Deliver to current subscribers; returns how many there were"""
+        with self._lock:
+            subscribers = list(self._subscribers.get(channel, ()))
+        for subscription in subscribers:
+            subscription._put(channel, message)
+        return len(subscribers)
+
+
+pubsub = PubSub()
@@ -0,0 +1,221 @@
+"""
+RentAssured Query Profiler
+Per-request SQL counts and timings from engine events, a slow-query log and per-endpoint percentiles
+"""
+
+import heapq
+import logging
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter, deque
+
+from flask import request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+QUERY_PROFILE_SAMPLE_RATE = 0.0  # share of requests profiled; 0 turns the request hooks off
+SLOW_QUERY_MS = 500  # statements slower than this are logged, sampled or not; 0 turns the log off
+QUERY_PROFILE_TOP_STATEMENTS = 5  # slowest and most repeated statements kept per endpoint
+QUERY_PROFILE_WINDOW = 1000  # recent sampled requests per endpoint that percentiles are taken over
+
+PERCENTILES = (50, 90, 99)
+
+logger = logging.getLogger(__name__)
+
+_APP_ROOT = os.path.dirname(os.path.abspath(__file__))
+_THIS_FILE = os.path.abspath(__file__)
+
+
+def call_site():
+    """'file.py:line in function' of the innermost application frame running a query"""
+    frame = sys._getframe(1)
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if filename.startswith(_APP_ROOT) and filename != _THIS_FILE:
+            return f'{os.path.relpath(filename, _APP_ROOT)}:{frame.f_lineno} in {frame.f_code.co_name}'
+        frame = frame.f_back
+    return None
+
+
+def _statement(statement):
+    return ' '.join(statement.split())
+
+
+class RequestProfile:
+    """Statements run while serving one sampled request"""
+
+    __slots__ = ('started', 'queries', 'db_ms', 'slowest', 'statements', 'sites')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_ms = 0.0
+        self.slowest = []  # min-heap of (ms, seq, statement, call site)
+        self.statements = Counter()
+        self.sites = {}  # statement -> call site of its first run
+
+    def observe(self, statement, elapsed_ms, top, site=None):
+        self.queries += 1
+        self.db_ms += elapsed_ms
+        self.statements[statement] += 1
+        if statement not in self.sites:
+            # Walking the stack costs more than the rest together, so do it once per distinct statement
+            self.sites[statement] = site or call_site()
+        entry = (elapsed_ms, self.queries, statement, site or self.sites[statement])
+        if len(self.slowest) < top:
+            heapq.heappush(self.slowest, entry)
+        elif elapsed_ms > self.slowest[0][0]:
+            heapq.heapreplace(self.slowest, entry)
+
+
+def percentile(ordered, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not ordered:
+        return 0
+    return ordered[min(len(ordered) - 1, max(0, -(-pct * len(ordered) // 100) - 1))]
+
+
+class EndpointStats:
+    """Recent sampled requests to one endpoint"""
+
+    def __init__(self, window, top):
+        self.top = top
+        self.requests = 0
+        self.samples = deque(maxlen=window)  # (total ms, db ms, queries)
+        self.slowest = []  # min-heap of (ms, statement, call site)
+        self.repeated = {}  # statement -> (most runs in one request, call site)
+
+    def add(self, total_ms, profile):
+        self.requests += 1
+        self.samples.append((total_ms, profile.db_ms, profile.queries))
+        for elapsed_ms, _, statement, site in profile.slowest:
+            entry = (elapsed_ms, statement, site)
+            if len(self.slowest) < self.top:
+                heapq.heappush(self.slowest, entry)
+            elif elapsed_ms > self.slowest[0][0]:
+                heapq.heapreplace(self.slowest, entry)
+        for statement, runs in profile.statements.items():
+            if runs > 1 and runs > self.repeated.get(statement, (0, None))[0]:
+                self.repeated[statement] = (runs, profile.sites.get(statement))
+        if len(self.repeated) > self.top * 4:
+            kept = sorted(self.repeated.items(), key=lambda item: -item[1][0])[:self.top]
+            self.repeated = dict(kept)
+
+    def snapshot(self):
+        def summary(values, digits):
+            ordered = sorted(values)
+            stats = {f'p{pct}': round(percentile(ordered, pct), digits) for pct in PERCENTILES}
+            stats['max'] = round(ordered[-1], digits) if ordered else 0
+            return stats
+
+        return {
+            'sampled_requests': self.requests,
+            'total_ms': summary([sample[0] for sample in self.samples], 2),
+            'db_ms': summary([sample[1] for sample in self.samples], 2),
+            'queries': summary([sample[2] for sample in self.samples], 0),
+            'slowest_statements': [
+                {'ms': round(elapsed_ms, 2), 'statement': _statement(statement), 'call_site': site}
+                for elapsed_ms, statement, site in sorted(self.slowest, reverse=True)
+            ],
+            'repeated_statements': [
+                {'max_per_request': runs, 'statement': _statement(statement), 'call_site': site}
+                for statement, (runs, site) in sorted(self.repeated.items(), key=lambda item: -item[1][0])[:self.top]
+            ],
+        }
+
+
+class QueryProfiler:
+    """Times every SQL statement through engine events and profiles a sample of requests
+
+    A sampled request gets a Server-Timing header with its query count and
+    database time, and is folded into its endpoint's stats. Statements over
+    SLOW_QUERY_MS are logged with their call site whether or not the request
+    was sampled. With both switched off no hooks are installed at all.
+    """
+
+    def __init__(self):
+        self.sample_rate = QUERY_PROFILE_SAMPLE_RATE
+        self.slow_ms = SLOW_QUERY_MS
+        self.top = QUERY_PROFILE_TOP_STATEMENTS
+        self.window = QUERY_PROFILE_WINDOW
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._endpoints = {}
+        self._listening = False
+
+    def init_app(self, app):
+        self.sample_rate = app.config.get('QUERY_PROFILE_SAMPLE_RATE', self.sample_rate)
+        self.slow_ms = app.config.get('SLOW_QUERY_MS', self.slow_ms)
+        self.top = app.config.get('QUERY_PROFILE_TOP_STATEMENTS', self.top)
+        self.window = app.config.get('QUERY_PROFILE_WINDOW', self.window)
+        if (self.sample_rate or self.slow_ms) and not self._listening:
+            event.listen(Engine, 'before_cursor_execute', self._before_cursor_execute)
+            event.listen(Engine, 'after_cursor_execute', self._after_cursor_execute)
+            self._listening = True
+        if self.sample_rate:
+            app.before_request(self._start_request)
+            app.after_request(self._finish_request)
+            app.teardown_request(self._discard_request)
+        app.extensions['query_profiler'] = self
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        # Kept on the statement's own context, so a statement that raises leaves nothing behind
+        if context is not None:
+            context._query_started = time.perf_counter()
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        started = getattr(context, '_query_started', None)
+        if started is None:
+            return
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        profile = getattr(self._local, 'profile', None)
+        site = None
+        if self.slow_ms and elapsed_ms >= self.slow_ms:
+            site = call_site()
+            logger.warning('Slow query (%.1f ms) at %s: %s', elapsed_ms, site or 'unknown', _statement(statement)[:1000])
+        if profile is not None:
+            profile.observe(statement, elapsed_ms, self.top, site)
+
+    def _start_request(self):
+        if self.sample_rate >= 1 or random.random() < self.sample_rate:
+            self._local.profile = RequestProfile()
+
+    def _finish_request(self, response):
+        profile = getattr(self._local, 'profile', None)
+        if profile is None:
+            return response
+        self._local.profile = None  # queries a streamed body runs later are not this request's
+        total_ms = (time.perf_counter() - profile.started) * 1000
+        queries = f"{profile.queries} {'query' if profile.queries == 1 else 'queries'}"
+        response.headers.add('Server-Timing', f'db;dur={profile.db_ms:.2f};desc="{queries}"')
+        response.headers.add('Server-Timing', f'app;dur={total_ms:.2f}')
+        endpoint = request.endpoint or '<unmatched>'
+        with self._lock:
+            stats = self._endpoints.get(endpoint)
+            if stats is None:
+                stats = self._endpoints[endpoint] = EndpointStats(self.window, self.top)
+            stats.add(total_ms, profile)
+        return response
+
+    def _discard_request(self, exc):
+        self._local.profile = None
+
+    def snapshot(self):
+        """Per-endpoint percentiles and worst statements for this worker, as a JSON-ready dict"""
+        with self._lock:
+            endpoints = {endpoint: stats.snapshot() for endpoint, stats in self._endpoints.items()}
+        return {
+            'sample_rate': self.sample_rate,
+            'slow_query_ms': self.slow_ms,
+            'endpoints': endpoints,
+        }
+
+    def reset(self):
+        with self._lock:
+            self._endpoints = {}
+
+
+query_profiler = QueryProfiler()
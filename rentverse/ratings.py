@@ -0,0 +1,125 @@
+"""
+RentAssured Ratings
+Incremental maintenance of Listing.rating_sum, reviews_count and rating_avg
+"""
+
+from collections import defaultdict
+
+from sqlalchemy import event, func
+from sqlalchemy.orm import Session
+
+from models_advanced import db, Listing, Review
+from model_signals import old_value, track_old_values
+
+# Review columns that decide whether and how a review counts towards a listing
+RATING_FIELDS = ('listing_id', 'rating', 'is_flagged')
+LISTING_RATING_FIELDS = ('rating_sum', 'reviews_count', 'rating_avg')
+
+# The flush below subtracts exactly what a changed review used to add
+track_old_values(Review, *RATING_FIELDS)
+
+
+def _contribution(listing_id, rating, is_flagged):
+    """(listing_id, rating delta, count delta) a review adds to its listing"""
+    if listing_id is None or rating is None or is_flagged:
+        return None
+    return listing_id, rating, 1
+
+
+def _old_contribution(review):
+    return _contribution(*(old_value(review, field) for field in RATING_FIELDS))
+
+
+def _new_contribution(review):
+    return _contribution(*(getattr(review, field) for field in RATING_FIELDS))
+
+
+@event.listens_for(Session, 'before_flush')
+def _collect_old_ratings(session, flush_context, instances):
+    """Remember what changed or deleted reviews contributed before this flush"""
+    deltas = defaultdict(lambda: [0, 0])
+    for review in list(session.dirty) + list(session.deleted):
+        if not isinstance(review, Review):
+            continue
+        old = _old_contribution(review)
+        if old:
+            deltas[old[0]][0] -= old[1]
+            deltas[old[0]][1] -= old[2]
+    session.info['rating_deltas'] = deltas
+
+
+@event.listens_for(Session, 'after_flush')
+def _apply_rating_deltas(session, flush_context):
+    """Fold this flush's review changes into the listing aggregates
+
+    Runs in the flushing transaction with relative UPDATEs, so concurrent
+    reviews on the same listing never overwrite each other's counts.
+    """
+    deltas = session.info.pop('rating_deltas', None)
+    if deltas is None:
+        return
+    for review in list(session.new) + list(session.dirty):
+        if not isinstance(review, Review) or review in session.deleted:
+            continue
+        new = _new_contribution(review)
+        if new:
+            deltas[new[0]][0] += new[1]
+            deltas[new[0]][1] += new[2]
+
+    connection = session.connection()
+    for listing_id, (rating_delta, count_delta) in deltas.items():
+        if rating_delta or count_delta:
+            connection.execute(rating_update(listing_id, rating_delta, count_delta))
+            listing = session.identity_map.get(db.inspect(Listing).identity_key_from_primary_key((listing_id,)))
+            if listing is not None:
+                session.expire(listing, LISTING_RATING_FIELDS)
+
+
+def rating_update(listing_id, rating_delta, count_delta):
+    """UPDATE that shifts a listing's rating sum and count and recomputes the average"""
+    listings = Listing.__table__
+    rating_sum = func.coalesce(listings.c.rating_sum, 0) + rating_delta
+    reviews_count = func.coalesce(listings.c.reviews_count, 0) + count_delta
+    # rating_avg goes first: MySQL evaluates SET left to right using updated values
+    return listings.update().where(listings.c.id == listing_id).ordered_values(
+        (listings.c.rating_avg, average(rating_sum, reviews_count)),
+        (listings.c.rating_sum, rating_sum),
+        (listings.c.reviews_count, reviews_count),
+        (listings.c.updated_at, listings.c.updated_at),
+    )
+
+
+def average(rating_sum, reviews_count):
+    """SQL expression for a two-decimal average, 0 when there are no reviews"""
+    return db.case((reviews_count > 0, func.round(rating_sum * 1.0 / reviews_count, 2)), else_=0)
+
+
+def counted_reviews(listing_id):
+    """Filter for the reviews of a listing that count towards its rating"""
+    return db.and_(Review.listing_id == listing_id, Review.is_flagged.isnot(True))
+
+
+def reconcile_ratings_update(low, high):
+    """Recompute rating aggregates from the reviews table for a listing id range"""
+    listings = Listing.__table__
+    rating_sum = (db.select(func.coalesce(func.sum(Review.rating), 0))
+                  .where(counted_reviews(listings.c.id)).scalar_subquery())
+    reviews_count = (db.select(func.count(Review.id))
+                     .where(counted_reviews(listings.c.id)).scalar_subquery())
+    return listings.update().where(listings.c.id.between(low, high)).values(
+        rating_sum=rating_sum,
+        reviews_count=reviews_count,
+        rating_avg=db.select(average(func.coalesce(func.sum(Review.rating), 0), func.count(Review.id)))
+        .where(counted_reviews(listings.c.id)).scalar_subquery(),
+        updated_at=listings.c.updated_at
+    )
+
+
+def rating_distribution(listing_id):
+    """{stars: share of counted reviews} for the detail page histogram"""
+    rows = db.session.query(Review.rating, func.count(Review.id)).filter(
+        counted_reviews(listing_id)
+    ).group_by(Review.rating).all()
+    total = sum(count for _, count in rows) or 1
+    counts = dict(rows)
+    return {stars: round(100 * counts.get(stars, 0) / total) for stars in range(5, 0, -1)}
@@ -0,0 +1,81 @@
+"""
+RentAssured Reference Data
+Cached catalog tables that change rarely: categories and cancellation policies
+"""
+
+from flask import current_app
+
+from cache import cache, make_etag
+from models_advanced import Category, CancellationPolicy
+from model_signals import on_commit
+
+CATEGORIES_KEY = 'ref:categories'
+CANCELLATION_POLICIES_KEY = 'ref:cancellation_policies'
+
+# Entries are dropped on committed writes in this process; the TTL bounds how
+# long other workers keep serving a copy (a few seconds with the local backend,
+# see Cache)
+REFERENCE_DATA_TTL = 3600
+
+
+def _ttl():
+    return current_app.config.get('REFERENCE_DATA_TTL', REFERENCE_DATA_TTL)
+
+
+def _entry(items):
+    return {'items': items, 'etag': make_etag(items)}
+
+
+def _load_categories():
+    categories = Category.query.order_by(Category.sort_order, Category.id).all()
+    return _entry([{
+        'id': category.id,
+        'name': category.name,
+        'description': category.description,
+        'icon': category.icon,
+        'parent_id': category.parent_id,
+        'sort_order': category.sort_order,
+        'is_active': bool(category.is_active)
+    } for category in categories])
+
+
+def _load_cancellation_policies():
+    policies = CancellationPolicy.query.order_by(CancellationPolicy.id).all()
+    return _entry([{
+        'id': policy.id,
+        'name': policy.name,
+        'description': policy.description,
+        'effective_duration_hours': policy.effective_duration_hours,
+        'penalty_percentage': float(policy.penalty_percentage or 0),
+        'is_active': bool(policy.is_active)
+    } for policy in policies])
+
+
+def categories_entry():
+    """All categories as {'items': [...], 'etag': ...}, ordered by sort_order"""
+    return cache.get_or_set(CATEGORIES_KEY, _load_categories, _ttl())
+
+
+def cancellation_policies_entry():
+    """All cancellation policies as {'items': [...], 'etag': ...}"""
+    return cache.get_or_set(CANCELLATION_POLICIES_KEY, _load_cancellation_policies, _ttl())
+
+
+def get_categories(active_only=True):
+    items = categories_entry()['items']
+    return [category for category in items if category['is_active']] if active_only else items
+
+
+def get_cancellation_policies(active_only=True):
+    items = cancellation_policies_entry()['items']
+    return [policy for policy in items if policy['is_active']] if active_only else items
+
+
+@on_commit(Category)
+def _invalidate_categories(changes):
+    cache.delete(CATEGORIES_KEY)
+
+
+@on_commit(CancellationPolicy)
+def _invalidate_cancellation_policies(changes):
+    cache.delete(CANCELLATION_POLICIES_KEY)
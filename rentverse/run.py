@@ -1,33 +1,38 @@
 #!/usr/bin/env python3
 """
 RentAssured Application Runner
-This script starts the Flask application with proper configuration
+This script starts the Flask development server; production runs
+gunicorn -c gunicorn.conf.py wsgi:app
 """
 
 import os
 import sys
-from app import app, db
+from app_advanced import create_app, db
+from schema import upgrade
+
+app = create_app(os.environ.get('FLASK_CONFIG', 'development'))
 
 def check_database_connection():
     """Check if database connection is working"""
     try:
         with app.app_context():
-            db.engine.execute('SELECT 1')
+            with db.engine.connect() as connection:
+                connection.execute(db.text('SELECT 1'))
         print("✅ Database connection successful")
         return True
     except Exception as e:
         print(f"❌ Database connection failed: {e}")
         print("Please make sure:")
         print("1. MySQL server is running")
-        print("2. Database 'rentassured' exists")
-        print("3. Database credentials are correct in app.py")
+        print("2. Database 'rentassured_advanced' exists")
+        print("3. Database credentials are correct in config.py (or DATABASE_URL)")
         return False
 
 def create_tables():
     """Create database tables if they don't exist"""
     try:
         with app.app_context():
-            db.create_all()
+            upgrade(db.engine)
             print("✅ Database tables created/verified")
         return True
     except Exception as e:
@@ -41,7 +46,7 @@ def main():
     
     # Check database connection
     if not check_database_connection():
-        print("\n💡 To set up the database, run: python setup_database.py")
+        print("\n💡 To set up the database, run: python setup_advanced_database.py")
         sys.exit(1)
     
     # Create tables
@@ -52,6 +57,7 @@ def main():
     print("\n🌐 Starting Flask development server...")
     print("📍 Application URL: http://localhost:5000")
     print("🛑 Press Ctrl+C to stop the server")
+    print("🏭 For production use: gunicorn -c gunicorn.conf.py wsgi:app")
     print("=" * 50)
     
     # Start the Flask application
@@ -0,0 +1,256 @@
+"""
+RentAssured Schema
+Versioned migrations from the migrations package, and a diff of live indexes against the models
+"""
+
+import importlib
+import pkgutil
+import re
+from datetime import datetime
+
+from sqlalchemy import Column, Index, MetaData, Table, inspect, text
+from sqlalchemy.schema import CreateColumn
+from sqlalchemy.sql.elements import TextClause
+
+import migrations
+from models_advanced import db, SchemaMigration, User
+
+MIGRATION_NAME = re.compile(r'^(\d{4})_(\w+)$')
+BACKFILL_BATCH_SIZE = 1000  # primary keys per UPDATE (and per commit) in data backfills
+
+
+def load_migrations():
+    """[(version, name, module)] from migrations/NNNN_name.py, oldest first"""
+    found = {}
+    for info in pkgutil.iter_modules(migrations.__path__):
+        match = MIGRATION_NAME.match(info.name)
+        if not match:
+            continue
+        version = int(match.group(1))
+        if version in found:
+            raise ValueError(f"Two migrations share version {version:04d}: {found[version][0]}, {info.name}")
+        found[version] = (info.name, importlib.import_module(f'{migrations.__name__}.{info.name}'))
+    return [(version, found[version][0], found[version][1]) for version in sorted(found)]
+
+
+def applied_versions(connection):
+    if not inspect(connection).has_table(SchemaMigration.__tablename__):
+        return set()
+    return set(connection.execute(db.select(SchemaMigration.version)).scalars())
+
+
+def _record(connection, version, name):
+    connection.execute(SchemaMigration.__table__.insert().values(
+        version=version, name=name, applied_at=datetime.utcnow()
+    ))
+
+
+def upgrade(engine, target=None):
+    """Apply pending migrations up to `target` (default: all); returns the versions applied
+
+    An empty database gets every table straight from the models and is
+    stamped with every version, since the models already are the result of
+    all migrations. Each migration commits together with its version row,
+    and is written so that re-running it after a failure is harmless. A
+    migration may also define backfill(engine) for data changes; it runs
+    after upgrade() commits and commits batch by batch itself, and the
+    version is only recorded once it finishes.
+    """
+    pending = [m for m in load_migrations() if target is None or m[0] <= target]
+    with engine.begin() as connection:
+        applied = applied_versions(connection)
+        if not applied and not inspect(connection).has_table(User.__tablename__):
+            db.metadata.create_all(connection)
+            for version, name, _ in pending:
+                _record(connection, version, name)
+            print(f"✅ Created {len(db.metadata.tables)} tables at schema version {pending[-1][0] if pending else 0}")
+            return [version for version, _, _ in pending]
+        SchemaMigration.__table__.create(connection, checkfirst=True)
+
+    done = []
+    for version, name, module in pending:
+        if version in applied:
+            continue
+        backfill = getattr(module, 'backfill', None)
+        with engine.begin() as connection:
+            module.upgrade(connection)
+            if backfill is None:
+                _record(connection, version, name)
+        if backfill is not None:
+            backfill(engine)
+            with engine.begin() as connection:
+                _record(connection, version, name)
+        print(f"✅ Applied migration {name}")
+        done.append(version)
+    return done
+
+
+def ensure_column(connection, table, column):
+    """Add a model column to an existing table that predates it"""
+    existing = {info['name'] for info in inspect(connection).get_columns(table.name)}
+    if column.name in existing:
+        return False
+    column_type = column.type.compile(dialect=connection.dialect)
+    default = f" DEFAULT {_default_sql(connection, column)}" if column.server_default is not None else ''
+    connection.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}{default}"))
+    print(f"✅ Added column {table.name}.{column.name}")
+    return True
+
+
+def _default_sql(connection, column):
+    """The column's server default as it appears in DDL for this connection's dialect"""
+    return connection.dialect.ddl_compiler(connection.dialect, None).get_column_default_string(column)
+
+
+def backfill_default(engine, table, column, batch_size=BACKFILL_BATCH_SIZE):
+    """Give rows inserted without a database default the model's server default; returns rows changed
+
+    Works through the table in ranges of its (first) primary key column and
+    commits each range, so no statement holds row locks on the whole table.
+    """
+    key = next(iter(table.primary_key.columns))
+    with engine.connect() as connection:
+        low, high = connection.execute(db.select(db.func.min(key), db.func.max(key))).one()
+        default = text(_default_sql(connection, column))
+    # A backfill is not an edit; keep onupdate columns such as updated_at as they are
+    values = {other.name: other for other in table.columns if other.onupdate is not None and other is not column}
+    values[column.name] = default
+
+    filled = 0
+    while low is not None and low <= high:
+        with engine.begin() as connection:
+            result = connection.execute(
+                table.update()
+                .where(column.is_(None), key.between(low, low + batch_size - 1))
+                .values(values)
+            )
+        filled += result.rowcount
+        low += batch_size
+    if filled:
+        print(f"✅ Filled {filled} NULL {table.name}.{column.name} values")
+    return filled
+
+
+def ensure_server_default(connection, table, column):
+    """Set a model column's server default on an existing table that lacks one"""
+    live = {info['name']: info for info in inspect(connection).get_columns(table.name)}
+    if column.name not in live or live[column.name].get('default') is not None:
+        return False
+    dialect = connection.dialect.name
+    if dialect == 'sqlite':
+        print(f"⚠️  SQLite cannot change {table.name}.{column.name}'s default; recreate the database to pick it up")
+        return False
+    if dialect == 'mysql' and isinstance(column.server_default.arg, TextClause):
+        # ALTER COLUMN ... SET DEFAULT only takes literals; CURRENT_TIMESTAMP needs the full definition
+        definition = CreateColumn(column).compile(dialect=connection.dialect)
+        connection.execute(text(f"ALTER TABLE {table.name} MODIFY COLUMN {definition}"))
+    else:
+        connection.execute(text(
+            f"ALTER TABLE {table.name} ALTER COLUMN {column.name} SET DEFAULT {_default_sql(connection, column)}"
+        ))
+    print(f"✅ Set default of {table.name}.{column.name}")
+    return True
+
+
+def _signature(columns, unique, prefix=None):
+    # Names differ between databases built by hand and by create_all, so
+    # indexes are matched on what they cover
+    return tuple(columns), bool(unique), (prefix or '').upper()
+
+
+def _prefix(index, dialect):
+    # FULLTEXT only exists on MySQL; elsewhere the index is created as a plain one
+    return index.dialect_options['mysql'].get('prefix') if dialect.name == 'mysql' else None
+
+
+def declared_indexes(table, dialect):
+    """{signature: name} for the indexes and unique constraints a model declares"""
+    declared = {}
+    for index in table.indexes:
+        declared[_signature([c.name for c in index.columns], index.unique, _prefix(index, dialect))] = index.name
+    for constraint in table.constraints:
+        if isinstance(constraint, db.UniqueConstraint):
+            declared[_signature([c.name for c in constraint.columns], True)] = constraint.name
+    return declared
+
+
+def live_indexes(inspector, table_name):
+    """{signature: name} for the indexes a table has in the database, primary key aside"""
+    live = {}
+    for index in inspector.get_indexes(table_name):
+        prefix = index.get('dialect_options', {}).get('mysql_prefix')
+        live[_signature(index['column_names'], index['unique'], prefix)] = index['name']
+    for constraint in inspector.get_unique_constraints(table_name):
+        live.setdefault(_signature(constraint['column_names'], True), constraint['name'])
+    return live
+
+
+def index_diff(bind):
+    """[(table, name, columns, problem)] where the database's indexes differ from the models
+
+    `problem` is 'missing' (declared, not in the database), 'unexpected' (in
+    the database, not declared) or 'changed' (same name, different columns).
+    Indexes MySQL adds by itself for foreign keys are not reported.
+    """
+    inspector = inspect(bind)
+    existing = set(inspector.get_table_names())
+    problems = []
+    for table in db.metadata.sorted_tables:
+        if table.name not in existing:
+            problems.append((table.name, None, (), 'missing table'))
+            continue
+        declared = declared_indexes(table, inspector.dialect)
+        live = live_indexes(inspector, table.name)
+        foreign_keys = {tuple(fk['constrained_columns']) for fk in inspector.get_foreign_keys(table.name)}
+
+        missing = {sig: name for sig, name in declared.items() if sig not in live}
+        unexpected = {sig: name for sig, name in live.items()
+                      if sig not in declared and not (sig[0] in foreign_keys and not sig[1])}
+        unexpected_names = {name: sig for sig, name in unexpected.items()}
+        for sig, name in sorted(missing.items(), key=lambda item: str(item[1])):
+            if name in unexpected_names:
+                del unexpected[unexpected_names[name]]
+                problems.append((table.name, name, sig[0], 'changed'))
+            else:
+                problems.append((table.name, name, sig[0], 'missing'))
+        for sig, name in sorted(unexpected.items(), key=lambda item: str(item[1])):
+            problems.append((table.name, name, sig[0], 'unexpected'))
+    return problems
+
+
+def create_missing_indexes(connection):
+    """Create each declared, non-unique index a table lacks; returns their names
+
+    Unique constraints are only reported by index_diff, since adding one can
+    fail on existing duplicates and needs a data fix first.
+    """
+    inspector = inspect(connection)
+    existing = set(inspector.get_table_names())
+    created = []
+    for table in db.metadata.sorted_tables:
+        if table.name not in existing:
+            continue
+        live = live_indexes(inspector, table.name)
+        for index in sorted(table.indexes, key=lambda index: index.name):
+            signature = _signature([c.name for c in index.columns], False, _prefix(index, connection.dialect))
+            if index.unique or signature in live:
+                continue
+            if index.name in live.values():
+                print(f"⚠️  {table.name}.{index.name} exists with other columns; left for index-diff to report")
+                continue
+            index.create(connection)
+            created.append(index.name)
+            print(f"✅ Created index {table.name}.{index.name}")
+    return created
+
+
+def drop_index(connection, table_name, name):
+    """Drop an index by name if the table still has it"""
+    for index in inspect(connection).get_indexes(table_name):
+        if index['name'] == name:
+            # A throwaway table, so the models' metadata never learns about the old index
+            table = Table(table_name, MetaData(), *[Column(column) for column in index['column_names']])
+            Index(name, *table.columns).drop(connection)
+            print(f"✅ Dropped index {table_name}.{name}")
+            return True
+    return False
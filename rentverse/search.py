@@ -0,0 +1,261 @@
+"""
+RentAssured Listing Search
+In-process inverted index over listing title, description and location
+"""
+
+import math
+import re
+import threading
+import time
+from bisect import bisect_left, insort
+from collections import defaultdict
+from datetime import datetime
+
+from models_advanced import db, Listing
+from model_signals import on_commit
+
+TOKEN_RE = re.compile(r'[a-z0-9]+')
+STOP_WORDS = frozenset(['a', 'an', 'and', 'the', 'for', 'in', 'of', 'on', 'or', 'to', 'with'])
+
+# Relative weight of a token depending on the field it appears in
+FIELD_WEIGHTS = {'title': 3.0, 'location': 2.0, 'description': 1.0}
+
+# BM25 tuning constants
+K1 = 1.2
+B = 0.75
+
+# Prefix matches score a little lower than whole-word matches
+PREFIX_PENALTY = 0.6
+MAX_PREFIX_EXPANSIONS = 50
+
+# Ranked ids checked against the SQL filters per IN (...) statement
+FILTER_CHUNK_SIZE = 1000
+
+
+def tokenize(text):
+    """Split text into lowercase search tokens"""
+    if not text:
+        return []
+    return [token for token in TOKEN_RE.findall(text.lower()) if token not in STOP_WORDS]
+
+
+def listing_document(listing):
+    """Snapshot the searchable fields of a listing"""
+    return {
+        'id': listing.id,
+        'title': listing.title,
+        'description': listing.description,
+        'location': listing.location,
+        'status': listing.status,
+    }
+
+
+class SearchIndex:
+    """Ranked, prefix-aware inverted index of active listings
+
+    The index is built from the database on first use and kept current by
+    session events for writes made in this process. Writes from other
+    processes are picked up by periodically re-reading recently updated rows.
+    """
+
+    def __init__(self, refresh_interval=30):
+        self.refresh_interval = refresh_interval
+        self._lock = threading.RLock()
+        self._built = False
+        self._reset()
+
+    def init_app(self, app):
+        self.refresh_interval = app.config.get('SEARCH_REFRESH_INTERVAL', self.refresh_interval)
+        app.extensions['search_index'] = self
+
+    def _reset(self):
+        self._postings = defaultdict(dict)           # token -> {listing_id: weighted tf}
+        self._location_postings = defaultdict(set)   # token -> {listing_id}
+        self._doc_tokens = {}                        # listing_id -> (tokens, location tokens)
+        self._doc_lengths = {}
+        self._total_length = 0.0
+        self._vocabulary = []                        # sorted, for prefix lookups
+        self._location_vocabulary = []
+        self._watermark = None
+        self._refreshed_at = 0.0
+
+    # Index maintenance
+
+    def _add(self, doc):
+        self._remove(doc['id'])
+        if doc['status'] != 'active':
+            return
+
+        weights = defaultdict(float)
+        for field, weight in FIELD_WEIGHTS.items():
+            for token in tokenize(doc[field]):
+                weights[token] += weight
+        location_tokens = set(tokenize(doc['location']))
+
+        for token, weight in weights.items():
+            if token not in self._postings:
+                insort(self._vocabulary, token)
+            self._postings[token][doc['id']] = weight
+        for token in location_tokens:
+            if token not in self._location_postings:
+                insort(self._location_vocabulary, token)
+            self._location_postings[token].add(doc['id'])
+
+        length = sum(weights.values())
+        self._doc_tokens[doc['id']] = (tuple(weights), tuple(location_tokens))
+        self._doc_lengths[doc['id']] = length
+        self._total_length += length
+
+    def _remove(self, listing_id):
+        tokens = self._doc_tokens.pop(listing_id, None)
+        if tokens is None:
+            return
+        for token in tokens[0]:
+            self._postings[token].pop(listing_id, None)
+        for token in tokens[1]:
+            self._location_postings[token].discard(listing_id)
+        self._total_length -= self._doc_lengths.pop(listing_id)
+
+    def apply(self, upserts=(), deletes=()):
+        """Apply committed listing changes to a built index"""
+        with self._lock:
+            if not self._built:
+                return
+            for doc in upserts:
+                self._add(doc)
+            for listing_id in deletes:
+                self._remove(listing_id)
+
+    def rebuild(self):
+        """Load every active listing into a fresh index"""
+        with self._lock:
+            self._reset()
+            self._watermark = datetime.utcnow()
+            rows = db.session.query(
+                Listing.id, Listing.title, Listing.description, Listing.location, Listing.status
+            ).filter(Listing.status == 'active').yield_per(1000)
+            for row in rows:
+                self._add(row._asdict())
+            self._built = True
+            self._refreshed_at = time.monotonic()
+
+    def _ensure_current(self):
+        with self._lock:
+            if not self._built:
+                self.rebuild()
+                return
+            if time.monotonic() - self._refreshed_at < self.refresh_interval:
+                return
+
+            since = self._watermark
+            self._watermark = datetime.utcnow()
+            self._refreshed_at = time.monotonic()
+            rows = db.session.query(
+                Listing.id, Listing.title, Listing.description, Listing.location, Listing.status
+            ).filter(Listing.updated_at >= since).all()
+            for row in rows:
+                self._add(row._asdict())
+
+    # Querying
+
+    def _expand(self, term, vocabulary, postings, allow_prefix):
+        """Yield (token, factor) pairs matching a query term"""
+        if term in postings and postings[term]:
+            yield term, 1.0
+        if not allow_prefix:
+            return
+        i = bisect_left(vocabulary, term)
+        expansions = 0
+        while i < len(vocabulary) and vocabulary[i].startswith(term) and expansions < MAX_PREFIX_EXPANSIONS:
+            token = vocabulary[i]
+            if token != term and postings[token]:
+                yield token, PREFIX_PENALTY
+                expansions += 1
+            i += 1
+
+    def _location_matches(self, location):
+        matched = None
+        for term in tokenize(location):
+            ids = set()
+            for token, _ in self._expand(term, self._location_vocabulary, self._location_postings, True):
+                ids |= self._location_postings[token]
+            matched = ids if matched is None else matched & ids
+            if not matched:
+                return set()
+        return matched
+
+    def search(self, q='', location=''):
+        """Return [(listing_id, score)] best match first
+
+        Every query term must match. The last term, and any term of three or
+        more characters, also matches longer words by prefix. With only a
+        location, matches come back newest first with a score of 0.
+        """
+        self._ensure_current()
+        terms = tokenize(q)
+
+        with self._lock:
+            allowed = self._location_matches(location) if location else None
+            if allowed is not None and not allowed:
+                return []
+            if not terms:
+                return [(listing_id, 0.0) for listing_id in sorted(allowed or (), reverse=True)]
+
+            doc_count = len(self._doc_lengths) or 1
+            avg_length = (self._total_length / doc_count) or 1.0
+            scores = None
+            for position, term in enumerate(terms):
+                allow_prefix = position == len(terms) - 1 or len(term) >= 3
+                term_scores = defaultdict(float)
+                for token, factor in self._expand(term, self._vocabulary, self._postings, allow_prefix):
+                    postings = self._postings[token]
+                    idf = math.log(1 + (doc_count - len(postings) + 0.5) / (len(postings) + 0.5))
+                    for listing_id, tf in postings.items():
+                        if allowed is not None and listing_id not in allowed:
+                            continue
+                        norm = K1 * (1 - B + B * self._doc_lengths[listing_id] / avg_length)
+                        score = factor * idf * tf * (K1 + 1) / (tf + norm)
+                        term_scores[listing_id] = max(term_scores[listing_id], score)
+
+                if scores is None:
+                    scores = term_scores
+                else:
+                    scores = {listing_id: scores[listing_id] + score
+                              for listing_id, score in term_scores.items() if listing_id in scores}
+                if not scores:
+                    return []
+
+        return sorted(scores.items(), key=lambda item: (-item[1], -item[0]))
+
+
+search_index = SearchIndex()
+
+
+def search_listings(query, q='', location='', limit=None):
+    """Run a search and keep only the hits that also pass a Listing query
+
+    Returns ([(listing_id, score)] best match first, total). The query
+    carries any SQL-side filters (category, price, type) and is only used to
+    fetch ids. Ranked hits are checked in order, FILTER_CHUNK_SIZE ids per
+    statement, until `limit` have passed, so a page costs about the same
+    however broad the terms are. `total` is exact when every hit was
+    checked, and None when the search stopped at `limit`.
+    """
+    ranked = search_index.search(q, location)
+    results = []
+    for start in range(0, len(ranked), FILTER_CHUNK_SIZE):
+        if limit is not None and len(results) >= limit:
+            return results, None
+        chunk = ranked[start:start + FILTER_CHUNK_SIZE]
+        ids = [listing_id for listing_id, _ in chunk]
+        matching = {row[0] for row in query.filter(Listing.id.in_(ids)).with_entities(Listing.id)}
+        results.extend((listing_id, score) for listing_id, score in chunk if listing_id in matching)
+    return results, len(results)
+
+
+@on_commit(Listing, snapshot=listing_document)
+def _sync_listings(changes):
+    """Keep the index in step with listing writes made in this process"""
+    upserts = [doc for operation, doc in changes if operation != 'delete']
+    deletes = [doc['id'] for operation, doc in changes if operation == 'delete']
+    search_index.apply(upserts=upserts, deletes=deletes)
@@ -57,6 +57,8 @@ function updateNavigation() {
         if (dashboardLink) {
             dashboardLink.href = `/dashboard?token=${token}`;
         }
+        
+        loadBadges();
     } else {
         // Show guest navigation
         if (guestNav) guestNav.classList.remove('d-none');
@@ -81,7 +83,7 @@ function initializeSearch() {
 // Perform search
 function performSearch(query) {
     if (query.trim()) {
-        window.location.href = `/listings?search=${encodeURIComponent(query.trim())}`;
+        window.location.href = `/listings?q=${encodeURIComponent(query.trim())}`;
     }
 }
 
@@ -109,6 +111,29 @@ function saveCartItems() {
     localStorage.setItem('cart', JSON.stringify(cartItems));
 }
 
+// Load unread notification and message counts into the nav badges
+function loadBadges() {
+    fetch('/api/badges', {
+        headers: { 'Authorization': `Bearer ${getAuthToken()}` }
+    })
+        .then(response => response.ok ? response.json() : null)
+        .then(counts => {
+            if (!counts) return;
+            updateBadge('notification-count', counts.notifications);
+            updateBadge('message-count', counts.messages);
+        })
+        .catch(() => {});
+}
+
+// Show a nav badge only when there is something unread
+function updateBadge(id, count) {
+    const badge = document.getElementById(id);
+    if (badge) {
+        badge.textContent = count > 99 ? '99+' : count;
+        badge.classList.toggle('d-none', !count);
+    }
+}
+
 // Update cart count display
 function updateCartCount() {
     const cartCount = document.getElementById('cart-count');
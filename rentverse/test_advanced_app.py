@@ -58,6 +58,48 @@ def test_categories_api():
         print(f"❌ Categories API test failed: {e}")
         return False
 
+def test_categories_etag():
+    """Test categories API revalidation with ETag"""
+    print("Testing categories API ETag...")
+    try:
+        response = requests.get(f"{BASE_URL}/api/categories")
+        etag = response.headers.get('ETag')
+        if not etag:
+            print("❌ Categories API did not return an ETag")
+            return False
+        
+        response = requests.get(f"{BASE_URL}/api/categories", headers={"If-None-Match": etag})
+        if response.status_code == 304:
+            print("✅ Categories API revalidation works")
+            return True
+        else:
+            print(f"❌ Categories API revalidation returned status: {response.status_code}")
+            return False
+    except Exception as e:
+        print(f"❌ Categories API ETag test failed: {e}")
+        return False
+
+def test_cancellation_policies_etag():
+    """Test cancellation policies API revalidation with ETag"""
+    print("Testing cancellation policies API ETag...")
+    try:
+        response = requests.get(f"{BASE_URL}/api/cancellation_policies")
+        etag = response.headers.get('ETag')
+        if not etag:
+            print("❌ Cancellation policies API did not return an ETag")
+            return False
+        
+        response = requests.get(f"{BASE_URL}/api/cancellation_policies", headers={"If-None-Match": etag})
+        if response.status_code == 304:
+            print("✅ Cancellation policies API revalidation works")
+            return True
+        else:
+            print(f"❌ Cancellation policies API revalidation returned status: {response.status_code}")
+            return False
+    except Exception as e:
+        print(f"❌ Cancellation policies API ETag test failed: {e}")
+        return False
+
 def test_register():
     """Test user registration"""
     print("Testing user registration...")
@@ -173,6 +215,22 @@ def test_coupon_validation():
         print(f"❌ Coupon validation test failed: {e}")
         return False
 
+def test_search_api():
+    """Test listing search API"""
+    print("Testing search API...")
+    try:
+        response = requests.get(f"{BASE_URL}/api/search", params={"q": "camera"})
+        if response.status_code == 200:
+            data = response.json()
+            print(f"✅ Search API works - found {data['total']} matches")
+            return True
+        else:
+            print(f"❌ Search API failed with status: {response.status_code}")
+            return False
+    except Exception as e:
+        print(f"❌ Search API test failed: {e}")
+        return False
+
 def main():
     """Run all tests"""
     print("🚀 Testing RentAssured Advanced Application")
@@ -211,6 +269,21 @@ def main():
         tests_passed += 1
         total_tests = 7
     
+    # Test 8: Search API
+    total_tests += 1
+    if test_search_api():
+        tests_passed += 1
+    
+    # Test 9: Categories API revalidation
+    total_tests += 1
+    if test_categories_etag():
+        tests_passed += 1
+    
+    # Test 10: Cancellation policies API revalidation
+    total_tests += 1
+    if test_cancellation_policies_etag():
+        tests_passed += 1
+    
     print("=" * 50)
     print(f"🎯 Test Results: {tests_passed}/{total_tests} tests passed")
     
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Tests for the availability engine's interval index and its cache
+"""
+
+from datetime import date
+
+import pytest
+
+from app_advanced import create_app
+from availability import availability, ListingIntervals
+from models_advanced import db, Booking, Category, Listing, User
+
+
+def test_overlapping_ranges_are_taken():
+    intervals = ListingIntervals([(1, date(2030, 1, 10), date(2030, 1, 15))])
+    assert intervals.overlaps(date(2030, 1, 12), date(2030, 1, 20))
+    assert intervals.overlaps(date(2030, 1, 5), date(2030, 1, 10))
+    assert intervals.overlaps(date(2030, 1, 11), date(2030, 1, 12))
+    assert intervals.overlaps(date(2030, 1, 1), date(2030, 1, 31))
+    assert not intervals.overlaps(date(2030, 1, 1), date(2030, 1, 9))
+    assert not intervals.overlaps(date(2030, 1, 16), date(2030, 1, 20))
+
+
+def test_adjacent_ranges_share_their_boundary_day():
+    # Ranges are inclusive on both ends, so a range ending on another's first day overlaps it
+    intervals = ListingIntervals([(1, date(2030, 1, 10), date(2030, 1, 15))])
+    assert intervals.overlaps(date(2030, 1, 15), date(2030, 1, 18))
+    assert intervals.overlaps(date(2030, 1, 7), date(2030, 1, 10))
+    assert not intervals.overlaps(date(2030, 1, 16), date(2030, 1, 18))
+    assert not intervals.overlaps(date(2030, 1, 7), date(2030, 1, 9))
+
+
+def test_long_booking_hidden_behind_later_starts():
+    # A long range that starts first must still block dates after shorter ranges that start later
+    intervals = ListingIntervals([
+        (1, date(2030, 1, 1), date(2030, 1, 31)),
+        (2, date(2030, 1, 5), date(2030, 1, 6)),
+    ])
+    assert intervals.overlaps(date(2030, 1, 20), date(2030, 1, 21))
+    intervals.remove(1)
+    assert not intervals.overlaps(date(2030, 1, 20), date(2030, 1, 21))
+    intervals.add(3, date(2030, 1, 21), date(2030, 1, 22))
+    assert intervals.overlaps(date(2030, 1, 20), date(2030, 1, 21))
+
+
+@pytest.fixture
+def app():
+    app = create_app('testing')
+    availability._indexes.clear()  # indexes cached by earlier tests describe their own databases
+    with app.app_context():
+        db.create_all()
+        db.session.add(Category(id=1, name='Vehicles'))
+        db.session.add(User(id=1, name='Owner', email='owner@example.com', phone='1234567890', password='x'))
+        db.session.add(User(id=2, name='Renter', email='renter@example.com', phone='1234567890', password='x'))
+        db.session.add(Listing(id=1, title='Camera', description='A camera to rent', price=100,
+                               location='Pune', category_id=1, owner_id=1, status='active'))
+        db.session.commit()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+
+def _book(start, end, status='pending'):
+    booking = Booking(listing_id=1, renter_id=2, start_date=start, end_date=end,
+                      total_amount=100, service_fee=0, status=status)
+    db.session.add(booking)
+    db.session.commit()
+    return booking
+
+
+def test_cached_index_picks_up_new_bookings(app):
+    assert availability.is_range_free(1, date(2030, 1, 10), date(2030, 1, 12))
+    _book(date(2030, 1, 10), date(2030, 1, 12))
+    assert not availability.is_range_free(1, date(2030, 1, 12), date(2030, 1, 14))
+
+
+def test_cancellations_by_other_workers_expire_with_the_ttl(app):
+    booking = _book(date(2030, 1, 10), date(2030, 1, 12))
+    assert not availability.is_range_free(1, date(2030, 1, 10), date(2030, 1, 12))
+
+    # Cancelled behind the engine's back, as another worker would
+    db.session.execute(db.update(Booking).where(Booking.id == booking.id).values(status='cancelled'))
+    db.session.commit()
+    assert not availability.is_range_free(1, date(2030, 1, 10), date(2030, 1, 12))
+
+    index = availability._get_index(1)
+    index.loaded_at -= availability.index_ttl + 1
+    assert availability.is_range_free(1, date(2030, 1, 10), date(2030, 1, 12))
+
+
+def test_check_availability_rejects_reversed_ranges(app):
+    response = app.test_client().post('/api/availability', json={
+        'listing_id': 1, 'ranges': [{'start_date': '2030-01-12', 'end_date': '2030-01-10'}]
+    })
+    assert response.status_code == 400
@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+"""
+Tests for message long-polling limits
+"""
+
+import time
+
+import pytest
+from flask_jwt_extended import create_access_token
+
+from app_advanced import create_app
+from conversations import get_or_create_conversation, wait_for_messages
+from models_advanced import db, User
+
+
+@pytest.fixture
+def app():
+    app = create_app('testing')
+    app.config['MESSAGE_POLL_TIMEOUT'] = 0.2
+    app.config['MESSAGE_POLL_RECHECK'] = 0.05
+    with app.app_context():
+        db.create_all()
+        db.session.add(User(id=1, name='Owner', email='owner@example.com', phone='1234567890', password='x'))
+        db.session.add(User(id=2, name='Renter', email='renter@example.com', phone='1234567890', password='x'))
+        db.session.flush()
+        get_or_create_conversation(1, 2, None)
+        db.session.commit()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.mark.parametrize('timeout', [float('nan'), float('inf'), -5.0, 60.0])
+def test_wait_is_bounded_by_the_configured_limit(app, timeout):
+    started = time.monotonic()
+    assert wait_for_messages(1, 0, timeout=timeout) == []
+    assert time.monotonic() - started < 1
+
+
+@pytest.mark.parametrize('timeout', ['nan', 'inf', '-inf'])
+def test_poll_rejects_timeouts_that_are_not_finite(app, timeout):
+    token = create_access_token(identity='1')
+    response = app.test_client().get(f'/api/conversations/1/poll?timeout={timeout}',
+                                     headers={'Authorization': f'Bearer {token}'})
+    assert response.status_code == 400
+
+
+def test_poll_answers_negative_timeouts_at_once(app):
+    token = create_access_token(identity='1')
+    started = time.monotonic()
+    response = app.test_client().get('/api/conversations/1/poll?timeout=-1',
+                                     headers={'Authorization': f'Bearer {token}'})
+    assert response.status_code == 200
+    assert response.get_json() == {'messages': []}
+    assert time.monotonic() - started < 1
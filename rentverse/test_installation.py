@@ -11,7 +11,7 @@ def test_imports():
     required_modules = [
         'flask',
         'flask_sqlalchemy',
-        'flask_bcrypt',
+        'bcrypt',
         'flask_jwt_extended',
         'pymysql',
         'mysql.connector'
@@ -33,9 +33,9 @@ def test_imports():
 def test_database_connection():
     """Test database connection"""
     try:
-        from app import app, db
+        from app_advanced import create_app, db
         
-        with app.app_context():
+        with create_app().app_context():
             with db.engine.connect() as connection:
                 connection.execute(db.text('SELECT 1'))
         print("✅ Database connection successful")
@@ -47,7 +47,8 @@ def test_database_connection():
 def test_flask_app():
     """Test if Flask app can be created"""
     try:
-        from app import app
+        from app_advanced import create_app
+        create_app()
         print("✅ Flask application created successfully")
         return True
     except Exception as e:
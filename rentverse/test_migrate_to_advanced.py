@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+Tests for resuming and re-running the basic-to-advanced data copy
+"""
+
+import json
+
+import pymysql
+
+from migrate_to_advanced import MIGRATIONS, copy_range
+
+LISTINGS = next(spec for spec in MIGRATIONS if spec.name == 'listings')
+
+
+class FakeDatabase:
+    """Just enough of MySQL for copy_range on listings: old rows, new tables and checkpoints"""
+
+    def __init__(self, old_listings, users=(1,), categories=(1,)):
+        self.old_listings = old_listings
+        self.users = set(users)
+        self.categories = set(categories)
+        self.listings = {}
+        self.images = []
+        self.checkpoints = {}
+
+    def connect(self):
+        return FakeConnection(self)
+
+
+class FakeConnection:
+    def __init__(self, database):
+        self.database = database
+
+    def cursor(self, cursor_class=None):
+        return FakeCursor(self.database)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+
+class FakeCursor:
+    def __init__(self, database):
+        self.database = database
+        self.rows = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql, params=()):
+        db = self.database
+        sql = ' '.join(sql.split())
+        if sql.startswith('SELECT * FROM `listing`'):
+            after, limit = params[0], params[-1]
+            high = params[1] if len(params) == 3 else float('inf')
+            self.rows = [row for row in sorted(db.old_listings, key=lambda row: row['id'])
+                         if after < row['id'] <= high][:limit]
+        elif sql.startswith('SELECT last_key'):
+            checkpoint = db.checkpoints.get(tuple(params))
+            self.rows = [checkpoint] if checkpoint else []
+        elif sql.startswith('INSERT INTO migration_checkpoints'):
+            name, range_start, last_key, rows_copied, completed = params
+            db.checkpoints[(name, range_start)] = (last_key, rows_copied, completed)
+        elif sql.startswith('SELECT `id` FROM `listings` WHERE `id` IN'):
+            self.rows = [(key,) for key in params if key in db.listings]
+        elif sql.startswith('INSERT IGNORE INTO listings'):
+            key, owner_id, category_id = params[0], params[6], params[5]
+            if key not in db.listings and owner_id in db.users and category_id in db.categories:
+                db.listings[key] = params
+        elif sql.startswith('INSERT INTO listing_images'):
+            if params[0] not in db.listings:
+                raise pymysql.err.IntegrityError(1452, 'Cannot add or update a child row')
+            db.images.append(params)
+        else:
+            raise AssertionError(f'unexpected statement: {sql}')
+
+    def executemany(self, sql, seq):
+        for params in seq:
+            self.execute(sql, params)
+
+    def fetchone(self):
+        return self.rows[0] if self.rows else None
+
+    def fetchall(self):
+        rows, self.rows = self.rows, []
+        return rows
+
+    def fetchmany(self, size):
+        rows, self.rows = self.rows[:size], self.rows[size:]
+        return rows
+
+
+def _listing(key, owner_id=1, images=('a.jpg', 'b.jpg')):
+    return {'id': key, 'title': f'Listing {key}', 'description': 'A thing to rent', 'price': 10,
+            'location': 'Pune', 'category_id': 1, 'owner_id': owner_id, 'status': 'active',
+            'images': json.dumps(list(images))}
+
+
+def _copy(database, low=None, high=None):
+    return copy_range(LISTINGS, database.connect(), database.connect(), low, high, chunk_size=3, batch_size=2)
+
+
+def _images_per_listing(database):
+    counts = {}
+    for image in database.images:
+        counts[image[0]] = counts.get(image[0], 0) + 1
+    return counts
+
+
+def test_copy_resumes_from_the_checkpoint():
+    database = FakeDatabase([_listing(key) for key in range(1, 8)])
+    database.checkpoints[('listings', 0)] = (4, 4, False)
+    database.listings = {key: () for key in range(1, 5)}
+    database.images = [(key, 'a.jpg', 0, True) for key in range(1, 5)]
+
+    assert _copy(database) == 3
+    assert sorted(database.listings) == list(range(1, 8))
+    assert _images_per_listing(database) == {1: 1, 2: 1, 3: 1, 4: 1, 5: 2, 6: 2, 7: 2}
+    assert database.checkpoints[('listings', 0)] == (7, 7, True)
+    assert _copy(database) == 0
+
+
+def test_reset_copy_adds_no_duplicate_images():
+    database = FakeDatabase([_listing(key) for key in range(1, 6)])
+    _copy(database)
+    assert len(database.images) == 10
+
+    database.checkpoints.clear()  # --reset
+    assert _copy(database) == 5
+    assert len(database.images) == 10
+
+    # A different --shard-size starts new ranges with no checkpoints
+    database.checkpoints.clear()
+    _copy(database, 0, 2)
+    _copy(database, 3, 5)
+    assert _images_per_listing(database) == {key: 2 for key in range(1, 6)}
+
+
+def test_listing_skipped_for_a_missing_owner_gets_no_images():
+    database = FakeDatabase([_listing(1), _listing(2, owner_id=99), _listing(3)])
+    _copy(database)
+    assert sorted(database.listings) == [1, 3]
+    assert _images_per_listing(database) == {1: 2, 3: 2}
+
+
+def test_listing_whose_id_is_taken_gets_no_images():
+    database = FakeDatabase([_listing(1), _listing(2), _listing(3)])
+    database.listings[2] = ('already here',)
+    _copy(database)
+    assert database.listings[2] == ('already here',)
+    assert _images_per_listing(database) == {1: 2, 3: 2}
@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+"""
+Tests for keyset pagination cursors
+"""
+
+import pytest
+
+from app_advanced import create_app
+from models_advanced import db, Category, Listing, User
+from pagination import encode_cursor
+
+
+@pytest.fixture
+def client():
+    app = create_app('testing')
+    with app.app_context():
+        db.create_all()
+        db.session.add(Category(id=1, name='Vehicles'))
+        db.session.add(User(id=1, name='Owner', email='owner@example.com', phone='1234567890', password='x'))
+        for i in range(1, 4):
+            db.session.add(Listing(id=i, title=f'Camera {i}', description='A camera to rent', price=100,
+                                   location='Pune', category_id=1, owner_id=1, status='active'))
+        db.session.commit()
+        yield app.test_client()
+        db.session.remove()
+        db.drop_all()
+
+
+def test_cursors_walk_every_listing(client):
+    seen = []
+    cursor = ''
+    while True:
+        page = client.get(f'/api/listings?per_page=2&cursor={cursor}').get_json()
+        seen += [listing['id'] for listing in page['items']]
+        if not page['next_cursor']:
+            break
+        cursor = page['next_cursor']
+    assert sorted(seen) == [1, 2, 3]
+
+
+@pytest.mark.parametrize('cursor', [
+    encode_cursor({'k': 5}),
+    encode_cursor({'k': [0, '2030-01-01T00:00:00']}),
+    encode_cursor({'k': [0, {'a': 1}, 3]}),
+    encode_cursor({'k': [0, 'not a date', 3]}),
+    encode_cursor([1, 2]),
+    'not base64!',
+])
+def test_malformed_cursors_are_rejected(client, cursor):
+    response = client.get(f'/api/listings?cursor={cursor}')
+    assert response.status_code == 400
+    assert response.get_json() == {'error': 'Invalid cursor'}
@@ -0,0 +1,143 @@
+"""
+RentAssured Unread Counters
+Per-user unread notification and message counts kept on the users row, served from the cache
+"""
+
+from collections import defaultdict
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy import event, func
+from sqlalchemy.orm import Session
+
+from cache import cache
+from models_advanced import db, User, Message, Notification
+from model_signals import on_commit, old_value, track_old_values
+
+BADGES_TTL = 300
+
+# Model -> (recipient column, users counter column)
+COUNTED = {
+    Notification: ('user_id', 'unread_notifications'),
+    Message: ('receiver_id', 'unread_messages'),
+}
+KINDS = {'notifications': Notification, 'messages': Message}
+
+# The flush below subtracts exactly what a changed row used to add
+for _model, (_recipient, _) in COUNTED.items():
+    track_old_values(_model, _recipient, 'is_read')
+
+
+
+def _contribution(model, user_id, is_read):
+    """(user_id, counter column) an unread row adds one to"""
+    if user_id is None or is_read:
+        return None
+    return user_id, COUNTED[model][1]
+
+
+@event.listens_for(Session, 'before_flush')
+def _collect_old_unread(session, flush_context, instances):
+    """Remember which counters changed or deleted rows used to add to"""
+    deltas = defaultdict(int)
+    for instance in list(session.dirty) + list(session.deleted):
+        model = type(instance)
+        if model not in COUNTED:
+            continue
+        old = _contribution(model, old_value(instance, COUNTED[model][0]), old_value(instance, 'is_read'))
+        if old:
+            deltas[old] -= 1
+    session.info['unread_deltas'] = deltas
+
+
+@event.listens_for(Session, 'after_flush')
+def _apply_unread_deltas(session, flush_context):
+    """Fold this flush's notification and message changes into the users counters"""
+    deltas = session.info.pop('unread_deltas', None)
+    if deltas is None:
+        return
+    for instance in list(session.new) + list(session.dirty):
+        model = type(instance)
+        if model not in COUNTED or instance in session.deleted:
+            continue
+        new = _contribution(model, getattr(instance, COUNTED[model][0]), instance.is_read)
+        if new:
+            deltas[new] += 1
+
+    by_user = defaultdict(dict)
+    for (user_id, column), delta in deltas.items():
+        if delta:
+            by_user[user_id][column] = delta
+    if by_user:
+        apply_unread_deltas(session.connection(), by_user)
+
+
+def apply_unread_deltas(connection, by_user):
+    """Shift counters with relative UPDATEs; by_user is {user_id: {counter column: delta}}"""
+    users = User.__table__
+    for user_id, columns in sorted(by_user.items()):  # fixed order keeps concurrent writers from deadlocking
+        values = {column: _shifted(users.c[column], delta) for column, delta in columns.items()}
+        connection.execute(users.update().where(users.c.id == user_id).values(
+            updated_at=users.c.updated_at,  # a new notification is not a profile edit
+            **values
+        ))
+
+
+def _shifted(column, delta):
+    shifted = func.coalesce(column, 0) + delta
+    return db.case((shifted > 0, shifted), else_=0)
+
+
+def _badges_key(user_id):
+    return f'badges:{user_id}'
+
+
+def badges(user_id):
+    """{'notifications': n, 'messages': n} unread counts; one cache lookup when warm"""
+    def load():
+        row = db.session.query(User.unread_notifications, User.unread_messages).filter(User.id == user_id).first()
+        return {'notifications': (row and row[0]) or 0, 'messages': (row and row[1]) or 0}
+    return cache.get_or_set(_badges_key(user_id), load, current_app.config.get('BADGES_TTL', BADGES_TTL))
+
+
+def invalidate_badges(*user_ids):
+    cache.delete(*[_badges_key(user_id) for user_id in set(user_ids) if user_id])
+
+
+@on_commit(Notification, Message, snapshot=lambda row: getattr(row, COUNTED[type(row)][0]))
+def _unread_changed(changes):
+    invalidate_badges(*[user_id for _, user_id in changes])
+
+
+def mark_read(user_id, kind, ids=None):
+    """Mark a user's unread notifications or messages read in one UPDATE; returns the row count"""
+    model = KINDS[kind]
+    recipient, counter = COUNTED[model]
+    table = model.__table__
+    stmt = table.update().where(table.c[recipient] == user_id, table.c.is_read == db.false())
+    if ids is not None:
+        stmt = stmt.where(table.c.id.in_(ids))
+    marked = db.session.execute(stmt.values(is_read=True, read_at=datetime.utcnow())).rowcount
+    if marked:
+        apply_unread_deltas(db.session.connection(), {user_id: {counter: -marked}})
+    db.session.commit()
+    invalidate_badges(user_id)
+    return marked
+
+
+def reconcile_unread_update(low, high):
+    """Recompute both counters from the notifications and messages tables for a user id range"""
+    users = User.__table__
+
+    def unread(model):
+        recipient, _ = COUNTED[model]
+        table = model.__table__
+        return (db.select(func.count()).select_from(table)
+                .where(table.c[recipient] == users.c.id, table.c.is_read == db.false())
+                .scalar_subquery())
+
+    return users.update().where(users.c.id.between(low, high)).values(
+        unread_notifications=unread(Notification),
+        unread_messages=unread(Message),
+        updated_at=users.c.updated_at
+    )
@@ -0,0 +1,146 @@
+"""
+RentAssured View Counter
+Buffers listing page views in memory and writes them to views_count in batches
+"""
+
+import atexit
+import logging
+import threading
+from collections import Counter
+
+from sqlalchemy import case, func
+
+from metrics import view_flush_failures
+from models_advanced import db, Listing
+from process_local import ProcessLocal
+
+# Listings updated per UPDATE statement when flushing
+FLUSH_CHUNK_SIZE = 500
+
+logger = logging.getLogger(__name__)
+
+
+class ViewCounter:
+    """Coalesces view increments per listing and flushes them periodically
+
+    A page view only bumps a dict entry. A background thread turns the
+    buffered counts into one `UPDATE ... CASE` per chunk of listings, so hot
+    listings take one row write per flush instead of one per view. Reaching
+    `max_pending` listings wakes the flush early; if the database cannot keep
+    up, views of listings beyond twice that are dropped rather than letting
+    the buffer grow without bound. Counts still buffered when a worker is
+    killed without running its exit hooks are lost, which is acceptable for
+    a popularity counter.
+    """
+
+    def __init__(self, flush_interval=10, max_pending=5000):
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.app = None
+        self._pending = Counter()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopping = False
+        self._worker = ProcessLocal(self._start_worker)
+
+    def init_app(self, app):
+        self.app = app
+        self.flush_interval = app.config.get('VIEW_COUNTER_FLUSH_INTERVAL', self.flush_interval)
+        self.max_pending = app.config.get('VIEW_COUNTER_MAX_PENDING', self.max_pending)
+        app.extensions['view_counter'] = self
+        atexit.register(self.shutdown)
+
+    def record(self, listing_id, count=1):
+        """Count a view; never touches the database on the request path"""
+        self._worker.get()
+        with self._lock:
+            if listing_id not in self._pending and len(self._pending) >= 2 * self.max_pending:
+                return
+            self._pending[listing_id] += count
+            full = len(self._pending) >= self.max_pending
+        if full:
+            self._wake.set()
+
+    def pending(self):
+        """Copy of the counts not yet written to the database"""
+        with self._lock:
+            return dict(self._pending)
+
+    def _start_worker(self):
+        self._stopping = False
+        thread = threading.Thread(target=self._run, name='view-counter', daemon=True)
+        thread.start()
+        return thread
+
+    def _run(self):
+        while not self._stopping:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            if not self._stopping:
+                self.flush()
+
+    def flush(self):
+        """Write buffered counts; returns the number of listings updated"""
+        with self._flush_lock:
+            with self._lock:
+                counts, self._pending = self._pending, Counter()
+            if not counts or self.app is None:
+                return 0
+
+            listings = Listing.__table__
+            items = sorted(counts.items())  # fixed order keeps concurrent flushes from deadlocking
+            try:
+                with self.app.app_context(), db.engine.begin() as connection:
+                    for start in range(0, len(items), FLUSH_CHUNK_SIZE):
+                        chunk = dict(items[start:start + FLUSH_CHUNK_SIZE])
+                        connection.execute(
+                            listings.update()
+                            .where(listings.c.id.in_(list(chunk)))
+                            .values(
+                                views_count=func.coalesce(listings.c.views_count, 0)
+                                + case(chunk, value=listings.c.id, else_=0),
+                                updated_at=listings.c.updated_at  # a view is not a listing edit
+                            )
+                        )
+            except Exception:
+                view_flush_failures.inc()
+                logger.exception('View counter flush failed, keeping %d listings buffered', len(counts))
+                with self._lock:
+                    for listing_id, count in counts.items():
+                        if listing_id in self._pending or len(self._pending) < 2 * self.max_pending:
+                            self._pending[listing_id] += count
+                return 0
+            return len(counts)
+
+    def shutdown(self):
+        """Stop the background thread and write whatever is still buffered"""
+        self._stopping = True
+        self._wake.set()
+        self.flush()
+
+
+view_counter = ViewCounter()
+
+
+def top_viewed(limit=10):
+    """[(listing_id, views)] for the most viewed active listings, buffered views included
+
+    Candidates are the top listings by stored views_count plus the listings
+    with the most buffered views, so the ranking is exact for anything near
+    the top and only approximate between flushes further down.
+    """
+    pending = view_counter.pending()
+    stored = db.session.query(Listing.id, Listing.views_count).filter(
+        Listing.status == 'active'
+    ).order_by(Listing.views_count.desc(), Listing.id.desc()).limit(limit).all()
+
+    views = {listing_id: views_count or 0 for listing_id, views_count in stored}
+    hot = [listing_id for listing_id, _ in Counter(pending).most_common(limit) if listing_id not in views]
+    if hot:
+        views.update(db.session.query(Listing.id, Listing.views_count).filter(
+            Listing.id.in_(hot), Listing.status == 'active'
+        ))
+    ranked = sorted(((listing_id, (count or 0) + pending.get(listing_id, 0)) for listing_id, count in views.items()),
+                    key=lambda item: (-item[1], -item[0]))
+    return ranked[:limit]
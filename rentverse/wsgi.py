@@ -0,0 +1,10 @@
+"""
+RentAssured WSGI Entry Point
+Production application object, served with: gunicorn -c gunicorn.conf.py wsgi:app
+"""
+
+import os
+
+from app_advanced import create_app
+
+app = create_app(os.environ.get('FLASK_CONFIG', 'production'))